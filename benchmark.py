@@ -0,0 +1,290 @@
+# [2022] This is a library for Data Recorder.
+# Developer: Su Sengupta
+# Test: benchmark.py
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import contextlib
+import subprocess
+import itertools
+import time
+
+import data_recorder
+from data_handler import FormatHandler, UPLOAD_CHUNK_SIZE
+from data_recorder import SUPPORTED_FORMATS, SUPPORTED_RECORDS, search_entries, display_text, display_html
+from data_store import DBSession, SEARCH_MODES
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+# a result is a regression if it is THRESHOLD times slower than the baseline
+# and at least MIN_TIME seconds slower, so noise on tiny timings is ignored
+THRESHOLD = 1.25
+MIN_TIME = 0.01
+
+
+def iter_dataset(total_records, first_id=0):
+    '''
+    Yields synthetic employee records, eg. {"id": "43", "name": "Name 43", ...}
+    '''
+    for n_id in range(first_id, first_id + total_records):
+        yield {"id": str(n_id), "name": "Name %s" % n_id, "address": "%s Data Ave" % n_id, "phone": str(n_id * 7)}
+
+
+def create_dataset(file_path, file_format, total_records):
+    '''
+    Writes total_records synthetic records to a file of the format,
+    through the same writer as the downloads. The .yaml downloads are
+    a list that upload does not read, so .yaml datasets follow
+    examples/example.yaml instead.
+    '''
+    if file_format == "yaml":
+        with open(file_path, "w") as filehandler:
+            filehandler.write("data_records:\n")
+            for record in iter_dataset(total_records):
+                filehandler.write("  %s:\n" % json.dumps(record["id"]))
+                for field in SUPPORTED_RECORDS[1:]:
+                    filehandler.write("    %s: %s\n" % (field, json.dumps(record[field])))
+        return
+    with silenced():
+        FormatHandler(file_format, file_path, None, SUPPORTED_RECORDS).write_records(iter_dataset(total_records))
+
+
+@contextlib.contextmanager
+def silenced():
+    '''
+    Sends the messages printed by data recorder to /dev/null while timing.
+    '''
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def measure(operation, runs, setup=None):
+    '''
+    Runs operation runs times, after setup if given.
+
+    Parameters
+    ----------
+        operation(function): called with what setup returns, the only part timed
+        runs(int): number of runs
+        setup(function): prepares the arguments of a run, eg. a new db
+
+    Returns
+    -------
+    timings(list): wall time of each run in seconds
+    '''
+    timings = []
+    for run in range(runs):
+        args = setup() if setup else ()
+        with silenced():
+            start = time.perf_counter()
+            operation(*args)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def upload(file_format, file_path, db_path):
+    '''
+    Uploads a file the way the upload command does: in chunks of
+    UPLOAD_CHUNK_SIZE entries, committed by one session.
+    '''
+    session = DBSession(db_path, flush_size=UPLOAD_CHUNK_SIZE)
+    FormatHandler(file_format, file_path, db_path, SUPPORTED_RECORDS, session).upload()
+    session.commit()
+
+
+def run_benchmarks(work_dir, sizes, formats, db_ext, runs):
+    '''
+    Times upload, remove_duplicates, search, download, convert and
+    display for every size, in a fresh db of each size.
+
+    Returns
+    -------
+    results(dict): {"upload/csv/1000": {"records": 1000, "median": 0.05, "timings": [...]}, ...}
+    '''
+    results = {}
+
+    def record(name, total_records, timings):
+        results[name] = {"records": total_records, "median": statistics.median(timings), "timings": timings}
+        print ("%-28s %12.1f %14.0f" % (name, results[name]["median"] * 1000, total_records / max(results[name]["median"], 1e-9)))
+        sys.stdout.flush()
+
+    print ("%-28s %12s %14s" % ("benchmark", "median (ms)", "records/s"))
+    for total_records in sizes:
+        size_dir = os.path.join(work_dir, str(total_records))
+        os.mkdir(size_dir)
+        src_paths = {}
+        for file_format in formats:
+            src_paths[file_format] = os.path.join(size_dir, "data.%s" % file_format)
+            create_dataset(src_paths[file_format], file_format, total_records)
+
+        db_paths = []
+        def new_db(file_format):
+            db_paths.append(os.path.join(size_dir, "db-%s%s" % (len(db_paths), db_ext)))
+            return (file_format, src_paths[file_format], db_paths[-1])
+        for file_format in formats:
+            record("upload/%s/%s" % (file_format, total_records), total_records,
+                   measure(upload, runs, lambda: new_db(file_format)))
+        # the last db uploaded is the db of the other benchmarks
+        db_path = db_paths[-1]
+
+        data_entries = list(iter_dataset(total_records, total_records // 2))
+        existing_ids = set(str(n_id) for n_id in range(total_records))
+        handler = FormatHandler(None, None, db_path, SUPPORTED_RECORDS)
+        record("remove_duplicates/%s" % total_records, total_records,
+               measure(lambda: handler.remove_duplicates(existing_ids, data_entries), runs))
+        del data_entries, existing_ids
+
+        data_records = DBSession(db_path).pull_from_db().get("data_records")
+        search_value = str(total_records // 2)[:3]
+        for search_mode in SEARCH_MODES:
+            record("search/%s/%s" % (search_mode.replace(" ", "_"), total_records), total_records,
+                   measure(lambda: search_entries(data_records, search_value, "name", search_mode), runs))
+        del data_records
+
+        for file_format in formats:
+            dest_path = os.path.join(size_dir, "download.%s" % file_format)
+            record("download/%s/%s" % (file_format, total_records), total_records,
+                   measure(lambda: FormatHandler(file_format, dest_path, db_path, SUPPORTED_RECORDS).download(), runs))
+
+        for file_format, dest_format in zip(formats, itertools.islice(itertools.cycle(formats), 1, None)):
+            dest_path = os.path.join(size_dir, "convert.%s" % dest_format)
+            record("convert/%s-%s/%s" % (file_format, dest_format, total_records), total_records,
+                   measure(lambda: FormatHandler(file_format, src_paths[file_format], None, SUPPORTED_RECORDS).convert(
+                       FormatHandler(dest_format, dest_path, None, SUPPORTED_RECORDS)), runs))
+
+        # display html writes main.html to the working directory
+        cwd, main_db_path = os.getcwd(), data_recorder.DB_PATH
+        data_recorder.DB_PATH = db_path
+        try:
+            os.chdir(size_dir)
+            record("display/text/%s" % total_records, total_records, measure(lambda: display_text(DBSession(db_path)), runs))
+            record("display/html/%s" % total_records, total_records, measure(lambda: display_html(DBSession(db_path)), runs))
+        finally:
+            os.chdir(cwd)
+            # the db of this size is removed below, later callers get the db they had
+            data_recorder.DB_PATH = main_db_path
+        shutil.rmtree(size_dir)
+    return results
+
+
+def get_commit():
+    '''
+    Returns
+    -------
+    commit(str): git revision of the checkout being timed, None outside of git
+    '''
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def compare_results(baseline, current, threshold=THRESHOLD, min_time=MIN_TIME):
+    '''
+    Compares the medians of two result files, benchmarks missing
+    from either of them are skipped.
+
+    Parameters
+    ----------
+        baseline(dict): results of the older commit, as saved by --output
+        current(dict): results of the newer commit
+        threshold(float): ratio of the medians above which a benchmark regressed
+        min_time(float): seconds a benchmark has to be slower by to regress
+
+    Returns
+    -------
+    comparisons(list): (name, baseline median, current median, regressed) of each benchmark
+    '''
+    comparisons = []
+    for name, result in current.get("results", {}).items():
+        baseline_result = baseline.get("results", {}).get(name)
+        if baseline_result is None:
+            continue
+        old, new = baseline_result["median"], result["median"]
+        regressed = new > old * threshold and new - old > min_time
+        comparisons.append((name, old, new, regressed))
+    return comparisons
+
+
+def print_comparisons(comparisons, threshold):
+    '''
+    Prints the comparisons of compare_results().
+
+    Returns
+    -------
+    total_regressions(int): number of benchmarks that regressed
+    '''
+    print ("\n%-28s %12s %12s %8s" % ("benchmark", "base (ms)", "new (ms)", "ratio"))
+    for name, old, new, regressed in comparisons:
+        ratio = new / old if old else float("inf")
+        print ("%-28s %12.1f %12.1f %7.2fx%s" % (name, old * 1000, new * 1000, ratio, "  REGRESSION" if regressed else ""))
+    total_regressions = sum(1 for comparison in comparisons if comparison[3])
+    if total_regressions:
+        print ("%s benchmarks are more than %.2fx slower than the baseline." % (total_regressions, threshold))
+    else:
+        print ("No regressions against the baseline.")
+    return total_regressions
+
+
+def load_results(file_path):
+    with open(file_path) as filehandler:
+        return json.load(filehandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times upload, remove_duplicates, search, download, convert and display on synthetic datasets.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="numbers of records to time, up to 10000000 (default: %s)" % ",".join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument("--formats", default=",".join(SUPPORTED_FORMATS), help="formats of the datasets (default: %s)" % ",".join(SUPPORTED_FORMATS))
+    parser.add_argument("--db", default=".json", help="extension of the db the records are uploaded to, eg. .db (default: .json)")
+    parser.add_argument("--runs", type=int, default=3, help="runs of each benchmark, the median is kept (default: 3)")
+    parser.add_argument("--output", help="JSON file the results are saved to, eg. results-HEAD.json")
+    parser.add_argument("--baseline", help="JSON file of an older run to compare the results with")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "RESULTS"), help="only compare two saved JSON files")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="slowdown ratio that counts as a regression (default: %s)" % THRESHOLD)
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="seconds a benchmark has to slow down by to regress (default: %s)" % MIN_TIME)
+    args = parser.parse_args()
+
+    if args.compare:
+        comparisons = compare_results(load_results(args.compare[0]), load_results(args.compare[1]), args.threshold, args.min_time)
+        sys.exit(1 if print_comparisons(comparisons, args.threshold) else 0)
+
+    formats = args.formats.split(",")
+    unknown_formats = [file_format for file_format in formats if file_format not in SUPPORTED_FORMATS]
+    if unknown_formats:
+        parser.error("unsupported formats: %s" % ", ".join(unknown_formats))
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    work_dir = tempfile.mkdtemp(prefix="data_recorder_benchmark_")
+    try:
+        results = {
+            "commit": get_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "db": args.db,
+            "runs": args.runs,
+            "results": run_benchmarks(work_dir, sizes, formats, args.db, args.runs),
+        }
+    finally:
+        shutil.rmtree(work_dir)
+
+    if args.output:
+        with open(args.output, "w") as filehandler:
+            json.dump(results, filehandler, indent=4)
+        print ("Saved the results to: %s" % args.output)
+    if args.baseline:
+        comparisons = compare_results(load_results(args.baseline), results, args.threshold, args.min_time)
+        sys.exit(1 if print_comparisons(comparisons, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
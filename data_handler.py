@@ -2,17 +2,21 @@
 # Developer: Su Sengupta
 # Test: data_recorder_test.py
 
+# yaml, bs4 and the xml modules are slow to import, they are
+# imported by the methods of the formats that need them
 import json
 import csv
-import yaml
-from bs4 import BeautifulSoup
-import xml.etree.ElementTree as ET
 from colorama import Fore
 
 import os
-import argparse
+import io
 import re
-from collections import OrderedDict
+import itertools
+import textwrap
+import contextlib
+import collections
+
+from data_store import get_store, CorruptDBError, JSONStreamReader, READ_SIZE, ColumnarFile, write_columns, serialize_record
 
 SUPPORT_EMAIL_ALIAS = "data-recorder-help@gmail.com"
 FILE_OFFLINE_MSG = Fore.RED + "appears to be offline." + Fore.RESET
@@ -22,6 +26,18 @@ FORMAT_ERROR_MSG = Fore.RED + "ERROR: Please follow the right format for data up
 EMPTY_FILE_MSG = Fore.YELLOW + "WARNING: The file appears to be empty." + Fore.RESET
 MISSING_ID_MSG =  Fore.YELLOW + "WARNING: no ID specified, skipping this entry." + Fore.RESET
 
+UPLOAD_CHUNK_SIZE = 1000
+DOWNLOAD_CHUNK_SIZE = 1000
+VALIDATE_BATCH_SIZE = 1000
+# .csv files of at least this size are parsed in parallel, in chunks of about CSV_CHUNK_SIZE bytes
+CSV_PARALLEL_SIZE = 16 * 1024 * 1024
+CSV_CHUNK_SIZE = 4 * 1024 * 1024
+
+NON_DIGIT_PATTERN = re.compile(r"\D")
+SPAM_PATTERN = re.compile(r"[^a-zA-Z0-9 \n\.]")
+# same as SPAM_PATTERN for ascii text: every other byte becomes a space
+SPAM_TABLE = bytes(c if re.match(SPAM_PATTERN, chr(c)) is None else ord(' ') for c in range(256))
+
 class DataRecord:
     """
     Class for storing an entry in Data Recorder.
@@ -34,6 +50,7 @@ class DataRecord:
         address (str): Address of the employee
         phone (str): Phone number of the employee
     """
+    __slots__ = ("_id", "_name", "_address", "_phone")
 
     def __init__(self, n_id, name, address, phone):
         self._id = n_id
@@ -67,7 +84,8 @@ class DataRecord:
         return self._id
     
     def to_dict(self):
-        return self.format_dict(self.__dict__)
+        return self.format_dict({"_id": self._id, "_name": self._name,
+            "_address": self._address, "_phone": self._phone})
     
     def format_dict(self, data_record):
         formatted_data_record = {}
@@ -79,11 +97,220 @@ class DataRecord:
     
     def validate_entry(self):
         #  check for spam characters
-        self._id = re.sub("\D", "", str(self._id))
-        self._phone = re.sub("\D", "", str(self._phone))
-        self._name = re.sub('[^a-zA-Z0-9 \n\.]', ' ', self._name)
+        self._id = NON_DIGIT_PATTERN.sub("", str(self._id))
+        self._phone = NON_DIGIT_PATTERN.sub("", str(self._phone))
+        self._name = SPAM_PATTERN.sub(' ', self._name)
         self._name = ' '.join(self._name.split())
-        self._address = re.sub('[^a-zA-Z0-9 \n\.]', ' ', self._address)
+        self._address = SPAM_PATTERN.sub(' ', self._address)
+
+
+def keep_digits(value):
+    '''
+    Drops every character of the value that is not a digit.
+    '''
+    value = str(value)
+    if value.isdecimal():
+        return value
+    return NON_DIGIT_PATTERN.sub("", value)
+
+
+def remove_spam(value):
+    '''
+    Replaces every spam character of the value with a space.
+    '''
+    if isinstance(value, str) and value.isascii():
+        return value.encode("ascii").translate(SPAM_TABLE).decode("ascii")
+    return SPAM_PATTERN.sub(' ', value)
+
+
+def validate_batch(ids, names, addresses, phones):
+    '''
+    Validates a batch of entries given column by column, the same way
+    DataRecord does for a single entry, without creating an object
+    for every entry.
+
+    Parameters
+    ----------
+        ids (list): IDs of the employees
+        names (list): Names of the employees
+        addresses (list): Addresses of the employees
+        phones (list): Phone numbers of the employees
+
+    Returns
+    -------
+    data_records(list): the validated entries, same as DataRecord(...).to_dict()
+    '''
+    ids = [keep_digits(n_id) for n_id in ids]
+    phones = [keep_digits(phone) for phone in phones]
+    names = [' '.join(remove_spam(name).split()) for name in names]
+    addresses = [remove_spam(address).strip() for address in addresses]
+    return [{"id": n_id, "name": name, "address": address, "phone": phone}
+        for n_id, name, address, phone in zip(ids, names, addresses, phones)]
+
+
+def parse_file(file_path, supported_records):
+    '''
+    Reads and validates all the entries of one file. Runs in the worker
+    processes of upload_files(), so the messages that the file gives are
+    returned instead of printed.
+
+    Parameters
+    ----------
+        file_path(str): file path of the source file
+        supported_records(list): fields stored for each entry
+
+    Returns
+    -------
+    file_path(str): file path of the source file
+    data_entries(list): the validated entries
+    messages(str): warnings and errors printed while reading the file
+    '''
+    file_format = os.path.splitext(file_path)[1].split(".")[-1]
+    formathandler = FormatHandler(file_format, file_path, None, supported_records)
+    data_entries = []
+    messages = io.StringIO()
+    with contextlib.redirect_stdout(messages):
+        try:
+            for record in formathandler.read_records():
+                data_entries.append(record)
+        except formathandler.get_parse_errors():
+            # entries read before the corrupted part are kept, as upload() does
+            print (FILE_CORRUPT_MSG)
+    return file_path, data_entries, messages.getvalue()
+
+
+def upload_files(file_paths, db_path, supported_records, session=None, max_workers=None, delta=False):
+    '''
+    Uploads many files to db. The files are read and validated in parallel
+    by a pool of processes, and the entries of each file are pushed as soon
+    as it is read, in the order of file_paths, so only the files being read
+    are held in memory. The messages of every file are printed under its name.
+    A file whose worker fails is reported and skipped, the others are uploaded.
+
+    Parameters
+    ----------
+        file_paths(list): file paths of the source files
+        db_path(str): file path of the db
+        supported_records(list): fields stored for each entry
+        session(DBSession): session of the db, used instead of the store of db_path if given
+        max_workers(int): number of processes, the number of cores by default
+        delta(bool): update the records whose content changed instead of
+                     skipping the duplicate IDs, see FormatHandler
+
+    Returns
+    -------
+    total_added(int): number of entries pushed to db
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+    formathandler = FormatHandler(None, None, db_path, supported_records, session, delta)
+    total_added = 0
+    max_workers = min(max_workers or os.cpu_count() or 1, len(file_paths)) or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = collections.deque((file_path, executor.submit(parse_file, file_path, supported_records)) for file_path in file_paths)
+        while futures:
+            # a future holds the entries of its file until it is dropped
+            file_path, future = futures.popleft()
+            print ("Uploading data from: %s..." % file_path)
+            try:
+                data_entries, messages = future.result()[1:]
+            except Exception as e:
+                print (Fore.RED + "ERROR: [%s] could not be read and was skipped: %s" % (file_path, e or type(e).__name__) + Fore.RESET)
+                continue
+            print (messages, end="")
+            # the entries of the files before this one are already in the db or the session
+            total_added += formathandler.push_to_db(data_entries)
+            del data_entries, future
+    return total_added
+
+
+def get_csv_ranges(file_path, chunk_size=CSV_CHUNK_SIZE):
+    '''
+    Splits a .csv file into byte ranges of about chunk_size bytes that
+    start and end on a row boundary. A newline only ends a row if it is
+    outside of quotes, ie. the number of quotes before it is even, so a
+    quoted field with a newline in it is never split.
+
+    Parameters
+    ----------
+        file_path(str): file path of the .csv file
+        chunk_size(int): approximate size of a range in bytes
+
+    Returns
+    -------
+    header(list): fields of the header, None if the file is empty
+    ranges(list): (start, end) byte offsets of the ranges after the header
+    '''
+    boundaries = []
+    target = 0
+    position = 0
+    in_quotes = 0
+    with open(file_path, 'rb') as filehandler:
+        data = filehandler.read(READ_SIZE)
+        while data:
+            index = max(target - position, 0)
+            counted = 0
+            while True:
+                index = data.find(b"\n", index)
+                if index < 0:
+                    break
+                in_quotes ^= data.count(b'"', counted, index) & 1
+                counted = index
+                index += 1
+                if not in_quotes:
+                    boundaries.append(position + index)
+                    target = position + index + chunk_size
+                    index = max(target - position, index)
+            in_quotes ^= data.count(b'"', counted) & 1
+            position += len(data)
+            data = filehandler.read(READ_SIZE)
+
+        if boundaries and boundaries[-1] < position:
+            boundaries.append(position)
+        header_end = boundaries[0] if boundaries else position
+        filehandler.seek(0)
+        header = next(read_csv_rows(filehandler.read(header_end)), None)
+    return header, list(zip(boundaries, boundaries[1:]))
+
+
+def read_csv_rows(data):
+    '''
+    Returns a csv.reader over the bytes of some rows, decoded the
+    same way as a .csv file opened for reading.
+    '''
+    return csv.reader(io.TextIOWrapper(io.BytesIO(data)))
+
+
+def parse_csv_range(file_path, start, end):
+    '''
+    Reads and validates the rows of a byte range of a .csv file. Runs in
+    the worker processes of read_csv_records_parallel(), so the warnings
+    of the skipped rows are returned instead of printed.
+
+    Returns
+    -------
+    data_entries(list): the validated entries
+    messages(str): warnings printed while reading the rows
+    '''
+    formathandler = FormatHandler("csv", file_path)
+    with open(file_path, 'rb') as filehandler:
+        filehandler.seek(start)
+        data = filehandler.read(end - start)
+    messages = io.StringIO()
+    with contextlib.redirect_stdout(messages):
+        data_entries = list(formathandler.validate_entries(
+            filter(None, map(formathandler.get_csv_entry, read_csv_rows(data)))))
+    return data_entries, messages.getvalue()
+
+
+def strip_xml_declaration(data):
+    '''
+    Drops the xml declaration at the top of a document. The templates in
+    examples/ close it with ">" instead of "?>", which ElementTree rejects.
+    '''
+    stripped = data.lstrip("\ufeff \t\r\n")
+    if stripped.startswith("<?xml"):
+        return stripped[stripped.find(">") + 1:]
+    return data
 
 
 class FormatHandler:
@@ -95,14 +322,20 @@ class FormatHandler:
     ----------
         file_format (str): extension of the file uploaded/downloaded.
         file_path (str): file path of the file uploaded/downloaded.
-        db_path (str): Address of the employee
-        phone (str): Phone number of the employee
+        db_path (str): file path of the db, a .json file, an sqlite3 .db file or a .logdb folder
+        supported_records (list): fields stored for each entry
+        session (DBSession): session of the db created by main(), used
+                             instead of the store of db_path if given
+        delta (bool): upload only the entries that are new or changed, the
+                      records with the same ID are updated instead of skipped
     """
-    def __init__(self, file_format=None, file_path=None, db_path=None, supported_records=None):
+    def __init__(self, file_format=None, file_path=None, db_path=None, supported_records=None, session=None, delta=False):
         self._file_format = file_format
         self._file_path = file_path
         self._db_path = db_path
         self._supported_records = supported_records
+        self._store = session if session else get_store(db_path)
+        self._delta = delta
     
     def upload(self):
         '''
@@ -110,120 +343,269 @@ class FormatHandler:
         '''
         func_name = "self.upload_%s_data()" % (self._file_format)
         exec(func_name)
-    
+
     def push_to_db(self, data_entries):
         '''
         Pushes new data entries into db.
         By default, this uploads directly to a JSON file
         that is currently acting as a storage unit for
-        the data records.
+        the data records. A .db path stores them in sqlite3.
 
         Parameters
         ----------
             data_entries(dict): dictionary of new data
+
+        Returns
+        -------
+        total_added(int): number of entries pushed, after the duplicates and
+                          the entries past the capacity or quota are dropped
         '''
-        existing_data = {"data_records": []}
-        if not os.path.exists(self._db_path):
-            with open(self._db_path, 'w') as filehandler:
-                json.dump(existing_data, filehandler, indent=4)
-        else:
-            try:
-                with open(self._db_path) as filehandler:
-                    existing_data = json.load(filehandler)  or {"data_records": []}
-                    data_entries = self.remove_duplicates(existing_data, data_entries)
-            except json.decoder.JSONDecodeError:
-                print(DB_CORRUPT_MSG)
-
-        if existing_data.get("data_records") or data_entries:
-            existing_data.get("data_records").extend(data_entries)
-            with open(self._db_path, 'w') as filehandler:
-                json.dump(existing_data, filehandler, indent=4)
-        else:
-            print ("No data available for upload.")
+        if self._delta:
+            return self.upsert_to_db(data_entries)
+        try:
+            # other processes cannot add entries between the duplicate check and the write
+            with self._store.write_lock():
+                if not self._store.exists():
+                    self._store.create_db()
+                    data_entries = self.remove_duplicates(set(), data_entries)
+                else:
+                    data_entries = self.remove_duplicates(self.get_existing_ids(data_entries), data_entries)
+
+                free_slots = self._store.get_free_slots()
+                if free_slots is not None and len(data_entries) > free_slots:
+                    print (Fore.YELLOW + "WARNING: The capacity or quota of the DB is reached, [%s] entries will be skipped." % (len(data_entries) - free_slots) + Fore.RESET)
+                    data_entries = data_entries[:free_slots]
+                if data_entries:
+                    self._store.push_to_db(data_entries)
+                elif not self._store.get_DB_size():
+                    print ("No data available for upload.")
+            return len(data_entries)
+        except CorruptDBError:
+            print(DB_CORRUPT_MSG)
+        return 0
     
+    def upsert_to_db(self, data_entries):
+        '''
+        Pushes the entries of a delta upload: new IDs are added, records
+        whose content changed are updated and the others are left alone,
+        see upsert_entries() in data_store.py. Only the new IDs count
+        against the capacity or quota.
+
+        Returns
+        -------
+        total_upserted(int): number of entries passed on to the db
+        '''
+        try:
+            with self._store.write_lock():
+                self._store.create_db()
+                free_slots = self._store.get_free_slots()
+                if free_slots is not None:
+                    data_entries = self.limit_new_entries(self.get_existing_ids(data_entries), data_entries, free_slots)
+                if data_entries:
+                    self._store.upsert_entries(data_entries)
+            return len(data_entries)
+        except CorruptDBError:
+            print(DB_CORRUPT_MSG)
+        return 0
+
+    def get_existing_ids(self, data_entries):
+        '''
+        Returns
+        -------
+        existing_ids(set): IDs of the entries that are already in the db
+        '''
+        return self._store.get_existing_ids(str(entry.get("id")) for entry in data_entries)
+
+    def limit_new_entries(self, existing_ids, data_entries, free_slots):
+        '''
+        Drops the entries of the new IDs past the first free_slots ones,
+        the entries of existing IDs are all kept.
+        '''
+        kept_entries, new_ids, skipped_ids = [], set(), set()
+        for entry in data_entries:
+            n_id = str(entry.get("id"))
+            if n_id not in existing_ids and n_id not in new_ids:
+                if len(new_ids) >= free_slots:
+                    skipped_ids.add(n_id)
+                    continue
+                new_ids.add(n_id)
+            kept_entries.append(entry)
+        if skipped_ids:
+            print (Fore.YELLOW + "WARNING: The capacity or quota of the DB is reached, [%s] new entries will be skipped." % len(skipped_ids) + Fore.RESET)
+        return kept_entries
+
     def remove_duplicates(self, existing_data, data_entries):
         '''
         Checks for duplicate IDs in db and removes those
-        entries that conflict.
+        entries that conflict. Of the entries that repeat an
+        ID, only the first one is kept.
 
         Parameters
         ----------
-            existing_data(dict): data currently stored in db
+            existing_data(dict|set): data currently stored in db, or the set of
+                                     IDs of the entries already in the db, see get_existing_ids()
             data_entries(dict): new data being added into db
         '''
-        data_records = existing_data.get("data_records")
-        data_record_ids = []
-        # get all IDs, future idea - cache these somewhere?
-        for record in data_records:
-            data_record_ids.append(record.get("id"))
+        if isinstance(existing_data, dict):
+            data_record_ids = set(str(record.get("id")) for record in existing_data.get("data_records"))
+        else:
+            data_record_ids = existing_data
         new_data_entries = []
+        new_ids = set()
         for entry in data_entries:
-            if entry.get("id") not in data_record_ids:
+            n_id = str(entry.get("id"))
+            if n_id not in data_record_ids and n_id not in new_ids:
+                new_ids.add(n_id)
                 new_data_entries.append(entry)
             else:
                 print (Fore.YELLOW + "WARNING: Duplicate ID: [%s]. This entry will be skipped." % entry.get("id") + Fore.RESET)
         return new_data_entries
 
+    def push_in_chunks(self, data_entries, chunk_size=UPLOAD_CHUNK_SIZE):
+        '''
+        Pushes new data entries into db in chunks of a fixed size,
+        so only one chunk is held in memory at a time.
+
+        Parameters
+        ----------
+            data_entries(iterable): new data being added into db
+            chunk_size(int): number of entries pushed at a time
+        '''
+        chunk = []
+        for entry in data_entries:
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                self.push_to_db(chunk)
+                chunk = []
+        if chunk:
+            self.push_to_db(chunk)
+
     def upload_json_data(self):
         '''
         Uploads data from .json file to db.
+        If the file turns out to be corrupted, the chunks pushed
+        before the corrupted part are kept.
         '''
-        upload_entries = []
         try:
-            with open(self._file_path) as filehandler:
-                upload_data = json.load(filehandler)
-                upload_entries = upload_data.get("data_records")
+            self.push_in_chunks(self.read_json_records())
         except json.decoder.JSONDecodeError:
             print (FILE_CORRUPT_MSG)
-            return
-        if not upload_entries:
-            print (EMPTY_FILE_MSG)
-            return
 
-        data_entries = []
-        for entry in upload_entries:
-            if not entry.get("id"):
-                print (MISSING_ID_MSG + "%s" % entry)
-                continue
-            data_entry = self.get_data_record(entry.get("id"), entry.get("name"),
-                entry.get("address"), entry.get("phone")).to_dict()
-            data_entries.append(data_entry)
-        self.push_to_db(data_entries)
+    def read_json_records(self):
+        '''
+        Yields the validated entries of a .json file.
+        '''
+        return self.validate_entries(self.iter_json_entries())
+
+    def iter_json_entries(self):
+        '''
+        Reads the entries of a .json file one at a time and yields
+        their (id, name, address, phone) fields, not yet validated.
+        Raises json.decoder.JSONDecodeError if the file is corrupted.
+        '''
+        found_entries = False
+        with open(self._file_path) as filehandler:
+            for entry in JSONStreamReader(filehandler).iter_array("data_records"):
+                found_entries = True
+                if not entry.get("id"):
+                    print (MISSING_ID_MSG + "%s" % entry)
+                    continue
+                yield (entry.get("id"), entry.get("name"),
+                    entry.get("address"), entry.get("phone"))
+        if not found_entries:
+            print (EMPTY_FILE_MSG)
 
     def upload_csv_data(self):
         '''
         Uploads data from .csv file to db.
         '''
-        rows = []
-        upload_entries = []
-        try:
-            with open(self._file_path, 'r') as filehandler:
-                csvreader = csv.reader(filehandler)
-                header = next(csvreader)
-                for row in csvreader:
-                    rows.append(row)
-        except StopIteration:
-            print (EMPTY_FILE_MSG)
-            return
-        if not rows:
+        self.push_in_chunks(self.read_csv_records())
+
+    def read_csv_records(self):
+        '''
+        Yields the validated rows of a .csv file.
+        Large files are parsed in parallel when there are cores to spare,
+        but not inside the workers of upload_files().
+        '''
+        from multiprocessing import parent_process
+        if (os.path.getsize(self._file_path) >= CSV_PARALLEL_SIZE and (os.cpu_count() or 1) > 1
+                and parent_process() is None):
+            return self.read_csv_records_parallel()
+        return self.validate_entries(self.iter_csv_entries())
+
+    def read_csv_records_parallel(self, chunk_size=CSV_CHUNK_SIZE, max_workers=None):
+        '''
+        Yields the validated rows of a .csv file, which is split into chunks
+        of rows, see get_csv_ranges(). The chunks are parsed and validated by a
+        pool of processes and their rows and warnings are given back in order.
+        Only a few chunks are read ahead of the rows that are yielded.
+
+        Parameters
+        ----------
+            chunk_size(int): approximate size of a chunk in bytes
+            max_workers(int): number of processes, the number of cores by default
+        '''
+        from concurrent.futures import ProcessPoolExecutor
+        header, ranges = get_csv_ranges(self._file_path, chunk_size)
+        if header is None or not ranges:
             print (EMPTY_FILE_MSG)
             return
-
         if not self.validate_header(header):
             print (FORMAT_ERROR_MSG + "example.%s" % self._file_format)
             return
-        else:
-            for entry in rows:
-                try:
-                    if not entry[0].isnumeric():
-                        print (MISSING_ID_MSG + " %s" % entry)
-                        continue
-                    data_entry = self.get_data_record(entry[0], entry[1], entry[2], entry[3]).to_dict()
-                except IndexError:
-                    print (Fore.YELLOW + "WARNING: CSV entry %s is missing a field. Skipping it." % entry + Fore.RESET)
-                    continue
-                upload_entries.append(data_entry)
-            self.push_to_db(upload_entries)
+
+        max_workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            ranges = iter(ranges)
+            futures = collections.deque(executor.submit(parse_csv_range, self._file_path, start, end)
+                for start, end in itertools.islice(ranges, 2 * max_workers))
+            while futures:
+                data_entries, messages = futures.popleft().result()
+                for start, end in itertools.islice(ranges, 1):
+                    futures.append(executor.submit(parse_csv_range, self._file_path, start, end))
+                print (messages, end="")
+                yield from data_entries
+
+    def iter_csv_entries(self):
+        '''
+        Reads the rows of a .csv file one at a time and yields
+        their (id, name, address, phone) fields, not yet validated.
+        '''
+        with open(self._file_path, 'r') as filehandler:
+            csvreader = csv.reader(filehandler)
+            header = next(csvreader, None)
+            first_row = next(csvreader, None)
+            if header is None or first_row is None:
+                print (EMPTY_FILE_MSG)
+                return
+
+            if not self.validate_header(header):
+                print (FORMAT_ERROR_MSG + "example.%s" % self._file_format)
+                return
+            for entry in itertools.chain([first_row], csvreader):
+                data_entry = self.get_csv_entry(entry)
+                if data_entry:
+                    yield data_entry
+
+    def get_csv_entry(self, entry):
+        '''
+        Checks that a row of a .csv file has an ID and all the fields.
+
+        Parameters
+        ----------
+            entry(list): fields of the row
+
+        Returns
+        -------
+        data_entry(tuple): the (id, name, address, phone) fields, None if the row is skipped
+        '''
+        try:
+            if not entry[0].isnumeric():
+                print (MISSING_ID_MSG + " %s" % entry)
+                return
+            return (entry[0], entry[1], entry[2], entry[3])
+        except IndexError:
+            print (Fore.YELLOW + "WARNING: CSV entry %s is missing a field. Skipping it." % entry + Fore.RESET)
 
     def validate_header(self, header):
         '''
@@ -239,32 +621,153 @@ class FormatHandler:
         '''
         Uploads data from .yaml file to db.
         '''
-        upload_entries = []
-        with open (self._file_path, 'r') as filehandler:
-            try:
-                data = yaml.safe_load(filehandler)
-            except yaml.YAMLError as e:
-                print (FILE_CORRUPT_MSG)
-        if not data:
-            print (EMPTY_FILE_MSG)
-            return
+        import yaml
+        try:
+            self.push_in_chunks(self.read_yaml_records())
+        except yaml.YAMLError:
+            print (FILE_CORRUPT_MSG)
 
-        if not data.get("data_records"):
+    def read_yaml_records(self):
+        '''
+        Yields the validated entries of a .yaml file.
+        '''
+        return self.validate_entries(self.iter_yaml_entries())
+
+    def iter_yaml_entries(self):
+        '''
+        Reads the entries of a .yaml file one at a time and yields their
+        (id, name, address, phone) fields, not yet validated. Only the node of the current
+        entry is composed, the rest of the document is streamed.
+        Raises yaml.YAMLError if the file is corrupted.
+        '''
+        import yaml
+        found_entries = False
+        with open(self._file_path, 'r') as filehandler:
+            loader = yaml.SafeLoader(filehandler)
+            try:
+                loader.get_event() # stream start
+                if loader.check_event(yaml.StreamEndEvent):
+                    print (EMPTY_FILE_MSG)
+                    return
+                loader.get_event() # document start
+                if loader.check_event(yaml.ScalarEvent) and loader.peek_event().value == "":
+                    print (EMPTY_FILE_MSG)
+                    return
+                if loader.check_event(yaml.MappingStartEvent):
+                    loader.get_event()
+                    while not loader.check_event(yaml.MappingEndEvent):
+                        key = self.construct_yaml_node(loader)
+                        if key != "data_records" or not loader.check_event(yaml.MappingStartEvent):
+                            loader.compose_node(None, None)
+                            continue
+                        loader.get_event()
+                        while not loader.check_event(yaml.MappingEndEvent):
+                            n_id = self.construct_yaml_node(loader)
+                            entry = self.construct_yaml_node(loader)
+                            found_entries = True
+                            yield (n_id, entry.get('name'),
+                                entry.get('address'), entry.get('phone'))
+                        loader.get_event()
+            finally:
+                loader.dispose()
+        if not found_entries:
             print (FORMAT_ERROR_MSG + "example.%s" % self._file_format)
-        else:
-            data_records = data.get("data_records")
-            ordered_data_records = OrderedDict([(key, data_records[key]) for key in data_records])
-            for n_id, entry in ordered_data_records.items():
-                entry_dict = self.get_data_record(n_id, entry.get('name'),
-                    entry.get('address'), entry.get('phone')).to_dict()
-                upload_entries.append(entry_dict)
-            self.push_to_db(upload_entries)
+
+    def construct_yaml_node(self, loader):
+        '''
+        Composes the next node of a yaml stream and returns its value,
+        resolved the same way as yaml.safe_load would.
+        '''
+        node = loader.compose_node(None, None)
+        value = loader.construct_object(node, deep=True)
+        loader.constructed_objects = {}
+        return value
 
     def upload_xml_data(self):
         '''
         Uploads data from .xml file to db.
         '''
-        upload_entries = []
+        import xml.etree.ElementTree as ET
+        try:
+            self.push_in_chunks(self.read_xml_records())
+        except ET.ParseError:
+            print (FILE_CORRUPT_MSG)
+
+    def read_xml_records(self):
+        '''
+        Yields the validated <employee> elements of a .xml file.
+        '''
+        return self.validate_entries(self.iter_xml_entries())
+
+    def iter_xml_entries(self):
+        '''
+        Reads the <employee> elements of a .xml file one at a time and
+        yields their (id, name, address, phone) fields, not yet validated.
+        The file is streamed through expat, which hands over the attributes
+        of each element without building a tree.
+        Falls back to BeautifulSoup if the file cannot be parsed, and
+        raises ET.ParseError if that happens after entries were read.
+        '''
+        from xml.parsers import expat
+        parser = expat.ParserCreate()
+        elements = []
+        entries = []
+        found_records = False
+        found_entries = False
+
+        def start_element(tag, attrib):
+            nonlocal found_records
+            elements.append(attrib)
+            if tag == "data_records":
+                found_records = True
+
+        def end_element(tag):
+            attrib = elements.pop()
+            if tag == "employee" and found_records:
+                entries.append(attrib)
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parse_error = None
+        with open(self._file_path, 'r') as filehandler:
+            data = strip_xml_declaration(filehandler.read(READ_SIZE))
+            while True:
+                try:
+                    parser.Parse(data, not data)
+                except expat.ExpatError as e:
+                    parse_error = e
+                # the elements read before an error are still given
+                for entry in entries:
+                    found_entries = True
+                    if not entry.get("id"):
+                        print (MISSING_ID_MSG + " <employee %s/>" % " ".join('%s="%s"' % field for field in entry.items()))
+                        continue
+                    yield (entry.get('id'), entry.get('name'),
+                        entry.get('address'), entry.get('phone'))
+                entries.clear()
+                if parse_error or not data:
+                    break
+                data = filehandler.read(READ_SIZE)
+
+        if parse_error:
+            if found_entries:
+                import xml.etree.ElementTree as ET
+                raise ET.ParseError(str(parse_error))
+            yield from self.iter_xml_entries_soup()
+            return
+
+        if not found_records:
+            print (FORMAT_ERROR_MSG + "example.%s" % self._file_format)
+        elif not found_entries:
+            print (EMPTY_FILE_MSG)
+
+    def iter_xml_entries_soup(self):
+        '''
+        Reads the <employee> elements of a .xml file with BeautifulSoup,
+        which is more lenient with malformed files but needs the whole
+        file in memory.
+        '''
+        from bs4 import BeautifulSoup
         with open(self._file_path, 'r') as filehandler:
             data = filehandler.read()
         bs_data = BeautifulSoup(data, "xml")
@@ -280,10 +783,61 @@ class FormatHandler:
                 if not entry.get("id"):
                     print (MISSING_ID_MSG + " %s" % entry)
                     continue
-                entry_dict = self.get_data_record(entry.get('id'), entry.get('name'),
-                    entry.get('address'), entry.get('phone')).to_dict()
-                upload_entries.append(entry_dict)
-            self.push_to_db(upload_entries)
+                yield (entry.get('id'), entry.get('name'),
+                    entry.get('address'), entry.get('phone'))
+
+    def upload_drc_data(self):
+        '''
+        Uploads data from a columnar .drc file to db.
+        '''
+        try:
+            self.push_in_chunks(self.read_drc_records())
+        except CorruptDBError:
+            print (FILE_CORRUPT_MSG)
+
+    def read_drc_records(self):
+        '''
+        Yields the validated entries of a .drc file.
+        '''
+        return self.validate_entries(self.iter_drc_entries())
+
+    def iter_drc_entries(self):
+        '''
+        Reads the rows of a columnar .drc file one at a time and yields
+        their (id, name, address, phone) fields, not yet validated.
+        Raises CorruptDBError if the file is corrupted.
+        '''
+        columns_file = ColumnarFile(self._file_path)
+        if set(self._supported_records) - set(columns_file.get_fields()):
+            print (FORMAT_ERROR_MSG + "write_columns() in data_store.py")
+            return
+        if not columns_file.get_count():
+            print (EMPTY_FILE_MSG)
+            return
+        for entry in columns_file.iter_rows(self._supported_records):
+            if not entry[0]:
+                print (MISSING_ID_MSG + " %s" % (entry,))
+                continue
+            yield entry
+
+    def validate_entries(self, entries, batch_size=VALIDATE_BATCH_SIZE):
+        '''
+        Validates entries in batches and yields them one at a time.
+
+        Parameters
+        ----------
+            entries(iterable): (id, name, address, phone) fields of the entries
+            batch_size(int): number of entries validated together
+
+        Returns
+        -------
+        data_records(generator): the validated entries
+        '''
+        entries = iter(entries)
+        batch = list(itertools.islice(entries, batch_size))
+        while batch:
+            yield from validate_batch(*zip(*batch))
+            batch = list(itertools.islice(entries, batch_size))
     
     def get_data_record(self, n_id, name, address, phone):
         '''
@@ -313,60 +867,189 @@ class FormatHandler:
         that is currently acting as a storage unit for
         the data records.
         '''
+        existing_data = {"data_records": []}
         try:
-            with open(self._db_path) as filehandler:
-                existing_data = json.load(filehandler)
-        except json.decoder.JSONDecodeError:
+            existing_data = self._store.pull_from_db()
+        except CorruptDBError:
             print (DB_CORRUPT_MSG)
         if not existing_data or not existing_data.get("data_records"):
             print (Fore.YELLOW + "WARNING: DB is empty." + Fore.RESET)
         return existing_data
     
+    def iter_from_db(self):
+        '''
+        Yields the data records of the db one at a time,
+        so the whole db never needs to be held in memory.
+        '''
+        found_records = False
+        try:
+            for record in self._store.iter_records():
+                found_records = True
+                yield record
+        except CorruptDBError:
+            print (DB_CORRUPT_MSG)
+        if not found_records:
+            print (Fore.YELLOW + "WARNING: DB is empty." + Fore.RESET)
+
+    def read_records(self):
+        '''
+        Yields the validated entries of the file, whatever its format.
+        '''
+        return getattr(self, "read_%s_records" % self._file_format)()
+
+    def write_records(self, data_records):
+        '''
+        Writes data records to the file, whatever its format.
+
+        Parameters
+        ----------
+            data_records(iterable): records to write, eg. from read_records()
+        '''
+        getattr(self, "write_%s_records" % self._file_format)(data_records)
+
+    def convert(self, dest_handler):
+        '''
+        Converts the file of this handler straight into the file of
+        another handler. Records are validated and written one at a time,
+        the db is not involved.
+
+        Parameters
+        ----------
+            dest_handler(FormatHandler): handler of the destination file
+        '''
+        try:
+            dest_handler.write_records(self.read_records())
+        except self.get_parse_errors():
+            print (FILE_CORRUPT_MSG)
+
+    def get_parse_errors(self):
+        '''
+        Returns
+        -------
+        errors(tuple): exceptions raised when a file of this format is corrupted
+        '''
+        if self._file_format == "yaml":
+            import yaml
+            return (yaml.YAMLError,)
+        if self._file_format == "xml":
+            import xml.etree.ElementTree as ET
+            return (ET.ParseError,)
+        if self._file_format == "drc":
+            return (CorruptDBError,)
+        return (json.decoder.JSONDecodeError,)
+
     def download_json_data(self):
         '''
         Downloads data from db to .json file.
         '''
-        data_records = self.pull_from_db()
-        with open(self._file_path, 'w', encoding='utf-8') as f:
-            json.dump(data_records, f, ensure_ascii=False, indent=4)
+        self.write_json_records(self.iter_from_db())
+
+    def write_json_records(self, data_records):
+        '''
+        Writes data records to a .json file. Gives the same layout
+        as json.dump(..., indent=4), one record at a time.
+        '''
+        with open(self._file_path, 'w', encoding='utf-8') as filehandler:
+            filehandler.write('{\n    "data_records": [')
+            separator = "\n"
+            for record in data_records:
+                filehandler.write(separator + textwrap.indent(json.dumps(record, ensure_ascii=False, indent=4, default=serialize_record), " " * 8))
+                separator = ",\n"
+            filehandler.write("]\n}" if separator == "\n" else "\n    ]\n}")
     
     def download_csv_data(self):
         '''
         Downloads data from db to .csv file.
         '''
+        self.write_csv_records(self.iter_from_db())
+
+    def write_csv_records(self, data_records):
+        '''
+        Writes data records to a .csv file, one row at a time.
+        '''
         header = self._supported_records
-        data_records = self.pull_from_db().get("data_records")
-        csv_data_records = []
-        for record in data_records:
-            csv_data_records.append(list(record.values()))
         with open(self._file_path, 'w', encoding='UTF8', newline='') as filehandler:
             writer = csv.writer(filehandler)
             writer.writerow(header)
-            writer.writerows(csv_data_records)
+            for record in data_records:
+                writer.writerow(list(record.values()))
     
     def download_yaml_data(self):
         '''
         Downloads data from db to .yaml file.
         '''
-        data_records = self.pull_from_db().get("data_records")
-        yaml_data_records = []
-        for record in data_records:
-            yaml_entry = {}
-            for field in self._supported_records[1:]:
-                yaml_entry[field]  = record.get(field)
-            yaml_data_records.append({record.get("id"): yaml_entry})
-        yaml_final_data = [{"data_records": yaml_data_records}]
+        self.write_yaml_records(self.iter_from_db())
+
+    def write_yaml_records(self, data_records):
+        '''
+        Writes data records to a .yaml file. Records are dumped in chunks,
+        which gives the same output as dumping the whole list at once.
+        '''
+        import yaml
         with open(self._file_path, 'w') as filehandler:
-            yaml.dump(yaml_final_data, filehandler)
+            chunk = []
+            started = False
+            for record in data_records:
+                yaml_entry = {}
+                for field in self._supported_records[1:]:
+                    yaml_entry[field]  = record.get(field)
+                chunk.append({record.get("id"): yaml_entry})
+                if len(chunk) >= DOWNLOAD_CHUNK_SIZE:
+                    self.write_yaml_chunk(filehandler, chunk, started)
+                    chunk = []
+                    started = True
+            if chunk:
+                self.write_yaml_chunk(filehandler, chunk, started)
+            elif not started:
+                yaml.dump([{"data_records": []}], filehandler)
+
+    def write_yaml_chunk(self, filehandler, chunk, started):
+        '''
+        Writes a chunk of records as items of the data_records list.
+
+        Parameters
+        ----------
+            filehandler(file): the open .yaml file
+            chunk(list): records to write, eg. [{"43": {"name": ...}}]
+            started(bool): False for the first chunk of the file
+        '''
+        import yaml
+        if not started:
+            filehandler.write("- data_records:\n")
+        # the items end up nested two columns deeper, keep the line width the same
+        yaml_data = yaml.dump(chunk, width=78)
+        filehandler.write(textwrap.indent(yaml_data, "  "))
     
+    def download_drc_data(self):
+        '''
+        Downloads data from db to a columnar .drc file.
+        '''
+        self.write_drc_records(self.iter_from_db())
+
+    def write_drc_records(self, data_records):
+        '''
+        Writes data records to a columnar .drc file, see write_columns().
+        '''
+        write_columns(self._file_path, data_records, self._supported_records)
+
     def download_xml_data(self):
         '''
         Downloads data from db to .xml file.
         '''
-        data_records = self.pull_from_db().get("data_records")
-        data = ET.Element('data_records')
-        for record in data_records:
-            item = ET.SubElement(data, 'employee', attrib=record)
-        xml_data = ET.tostring(data)
-        filehandler = open(self._file_path, "wb")
-        filehandler.write(xml_data)
\ No newline at end of file
+        self.write_xml_records(self.iter_from_db())
+
+    def write_xml_records(self, data_records):
+        '''
+        Writes data records to a .xml file, one <employee> at a time.
+        '''
+        from xml.sax.saxutils import XMLGenerator
+        with open(self._file_path, 'w', encoding='utf-8') as filehandler:
+            generator = XMLGenerator(filehandler, encoding='utf-8', short_empty_elements=True)
+            generator.startDocument()
+            generator.startElement('data_records', {})
+            for record in data_records:
+                generator.ignorableWhitespace("\n    ")
+                generator.startElement('employee', dict((key, str(value)) for key, value in record.items()))
+                generator.endElement('employee')
+            generator.ignorableWhitespace("\n")
+            generator.endElement('data_records')
@@ -1,11 +1,16 @@
 import unittest
 import filecmp
 import os
-from data_handler import DataRecord, FormatHandler
+import io
+import contextlib
+import data_store
+from data_handler import DataRecord, FormatHandler, JSONStreamReader, validate_batch, upload_files, get_csv_ranges
 
 TEST_DB_PATH = "test_cases/test_db.json"
 TEST_UPLOAD_PATH = "test_cases/test_upload.json"
 SUPPORTED_RECORDS = ["id", "name", "address", "phone"]
+# files the stores keep next to a db: ID index, search index, hashes and write lock
+SIDECAR_SUFFIXES = [".ids", ".search", ".hashes", ".lock"]
 
 class TestDataRecord(unittest.TestCase):
     def test_normal_data_record(self):
@@ -29,7 +34,21 @@ class TestDataRecord(unittest.TestCase):
         self.assertEqual(data_record.get_address(), "23 Vampire Ave  NY 12512  238768")
         self.assertEqual(data_record.get_phone(), "66666666")
 
+    def test_validate_batch(self):
+        entries = [("1", "Anne Rice", "23 Vampire Ave NY 12512", "66666666"),
+                   ("1hdsg", "Anne-^ Rice", "23 Vampire Ave, NY-12512", "dgj66666666dgjf"),
+                   ("1hdsg^&", "Anne2*", "23 Vampire Ave, NY-12512, 238768", "dgj66666666dgjf"),
+                   (7, " Ann\u00e9 \u00d6 ", " caf\u00e9 \u0661 ", "\u0661\u0662-3")]
+        data_records = [DataRecord(*entry).to_dict() for entry in entries]
+        self.assertEqual(validate_batch(*zip(*entries)), data_records)
+
 class TestFormatHandler(unittest.TestCase):
+    def tearDown(self):
+        for db_path in [TEST_DB_PATH, "test_cases/test_case_1.json"]:
+            for suffix in SIDECAR_SUFFIXES:
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
     def test_push_to_db(self):
         data_entries = [{"id": 1, "name": "Anne Rice", "address": "23 Vampire Ave NY 12512", "phone": "66666666"},
                         {"id": 56, "name": "Becky", "address": "Block 25 LA 1728126", "phone": "36553232"},
@@ -60,6 +79,19 @@ class TestFormatHandler(unittest.TestCase):
         format_handler = FormatHandler()
         test_result_entries = format_handler.remove_duplicates(existing_data, data_entries)
         self.assertEqual(unique_entries, test_result_entries)
+
+    def test_remove_duplicates_with_ids(self):
+        existing_ids = {"1", "56", "43"}
+        data_entries = [{"id": "33", "name": "Mary Kate", "address": "22 Twins Ave NY 222222", "phone": "2222222229"},
+                        {"id": "56", "name": "Becky Sue", "address": "Block 25 LA 1728126", "phone": "265325232"},
+                        {"id": "33", "name": "Mary Ann", "address": "22 Twins Ave NY 222222", "phone": "2222222228"}]
+        format_handler = FormatHandler()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            test_result_entries = format_handler.remove_duplicates(existing_ids, data_entries)
+        # the first entry of a repeated ID is kept
+        self.assertEqual(data_entries[:1], test_result_entries)
+        self.assertIn("Duplicate ID: [33]", output.getvalue())
     
     def test_json_upload(self):
         test_file_path = "test_cases/test_data.json"
@@ -113,6 +145,129 @@ class TestFormatHandler(unittest.TestCase):
         format_handler.upload_xml_data()
         self.assertEqual(filecmp.cmp(TEST_DB_PATH, TEST_UPLOAD_PATH), True)
     
+    def test_chunked_upload(self):
+        # clear any old db data to test
+        if os.path.exists(TEST_DB_PATH):
+            os.remove(TEST_DB_PATH)
+
+        format_handler = FormatHandler("csv", "test_cases/test_data.csv", TEST_DB_PATH, SUPPORTED_RECORDS)
+        format_handler.push_in_chunks(format_handler.read_csv_records(), chunk_size=1)
+        self.assertEqual(filecmp.cmp(TEST_DB_PATH, TEST_UPLOAD_PATH), True)
+
+    def test_upload_files(self):
+        # clear any old db data to test
+        if os.path.exists(TEST_DB_PATH):
+            os.remove(TEST_DB_PATH)
+
+        file_paths = ["test_cases/test_data.csv", "test_cases/test_data.json", "test_cases/test_data.xml", "test_cases/test_data.yaml"]
+        messages = io.StringIO()
+        with contextlib.redirect_stdout(messages):
+            total_added = upload_files(file_paths, TEST_DB_PATH, SUPPORTED_RECORDS, max_workers=2)
+        self.assertEqual(total_added, 2)
+        self.assertEqual(filecmp.cmp(TEST_DB_PATH, TEST_UPLOAD_PATH), True)
+        # the files hold the same entries, the duplicates are reported under each later file
+        reports = messages.getvalue().split("Uploading data from: ")[1:]
+        self.assertEqual([report.splitlines()[0] for report in reports], [file_path + "..." for file_path in file_paths])
+        self.assertEqual([report.count("Duplicate ID") for report in reports], [0, 2, 2, 2])
+
+        # a file whose worker fails is reported on its own, the other files are still uploaded
+        os.remove(TEST_DB_PATH)
+        messages = io.StringIO()
+        with contextlib.redirect_stdout(messages):
+            total_added = upload_files(["test_cases/test_missing.csv", "test_cases/test_data.csv"], TEST_DB_PATH, SUPPORTED_RECORDS, max_workers=2)
+        self.assertEqual(total_added, 2)
+        self.assertIn("[test_cases/test_missing.csv] could not be read", messages.getvalue())
+
+    def test_parallel_csv_upload(self):
+        test_file_path = "test_cases/test_parallel.csv"
+        rows = ["id,name,address,phone", '43,"John\nSmith","123 Highgate Grove, ""Singapore""",34323434', "",
+                "x,No Id,Nowhere,1", "23,Bugs Bunny", '7,Anne-^ Rice,"23 Vampire Ave\nNY",666']
+        with open(test_file_path, "w") as filehandler:
+            filehandler.write("\n".join(rows * 20))
+        format_handler = FormatHandler("csv", test_file_path, TEST_DB_PATH, SUPPORTED_RECORDS)
+        try:
+            header, ranges = get_csv_ranges(test_file_path, chunk_size=10)
+            self.assertEqual(header, SUPPORTED_RECORDS)
+            self.assertGreater(len(ranges), 20)
+            # quoted newlines never end a range, so the ranges give the same rows and warnings
+            serial = io.StringIO()
+            with contextlib.redirect_stdout(serial):
+                data_entries = list(format_handler.validate_entries(format_handler.iter_csv_entries()))
+            parallel = io.StringIO()
+            with contextlib.redirect_stdout(parallel):
+                self.assertEqual(list(format_handler.read_csv_records_parallel(chunk_size=10, max_workers=2)), data_entries)
+            self.assertEqual(parallel.getvalue(), serial.getvalue())
+        finally:
+            os.remove(test_file_path)
+
+    def test_xml_entries(self):
+        test_file_path = "test_cases/test_entries.xml"
+        format_handler = FormatHandler("xml", test_file_path, TEST_DB_PATH, SUPPORTED_RECORDS)
+        try:
+            with open(test_file_path, "w") as filehandler:
+                filehandler.write('<?xml version="1.0" encoding="utf-8">\n<data_records>\n'
+                                  '    <employee name="No Id"/>\n    <employee id="7" name="Anne &amp; Rice" phone="666"/>\n</data_records>')
+            messages = io.StringIO()
+            with contextlib.redirect_stdout(messages):
+                self.assertEqual(list(format_handler.iter_xml_entries()), [("7", "Anne & Rice", None, "666")])
+            self.assertIn('<employee name="No Id"/>', messages.getvalue())
+            # a malformed file is read with BeautifulSoup instead
+            with open(test_file_path, "w") as filehandler:
+                filehandler.write('<data_records><employee id="7" name="Anne"></data_records>')
+            self.assertEqual(list(format_handler.iter_xml_entries()), [("7", "Anne", None, None)])
+        finally:
+            os.remove(test_file_path)
+
+    def test_drc_upload_download(self):
+        test_file_path = "test_cases/test_download.drc"
+        # clear any old db data to test
+        if os.path.exists(TEST_DB_PATH):
+            os.remove(TEST_DB_PATH)
+        try:
+            FormatHandler("csv", "test_cases/test_data.csv", TEST_DB_PATH, SUPPORTED_RECORDS).upload_csv_data()
+            FormatHandler("drc", test_file_path, TEST_DB_PATH, SUPPORTED_RECORDS).download_drc_data()
+            os.remove(TEST_DB_PATH)
+            FormatHandler("drc", test_file_path, TEST_DB_PATH, SUPPORTED_RECORDS).upload_drc_data()
+            self.assertEqual(filecmp.cmp(TEST_DB_PATH, TEST_UPLOAD_PATH), True)
+        finally:
+            os.remove(test_file_path)
+
+    def test_json_stream_reader(self):
+        json_data = '{"meta": {"tags": ["a", "]"]}, "data_records": [{"id": "1", "name": "A \\"B\\""}, {"id": 2}], "count": 2}'
+        read_size = data_store.READ_SIZE
+        data_store.READ_SIZE = 3 # entries span several blocks
+        try:
+            entries = list(JSONStreamReader(io.StringIO(json_data)).iter_array("data_records"))
+        finally:
+            data_store.READ_SIZE = read_size
+        self.assertEqual(entries, [{"id": "1", "name": 'A "B"'}, {"id": 2}])
+
+    def test_streaming_json_download(self):
+        download_path = "test_cases/test_stream_download.json"
+        format_handler = FormatHandler("json", download_path, "test_cases/test_db.json", SUPPORTED_RECORDS)
+        format_handler.download_json_data()
+        # same layout as json.dump(..., indent=4) of the whole db
+        self.assertEqual(filecmp.cmp(download_path, "test_cases/test_db.json"), True)
+        os.remove(download_path)
+
+    def test_streaming_xml_download(self):
+        download_path = "test_cases/test_stream_download.xml"
+        format_handler = FormatHandler("xml", download_path, "test_cases/test_db.json", SUPPORTED_RECORDS)
+        format_handler.download_xml_data()
+        entries = list(FormatHandler("xml", download_path, None, SUPPORTED_RECORDS).read_xml_records())
+        self.assertEqual(entries, format_handler.pull_from_db().get("data_records"))
+        os.remove(download_path)
+
+    def test_convert(self):
+        convert_path = "test_cases/test_convert.json"
+        for test_file_path in ["test_cases/test_data.csv", "test_cases/test_data.yaml", "test_cases/test_data.xml"]:
+            test_name, test_ext = os.path.splitext(test_file_path)
+            test_ext = test_ext.split(".")[-1] # remove '.' from extension
+            src_handler = FormatHandler(test_ext, test_file_path, None, SUPPORTED_RECORDS)
+            src_handler.convert(FormatHandler("json", convert_path, None, SUPPORTED_RECORDS))
+            self.assertEqual(filecmp.cmp(convert_path, TEST_UPLOAD_PATH), True)
+        os.remove(convert_path)
+
     def test_json_download(self):
         format_handler = FormatHandler("json", "test_cases/test_download.json", TEST_DB_PATH, SUPPORTED_RECORDS)
         format_handler.download_json_data()
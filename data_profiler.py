@@ -0,0 +1,330 @@
+# [2022] This is a library for Data Recorder.
+# Developer: Su Sengupta
+# Test: data_profiler_tests.py
+
+import os
+import sys
+import json
+import time
+import inspect
+import functools
+import threading
+
+try:
+    import resource
+except ImportError: # not available on windows
+    resource = None
+
+# most events written to a Chrome trace, the stages are still timed past that
+MAX_TRACE_EVENTS = 200000
+
+# stages timed by instrument(), only the ones a class defines itself are wrapped
+HANDLER_STAGES = ["push_in_chunks", "validate_entries", "remove_duplicates", "push_to_db", "upsert_to_db",
+                  "iter_from_db", "pull_from_db", "read_csv_records_parallel", "convert"]
+STORE_STAGES = ["pull_from_db", "iter_records", "push_to_db", "write_db", "commit", "validate",
+                "get_ids", "load_ids", "index_entries", "load_search_index", "index_search",
+                "get_search_candidates", "get_records", "get_record", "get_DB_size", "compact",
+                "get_hashes", "upsert_entries", "update_records", "get_records_at", "get_existing_ids"]
+RECORD_STAGES = ["validate_entry"]
+HANDLER_HELPERS = ["validate_batch"]
+RECORDER_HELPERS = ["push_to_db", "pull_from_db", "is_duplicate", "get_DB_size", "get_free_slots",
+                    "add_data_entries", "search_entries", "create_db", "upload_files"]
+
+
+class Profiler:
+    """
+    Times the stages of a command, eg. parsing, validation, remove_duplicates
+    and the writes of the db. A stage is a wrapped function or generator,
+    see instrument(). The self time of a stage leaves out the stages
+    it calls, so the self times of all the stages add up to the command.
+
+    Attributes
+    ----------
+        command (str): name of the command being timed, the root stage
+        trace (bool): keep an event for every stage call, for write_chrome_trace()
+    """
+    def __init__(self, command, trace=False):
+        self._command = command
+        self._trace = trace
+        self._stages = {}
+        self._events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._patched = []
+        self._start = time.perf_counter()
+        self._elapsed = None
+        self._io_start = read_io_counters()
+        self._io = None
+        self.enter(command)
+
+    def get_stack(self):
+        '''
+        Returns
+        -------
+        stack(list): [name, start, time spent in called stages] of each
+                     running stage of this thread
+        '''
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def enter(self, name):
+        self.get_stack().append([name, time.perf_counter(), 0.0])
+
+    def exit(self, calls=1, records=0, trace=True):
+        '''
+        Ends the running stage of this thread.
+
+        Parameters
+        ----------
+            calls(int): calls of the stage to count
+            records(int): records the stage went through
+            trace(bool): keep an event of this call for the Chrome trace
+
+        Returns
+        -------
+        start(float), elapsed(float): when the stage started and how long it ran, in seconds
+        '''
+        stack = self.get_stack()
+        name, start, called = stack.pop()
+        elapsed = time.perf_counter() - start
+        if stack:
+            stack[-1][2] += elapsed
+        with self._lock:
+            stage = self._stages.setdefault(name, {"calls": 0, "records": 0, "total": 0.0, "self": 0.0})
+            stage["calls"] += calls
+            stage["records"] += records
+            stage["total"] += elapsed
+            stage["self"] += elapsed - called
+        if trace:
+            self.add_event(name, start, elapsed, records)
+        return start, elapsed
+
+    def add_event(self, name, start, elapsed, records):
+        if not self._trace or len(self._events) >= MAX_TRACE_EVENTS:
+            return
+        self._events.append({"name": name, "cat": "stage", "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                             "ts": round((start - self._start) * 1e6, 1), "dur": round(elapsed * 1e6, 1), "args": {"records": records}})
+
+    def wrap(self, owner, attribute, name=None):
+        '''
+        Replaces a function of a module or class by one that times it as a stage.
+        Generators are timed each time they are resumed and count the records
+        they yield, functions count the records of their first list argument.
+
+        Parameters
+        ----------
+            owner(module|class): where the function is defined
+            attribute(str): name of the function, eg. 'push_to_db'
+            name(str): name of the stage, eg. 'JSONStore.push_to_db' by default
+        '''
+        function = inspect.getattr_static(owner, attribute)
+        if isinstance(function, (staticmethod, classmethod)) or not callable(function):
+            return
+        name = name or "%s.%s" % (getattr(owner, "__name__", owner), attribute)
+        profiler = self
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                return profiler.iter_stage(name, function(*args, **kwargs))
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                profiler.enter(name)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    profiler.exit(records=count_records(args))
+        self._patched.append((owner, attribute, function))
+        setattr(owner, attribute, wrapper)
+
+    def iter_stage(self, name, iterator):
+        '''
+        Yields from a generator and times it as a stage, one event covers
+        the generator from its first record to its last.
+        '''
+        records = 0
+        first_start = None
+        try:
+            while True:
+                self.enter(name)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    start, elapsed = self.exit(calls=0 if first_start else 1, records=0, trace=False)
+                    first_start = first_start or start
+                records += 1
+                with self._lock:
+                    self._stages[name]["records"] += 1
+                yield item
+        finally:
+            iterator.close()
+            if first_start is not None:
+                self.add_event(name, first_start, time.perf_counter() - first_start, records)
+
+    def restore(self):
+        '''
+        Puts back the functions replaced by wrap().
+        '''
+        for owner, attribute, function in reversed(self._patched):
+            setattr(owner, attribute, function)
+        self._patched = []
+
+    def stop(self):
+        '''
+        Ends the command, the stages of other threads that are
+        still running are left out.
+        '''
+        if self._elapsed is None:
+            stack = self.get_stack()
+            while len(stack) > 1:
+                self.exit()
+            self._elapsed = self.exit()[1]
+            self._io = read_io_counters()
+            self.restore()
+
+    def get_stages(self):
+        '''
+        Returns
+        -------
+        stages(list): (name, calls, records, self time, total time) of each
+                      stage, from the slowest self time
+        '''
+        return sorted(((name, stage["calls"], stage["records"], stage["self"], stage["total"])
+                       for name, stage in self._stages.items()), key=lambda stage: -stage[3])
+
+    def get_summary(self):
+        '''
+        Returns
+        -------
+        summary(dict): elapsed seconds, bytes read and written by the process and
+                       its peak memory in bytes, None for what the OS does not report
+        '''
+        read_bytes = written_bytes = None
+        if self._io_start and self._io:
+            read_bytes = self._io[0] - self._io_start[0]
+            written_bytes = self._io[1] - self._io_start[1]
+        return {"command": self._command, "elapsed": self._elapsed, "read_bytes": read_bytes,
+                "written_bytes": written_bytes, "peak_memory": get_peak_memory()}
+
+    def print_timings(self, stream=None):
+        '''
+        Prints the stages of the command, by default to stderr so
+        the --output json of a command stays clean.
+        '''
+        stream = stream or sys.stderr
+        summary = self.get_summary()
+        print ("\nTimings of %s: %.1f ms, read %s, written %s, peak memory %s" % (
+            summary["command"], summary["elapsed"] * 1000, format_bytes(summary["read_bytes"]),
+            format_bytes(summary["written_bytes"]), format_bytes(summary["peak_memory"])), file=stream)
+        print ("%-40s %8s %10s %11s %11s %7s" % ("stage", "calls", "records", "self (ms)", "total (ms)", "self %"), file=stream)
+        for name, calls, records, self_time, total_time in self.get_stages():
+            print ("%-40s %8s %10s %11.1f %11.1f %6.1f%%" % (name, calls, records, self_time * 1000, total_time * 1000,
+                   self_time * 100 / summary["elapsed"] if summary["elapsed"] else 0), file=stream)
+
+    def write_chrome_trace(self, file_path):
+        '''
+        Writes the stage events to a file that chrome://tracing or
+        https://ui.perfetto.dev can open, with the summary as metadata.
+        '''
+        summary = self.get_summary()
+        with open(file_path, "w") as filehandler:
+            json.dump({"traceEvents": self._events, "displayTimeUnit": "ms",
+                       "otherData": dict((key, value) for key, value in summary.items() if value is not None)}, filehandler)
+
+
+def instrument(profiler, recorder_module=None):
+    '''
+    Wraps the FormatHandler methods, the stores, the session and the
+    module level DB helpers of data_handler and data_recorder as stages.
+
+    Parameters
+    ----------
+        profiler(Profiler): profiler timing the stages
+        recorder_module(module): the data_recorder module, eg. __main__ when it is run as a script
+    '''
+    import data_handler
+    import data_store
+    handler = data_handler.FormatHandler
+    for attribute in sorted(vars(handler)):
+        if attribute in HANDLER_STAGES or (attribute.startswith("iter_") and attribute.endswith("_entries")) or \
+            (attribute.startswith("write_") and attribute.endswith("_records")):
+            profiler.wrap(handler, attribute)
+    for attribute in RECORD_STAGES:
+        profiler.wrap(data_handler.DataRecord, attribute)
+    for attribute in HANDLER_HELPERS:
+        profiler.wrap(data_handler, attribute)
+    for store in get_subclasses(data_store.DataStore) + [data_store.DBSession]:
+        for attribute in STORE_STAGES:
+            if attribute in vars(store):
+                profiler.wrap(store, attribute)
+    if recorder_module is not None:
+        for attribute in RECORDER_HELPERS:
+            if hasattr(recorder_module, attribute):
+                profiler.wrap(recorder_module, attribute, "data_recorder.%s" % attribute)
+
+
+def get_subclasses(cls):
+    '''
+    Returns
+    -------
+    subclasses(list): cls and all the classes derived from it
+    '''
+    subclasses = [cls]
+    for subclass in cls.__subclasses__():
+        subclasses.extend(get_subclasses(subclass))
+    return subclasses
+
+
+def count_records(args):
+    '''
+    Returns
+    -------
+    records(int): length of the first list argument of a call, eg. the entries of push_to_db()
+    '''
+    for arg in args:
+        if isinstance(arg, list):
+            return len(arg)
+    return 0
+
+
+def read_io_counters():
+    '''
+    Returns
+    -------
+    counters(tuple): bytes read and written by this process so far, None if
+                     the OS does not report them (only linux has /proc/self/io)
+    '''
+    try:
+        with open("/proc/self/io") as filehandler:
+            counters = dict(line.split(": ") for line in filehandler.read().splitlines())
+        return (int(counters["rchar"]), int(counters["wchar"]))
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def get_peak_memory():
+    '''
+    Returns
+    -------
+    peak_memory(int): peak resident memory of this process in bytes, None if unknown
+    '''
+    if resource is None:
+        return None
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak_memory if sys.platform == "darwin" else peak_memory * 1024
+
+
+def format_bytes(total_bytes):
+    if total_bytes is None:
+        return "n/a"
+    for unit in ["B", "KB", "MB"]:
+        if total_bytes < 1024:
+            return "%.1f %s" % (total_bytes, unit)
+        total_bytes /= 1024.0
+    return "%.1f GB" % total_bytes
@@ -0,0 +1,81 @@
+import unittest
+import os
+import io
+import json
+import contextlib
+from data_profiler import Profiler, instrument
+from data_handler import FormatHandler
+
+TEST_UPLOAD_PATH = "test_cases/test_data.csv"
+TEST_PROFILE_DB_PATH = "test_cases/test_profile.json"
+TEST_TRACE_PATH = "test_cases/test_profile_trace.json"
+# files the stores keep next to a db: ID index, search index, hashes and write lock
+SIDECAR_SUFFIXES = [".ids", ".search", ".hashes", ".lock"]
+
+class Stages:
+    def parse(self):
+        for n_id in range(3):
+            yield n_id
+
+    def push(self, data_entries):
+        return self.write(data_entries)
+
+    def write(self, data_entries):
+        return len(data_entries)
+
+
+class TestDataProfiler(unittest.TestCase):
+    def setUp(self):
+        for path in [TEST_PROFILE_DB_PATH, TEST_TRACE_PATH] + [TEST_PROFILE_DB_PATH + suffix for suffix in SIDECAR_SUFFIXES]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def tearDown(self):
+        self.setUp()
+
+    def test_stages(self):
+        push, write = Stages.push, Stages.write
+        profiler = Profiler("upload", trace=True)
+        for attribute in ["parse", "push", "write"]:
+            profiler.wrap(Stages, attribute)
+        stages = Stages()
+        self.assertEqual(stages.push(list(stages.parse())), 3)
+        profiler.stop()
+        # the originals are put back
+        self.assertEqual((Stages.push, Stages.write), (push, write))
+
+        stages = dict((stage[0], stage) for stage in profiler.get_stages())
+        self.assertEqual(set(stages), set(["upload", "Stages.parse", "Stages.push", "Stages.write"]))
+        self.assertEqual(stages["Stages.parse"][1:3], (1, 3))
+        self.assertEqual(stages["Stages.push"][1:3], (1, 3))
+        # the self time of push leaves out write, and all self times add up to the command
+        name, calls, records, self_time, total_time = stages["Stages.push"]
+        self.assertAlmostEqual(total_time - self_time, stages["Stages.write"][4], places=6)
+        self.assertAlmostEqual(sum(stage[3] for stage in stages.values()), profiler.get_summary()["elapsed"], places=6)
+
+        profiler.write_chrome_trace(TEST_TRACE_PATH)
+        with open(TEST_TRACE_PATH) as filehandler:
+            trace = json.load(filehandler)
+        self.assertEqual(sorted(event["name"] for event in trace["traceEvents"]),
+                         ["Stages.parse", "Stages.push", "Stages.write", "upload"])
+        self.assertEqual(trace["otherData"]["command"], "upload")
+
+    def test_instrument(self):
+        push_to_db = FormatHandler.push_to_db
+        profiler = Profiler("upload")
+        instrument(profiler)
+        with contextlib.redirect_stdout(io.StringIO()):
+            FormatHandler("csv", TEST_UPLOAD_PATH, TEST_PROFILE_DB_PATH, ["id", "name", "address", "phone"]).upload()
+        profiler.stop()
+        self.assertIs(FormatHandler.push_to_db, push_to_db)
+
+        stages = dict((stage[0], stage) for stage in profiler.get_stages())
+        self.assertEqual(stages["FormatHandler.push_to_db"][1:3], (1, 2))
+        self.assertEqual(stages["FormatHandler.iter_csv_entries"][2], 2)
+        self.assertIn("JSONStore.write_db", stages)
+        timings = io.StringIO()
+        profiler.print_timings(timings)
+        self.assertIn("Timings of upload", timings.getvalue())
+        self.assertIn("FormatHandler.validate_entries", timings.getvalue())
+
+unittest.main(verbosity=2)
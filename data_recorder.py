@@ -6,73 +6,221 @@
 
 import os
 import sys
+import glob
 import json
 import argparse
+import itertools
+import contextlib
 from colorama import Fore
-import xml.etree.ElementTree as ET
-from tabulate import tabulate
-from jinja2 import Template
-from collections import OrderedDict
 
-from data_handler import FormatHandler, DataRecord
+# tabulate, jinja2 and the server are slow to import, they are
+# imported by the commands that need them
+from data_handler import FormatHandler, DataRecord, UPLOAD_CHUNK_SIZE, upload_files
+from data_store import DBSession, migrate_db, match_value, serialize_record, CorruptDBError, SEARCH_MODES
 
 DB_PATH = "./main.json"
-CONVERT_PATH = "./convert.json"
-DB_CAPACITY = 100
+# most records the db may hold and most records a run may add, None for no limit
+DB_CAPACITY = None
+DB_QUOTA = None
 DEFAULT_FORMAT = "json"
-SUPPORTED_FORMATS = ["json", "csv", "yaml", "xml"]
+SUPPORTED_FORMATS = ["json", "csv", "yaml", "xml", "drc"]
 
-FUNCTIONS = ["add", "upload", "download", "search", "display", "convert", "info"]
+FUNCTIONS = ["add", "upload", "download", "search", "display", "convert", "migrate", "serve", "info"]
+READ_ONLY_COMMANDS = ["search", "display", "download"]
 SUPPORTED_RECORDS = ["id", "name", "address", "phone"]
+OUTPUT_FORMATS = ["text", "json"]
 
 SUPPORT_EMAIL_ALIAS = "data-recorder-help@gmail.com"
 AUTHORS = ["Su Sengupta"]
 HTML_DISPLAY_PATH = "main.html"
+# records per page of display text --page, and per table when all the records are displayed
+DISPLAY_PAGE_SIZE = 100
+DISPLAY_CHUNK_SIZE = 1000
+HTML_TEMPLATE = """<html>
+    <link rel="stylesheet" href="styles.css">
+    <head>
+    <title>Employee Records</title>
+    </head>
+    <body>
+    <table>
+    <tr>
+        <th> ID </th>
+        <th> Name </th>
+        <th> Address </th>
+        <th> Phone Number </th>
+    </tr>
+        {% for entry in data_records%}
+            <tr>
+                <td> {{entry.get('id')}} </td>
+                <td> {{entry.get('name')}} </td>
+                <td> {{entry.get('address')}} </td>
+                <td> {{entry.get('phone')}} </td>
+            </tr>
+        {%  endfor %}
+    </table>
+    {% if previous_page or next_page %}<p>{% if previous_page %}<a href="{{previous_page}}">Previous</a> {% endif %}{% if next_page %}<a href="{{next_page}}">Next</a>{% endif %}</p>{% endif %}
+    </body>
+    </html>
+    """
+# compiled by the first display html, see get_html_template()
+compiled_html_template = None
 
 FILE_FORMAT_ERROR_MSG =  Fore.RED + "This file format is not supported currently. Please contact [%s] to request for a new format." % SUPPORT_EMAIL_ALIAS + Fore.RESET
 FILE_OFFLINE_MSG = Fore.RED + "appears to be offline." + Fore.RESET
 FILE_CORRUPT_MSG = Fore.RED + "ERROR: db might be corrupted, please contact %s." % SUPPORT_EMAIL_ALIAS + Fore.RESET
 
-def add_data():
+def add_data(from_stdin=False, output="text", session=None):
     '''
         Adds entries by taking in number of entries and then details of the entries.
-        Currently, there is an upper limit of 100 maximum entries.
+        The number of entries is limited by the free slots of the db, if it has
+        a capacity or a quota (see --capacity and --quota).
+
+        Parameters
+        ----------
+        from_stdin(bool): read the entries as JSON lines from stdin instead of prompting
+        output(str): 'text' or 'json', the format of the summary of added entries
+        session(DBSession): session of the db, see get_session()
     '''
-    DB_SIZE = get_DB_size()
-    total_entries = input("Currently, we have [%s] slots left in our DB. Please type the number of entries you'd like to add today: " % (DB_CAPACITY - DB_SIZE))
+    if from_stdin:
+        add_data_from_stream(sys.stdin, output, session)
+        return
+
+    free_slots = get_free_slots(session)
+    if free_slots is None:
+        total_entries = input("Currently, we have [%s] entries in our DB. Please type the number of entries you'd like to add today: " % get_DB_size(session))
+    else:
+        total_entries = input("Currently, we have [%s] slots left in our DB. Please type the number of entries you'd like to add today: " % free_slots)
     
     if total_entries.isnumeric():
-        if DB_SIZE + int(total_entries) > 100:
-            print (Fore.RED +  "ERROR: Sorry, that exceeds our upper limit of %s entries. Please try again." % (DB_CAPACITY) + Fore.RESET)
+        if free_slots is not None and int(total_entries) > free_slots:
+            print (Fore.RED +  "ERROR: Sorry, that exceeds the [%s] slots left in our DB. Please try again." % free_slots + Fore.RESET)
         else:
             print ("Adding a new batch of [%s] entries:" % total_entries)
-            add_data_entries(int(total_entries))
+            add_data_entries(int(total_entries), session)
             print (Fore.GREEN + "Entries have been added successfully." + Fore.RESET)
     else:
         print (Fore.RED + "ERROR: Please enter a valid option for number of entries." + Fore.RESET)
 
 
-def get_DB_size():
+def add_data_from_stream(stream, output="text", session=None):
+    '''
+        Adds the entries read from a stream of JSON lines, one entry per line,
+        eg. {"id": "1", "name": "Anne Rice", "address": "23 Vampire Ave", "phone": "666"}
+
+        Parameters
+        ----------
+        stream(file): the stream to read, eg. sys.stdin
+        output(str): 'text' or 'json', the format of the summary of added entries
+        session(DBSession): session of the db, see get_session()
+    '''
+    with contextlib.redirect_stdout(sys.stderr if output == "json" else sys.stdout):
+        data_entries, skipped_entries = read_json_lines(stream, session)
+        free_slots = get_free_slots(session)
+        if free_slots is not None and len(data_entries) > free_slots:
+            print (Fore.RED +  "ERROR: Sorry, that exceeds the [%s] slots left in our DB. Please try again." % free_slots + Fore.RESET)
+            return
+        if data_entries:
+            push_to_db(data_entries, session)
+
+    if output == "json":
+        print (json.dumps({"added": len(data_entries), "skipped": skipped_entries}))
+    else:
+        print (Fore.GREEN + "[%s] entries have been added successfully, [%s] skipped." % (len(data_entries), skipped_entries) + Fore.RESET)
+
+
+def read_json_lines(stream, session=None):
+    '''
+        Reads and validates new entries from a stream of JSON lines.
+        Lines that are not valid, have no ID or a duplicate ID are skipped.
+
+        Parameters
+        ----------
+        stream(file): the stream to read, eg. sys.stdin
+        session(DBSession): session of the db, see get_session()
+
+        Returns
+        -------
+        data_entries(list): the validated entries
+        skipped_entries(int): number of lines that were skipped
+    '''
+    data_entries = []
+    new_ids = set()
+    skipped_entries = 0
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except json.decoder.JSONDecodeError:
+            entry = None
+        if not isinstance(entry, dict):
+            print (Fore.YELLOW + "WARNING: line %s is not a JSON entry, skipping it." % line_number + Fore.RESET)
+            skipped_entries += 1
+            continue
+        data_record = DataRecord(entry.get("id", ""), str(entry.get("name", "")), str(entry.get("address", "")), str(entry.get("phone", "")))
+        n_id = data_record.get_id()
+        if not n_id:
+            print (Fore.YELLOW + "WARNING: line %s has no numeric id, skipping it." % line_number + Fore.RESET)
+            skipped_entries += 1
+            continue
+        if n_id in new_ids or is_duplicate(n_id, session):
+            print (Fore.YELLOW + "WARNING: line %s has the id [%s] that already exists in our data records, skipping it." % (line_number, n_id) + Fore.RESET)
+            skipped_entries += 1
+            continue
+        new_ids.add(n_id)
+        data_entries.append(data_record.to_dict())
+    return data_entries, skipped_entries
+
+
+def get_session(session=None):
+    '''
+        Returns the session the helpers read and write the db with.
+        main() creates one session for the whole run, so the db is
+        loaded at most once and written by a single commit. Without
+        it, a new session is opened on DB_PATH.
+
+        Parameters
+        ----------
+        session(DBSession): session created by main(), if any
+    '''
+    return session if session else DBSession(DB_PATH, capacity=DB_CAPACITY, quota=DB_QUOTA)
+
+
+def get_DB_size(session=None):
     '''
         Returns
         -------
         db_size(int): Number of total entries in the db.
     '''
     empty_db = 0
-    try:
-        db_data = open(DB_PATH)
-    except:
+    store = get_session(session)
+    if not store.exists():
         print ("unable to read DB")
         return empty_db
 
-    data_records = json.load(db_data)
-    if not data_records:
+    try:
+        db_size = store.get_DB_size()
+    except CorruptDBError:
+        print (FILE_CORRUPT_MSG)
         return empty_db
-    db_size = len(data_records.get("data_records"))
     return db_size
 
 
-def add_data_entries(total_entries):
+def get_free_slots(session=None):
+    '''
+        Returns
+        -------
+        free_slots(int): Number of entries that can still be added,
+                         None if the db has neither a capacity nor a quota.
+    '''
+    try:
+        return get_session(session).get_free_slots()
+    except CorruptDBError:
+        print (FILE_CORRUPT_MSG)
+        return 0
+
+
+def add_data_entries(total_entries, session=None):
     '''
         Requests for the entry details from the user and pushes the
         records to db.
@@ -80,6 +228,7 @@ def add_data_entries(total_entries):
         Parameters
         ----------
         total_entries(int): total number of entries being added
+        session(DBSession): session of the db, see get_session()
     '''
     num_entry = 1
     data_entries = []
@@ -87,7 +236,7 @@ def add_data_entries(total_entries):
     while (num_entry <= total_entries):
         while True:
             n_id = input("Enter the id: ")
-            if is_duplicate(n_id):
+            if is_duplicate(n_id, session):
                 print ("This ID already exists in our data records. ID is unique for each entry so please re-enter this.")
                 continue
             elif not n_id:
@@ -108,63 +257,60 @@ def add_data_entries(total_entries):
         data_entries.append(data_record_dict)
         num_entry += 1
 
-    push_to_db(data_entries)
+    push_to_db(data_entries, session)
 
 
-def is_duplicate(n_id):
+def is_duplicate(n_id, session=None):
     '''
         Checks for duplicate IDs inside the existing data records.
 
         Parameters
         ----------
         n_id(int): ID of the employee being added
+        session(DBSession): session of the db, see get_session()
 
         Returns
         -------
         bool: True if the ID matches an existing entry
     '''
-    existing_data = pull_from_db()
-    if not existing_data:
+    store = get_session(session)
+    if not store.exists():
         return
 
-    data_records = existing_data.get("data_records")
-    for record in data_records:
-        if str(n_id) == record.get("id"):
-            return True
-    return False
+    try:
+        return store.is_duplicate(n_id)
+    except CorruptDBError:
+        print (FILE_CORRUPT_MSG)
 
 
-def push_to_db(data_entries):
+def push_to_db(data_entries, session=None):
     '''
         Pushes new data entries into db.
         By default, this uploads directly to a JSON file
         that is currently acting as a storage unit for
-        the data records.
+        the data records. A .db path stores them in sqlite3.
+        With the session of main(), the entries are written
+        when main() commits it.
 
         Parameters
         ----------
             data_entries(dict): dictionary of new data
+            session(DBSession): session of the db, see get_session()
     '''
-    existing_data = {"data_records": []}
-    if not os.path.exists(DB_PATH):
-        with open(DB_PATH, 'w') as filehandler:
-            json.dump(existing_data, filehandler, indent=4)
-    else:
-        try:
-            with open(DB_PATH) as filehandler:
-                existing_data = json.load(filehandler) or {"data_records": []}
-        except json.decoder.JSONDecodeError:
-            print (FILE_CORRUPT_MSG)
-
-    if existing_data.get("data_records") or data_entries:
-        existing_data.get("data_records").extend(data_entries)
-        with open(DB_PATH, 'w') as filehandler:
-            json.dump(existing_data, filehandler, indent=4)
-    else:
-        print ("No data available for upload.")
+    store = get_session(session)
+    try:
+        store.create_db()
+        if data_entries:
+            store.push_to_db(data_entries)
+        elif not store.get_DB_size():
+            print ("No data available for upload.")
+        if not session:
+            store.commit()
+    except CorruptDBError:
+        print (FILE_CORRUPT_MSG)
 
 
-def pull_from_db():
+def pull_from_db(session=None):
     '''
     Pulls data records from db.
     By default, this downloads directly from a JSON file
@@ -172,42 +318,74 @@ def pull_from_db():
     the data records.
     '''
     existing_data = {"data_records": []}
-    if not os.path.exists(DB_PATH):
+    store = get_session(session)
+    if not store.exists():
         print ("[%s] " % DB_PATH + FILE_OFFLINE_MSG)
         return
 
     try:
-        with open(DB_PATH) as filehandler:
-            existing_data = json.load(filehandler)
-    except json.decoder.JSONDecodeError:
+        existing_data = store.pull_from_db()
+    except CorruptDBError:
         print (FILE_CORRUPT_MSG)
     return existing_data
 
 
-def search_data():
+def search_data(search_field=None, search_value=None, search_mode=None, output="text", session=None):
     '''
     Requests for a search value and checks the db
     for a matching entry. The current search fields
     supported are: ["id", "name", "address", "phone"]
-    '''
-    existing_data = pull_from_db()
-    if not existing_data:
-        print (Fore.RED + "There are no data records in the DB to display. Exiting." + Fore.RESET)
-        return
-    data_records = existing_data.get("data_records")
+    and a field can contain, start with or end with the value.
+
+    Parameters
+    ----------
+        search_field(str): the field being searched, requested if not given
+        search_value(str): the searched word, requested if not given
+        search_mode(str): 'contains', 'starts with' or 'ends with'
+        output(str): 'text' for a table, 'json' for a list of the matching entries
+        session(DBSession): session of the db, see get_session()
+    '''
+    # with json output only the entries go to stdout, so they can be piped
+    with contextlib.redirect_stdout(sys.stderr if output == "json" else sys.stdout):
+        store = get_session(session)
+        if not store.exists():
+            print ("[%s] " % DB_PATH + FILE_OFFLINE_MSG)
+            print (Fore.RED + "There are no data records in the DB to display. Exiting." + Fore.RESET)
+            return
 
-    # More features: starting with, ends with, contains
-    search_field = input("Which of the following fields would you like to use for searching (%s): " % SUPPORTED_RECORDS)
-    if search_field.lower() not in SUPPORTED_RECORDS:
-        print (Fore.RED + "The field [%s] does not exist in our records. Please contact [%s] if you'd like to add a new field or try again." % (search_field, SUPPORT_EMAIL_ALIAS) + Fore.RESET)
-        return
-    search_value = input("What %s would you like to search for: " % search_field)
+        is_interactive = search_value is None
+        if search_field is None:
+            search_field = input("Which of the following fields would you like to use for searching (%s): " % SUPPORTED_RECORDS)
+        if search_field.lower() not in SUPPORTED_RECORDS:
+            print (Fore.RED + "The field [%s] does not exist in our records. Please contact [%s] if you'd like to add a new field or try again." % (search_field, SUPPORT_EMAIL_ALIAS) + Fore.RESET)
+            return
+        search_field = search_field.lower()
+        if search_value is None:
+            search_value = input("What %s would you like to search for: " % search_field)
+        if search_mode is None and is_interactive:
+            search_mode = input("Should the %s contain, start with or end with it (%s, default: contains): " % (search_field, SEARCH_MODES))
+        search_mode = (search_mode or "").lower().strip() or "contains"
+        if search_mode not in SEARCH_MODES:
+            print (Fore.RED + "The search mode [%s] is not supported. Please use one of %s." % (search_mode, SEARCH_MODES) + Fore.RESET)
+            return
+
+        # only the candidates of the search index are read, all the records if the search is too short for it
+        try:
+            positions = store.get_search_candidates(search_field, search_value, search_mode)
+            data_records = store.iter_records() if positions is None else store.get_records_at(positions)
+            found_entries = search_entries(data_records, search_value, search_field, search_mode)
+        except CorruptDBError:
+            print (FILE_CORRUPT_MSG)
+            return
 
-    found_entries = search_entries(data_records, search_value, search_field)
+    if output == "json":
+        print (json.dumps(found_entries, default=serialize_record))
+        return
     if not found_entries:
         print ("There are no matching entries with '%s' in [%s]." % (search_value, search_field))
         return
 
+    from tabulate import tabulate
     print ("Here are the matching entries with '%s' in [%s]:" % (search_value, search_field))
     tabular_list = []
     for entry in found_entries:
@@ -216,7 +394,7 @@ def search_data():
     print("\n")
 
 
-def search_entries(data_records, search_value, search_field):
+def search_entries(data_records, search_value, search_field, search_mode="contains"):
     '''
         Searches for a matching entry based on a search field.
 
@@ -226,87 +404,178 @@ def search_entries(data_records, search_value, search_field):
             search_value(str): the searched word
             search_field(str): the field being searched
                                eg. 'name', 'id' etc.
+            search_mode(str): 'contains', 'starts with' or 'ends with'
     '''
     found_entries = []
     print ("Searching for %s amongst %s in entries...\n" % (search_value, search_field))
     for record in data_records:
-        if search_value.lower() in record.get(search_field).lower():
+        if match_value(record.get(search_field), search_value, search_mode):
             found_entries.append(record)
     return found_entries
 
 
-def display_text():
+def display_text(session=None, page=None, limit=None):
     '''
-    Displays all data records in text form and a 
-    tabular format on shell.
+    Displays data records in text form and a
+    tabular format on shell. Records are read and printed
+    DISPLAY_CHUNK_SIZE at a time, so the first rows show up
+    before the whole db is read. With a page, only the
+    records of that page are read.
+
+    Parameters
+    ----------
+        session(DBSession): session of the db, see get_session()
+        page(int): page to display, starting at 1, all records if not given
+        limit(int): records per page, DISPLAY_PAGE_SIZE by default
     '''
-    existing_data = pull_from_db()
-    if not existing_data or not existing_data.get("data_records"):
+    store = get_session(session)
+    if not store.exists():
+        print ("[%s] " % DB_PATH + FILE_OFFLINE_MSG)
         print ("There are no data records in the DB to display. Exiting.")
         return
+    if (page is not None and page < 1) or (limit is not None and limit < 1):
+        print (Fore.RED + "The page and the limit need to be 1 or more." + Fore.RESET)
+        return
+    if limit and page is None:
+        page = 1
+    limit = limit or DISPLAY_PAGE_SIZE
 
-    data_records = existing_data.get("data_records")
-    tabular_list = []
-    for entry in data_records:
-        tabular_list.append(entry.values())
-    print(tabulate(tabular_list,  headers=SUPPORTED_RECORDS, tablefmt='orgtbl'))
+    from tabulate import tabulate
+    displayed = False
+    try:
+        if page is None:
+            chunks = iter_chunks(store.iter_records(), DISPLAY_CHUNK_SIZE)
+        else:
+            db_size = store.get_DB_size()
+            chunks = [store.get_records((page - 1) * limit, page * limit)]
+        for data_records in chunks:
+            if not data_records:
+                if page is not None and db_size:
+                    print ("There are no data records on page %s, the DB has %s pages." % (page, (db_size + limit - 1) // limit))
+                    return
+                break
+            if page is not None:
+                first = (page - 1) * limit + 1
+                print ("Records %s to %s of %s (page %s of %s):" % (first, first + len(data_records) - 1, db_size, page, (db_size + limit - 1) // limit))
+            tabular_list = [entry.values() for entry in data_records]
+            print(tabulate(tabular_list,  headers=SUPPORTED_RECORDS, tablefmt='orgtbl'))
+            displayed = True
+    except CorruptDBError:
+        print (FILE_CORRUPT_MSG)
+    if not displayed:
+        print ("There are no data records in the DB to display. Exiting.")
+        return
     print("\n")
 
 
-def display_html():
+def iter_chunks(data_records, chunk_size):
+    '''
+    Yields lists of up to chunk_size records.
+    '''
+    data_records = iter(data_records)
+    chunk = list(itertools.islice(data_records, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(data_records, chunk_size))
+
+
+def get_html_template():
+    '''
+    Returns
+    -------
+    template(jinja2.Template): HTML_TEMPLATE, compiled once per process
+    '''
+    global compiled_html_template
+    if compiled_html_template is None:
+        from jinja2 import Template
+        compiled_html_template = Template(HTML_TEMPLATE)
+    return compiled_html_template
+
+
+def get_html_page_path(page):
+    '''
+    Returns
+    -------
+    html_path(str): HTML_DISPLAY_PATH for the first page, eg. main-2.html for the second
+    '''
+    if page == 1:
+        return HTML_DISPLAY_PATH
+    html_name, html_ext = os.path.splitext(HTML_DISPLAY_PATH)
+    return "%s-%s%s" % (html_name, page, html_ext)
+
+
+def display_html(session=None, limit=None):
     '''
     Displays all data records in html form and renders
     out an html template that is stored locally.
-    '''
-    existing_data = pull_from_db()
-    if not existing_data or not existing_data.get("data_records"):
+    The template is streamed into the file while the
+    records are read. With a limit, the records are split
+    into pages of that many records, eg. main.html,
+    main-2.html, ... linked to each other.
+
+    Parameters
+    ----------
+        session(DBSession): session of the db, see get_session()
+        limit(int): records per html file, all records in one file if not given
+    '''
+    if limit is not None and limit < 1:
+        print (Fore.RED + "The page and the limit need to be 1 or more." + Fore.RESET)
+        return
+    store = get_session(session)
+    if not store.exists():
+        print ("[%s] " % DB_PATH + FILE_OFFLINE_MSG)
         print ("There are no data records in the DB to display. Exiting.")
         return
 
-    data_records = existing_data.get("data_records")
-    html_template = """<html>
-    <link rel="stylesheet" href="styles.css">
-    <head>
-    <title>Employee Records</title>
-    </head>
-    <body>
-    <table>
-    <tr>
-        <th> ID </th>
-        <th> Name </th>
-        <th> Address </th>
-        <th> Phone Number </th>
-    </tr>
-        {% for entry in data_records%}
-            <tr>
-                <td> {{entry.get('id')}} </td>
-                <td> {{entry.get('name')}} </td>
-                <td> {{entry.get('address')}} </td>
-                <td> {{entry.get('phone')}} </td>
-            </tr>
-        {%  endfor %}
-    </table>
-    
-    </body>
-    </html>
-    """
-    html_template = Template(html_template).render(data_records=data_records)
-    html_file = open(HTML_DISPLAY_PATH, "w+")
-    html_file.write(html_template)
-    html_file.close()
+    template = get_html_template()
+    html_paths = []
+    try:
+        data_records = iter(store.iter_records())
+        first_record = next(data_records, None)
+        if first_record is None:
+            print ("There are no data records in the DB to display. Exiting.")
+            return
+        data_records = itertools.chain([first_record], data_records)
+        pages = iter_chunks(data_records, limit) if limit else iter([data_records])
+        page_records = next(pages)
+        while page_records is not None:
+            next_records = next(pages, None) if limit else None
+            page = len(html_paths) + 1
+            html_paths.append(get_html_page_path(page))
+            with open(html_paths[-1], "w+") as html_file:
+                for html_chunk in template.generate(data_records=page_records,
+                                                    previous_page=os.path.basename(get_html_page_path(page - 1)) if page > 1 else None,
+                                                    next_page=os.path.basename(get_html_page_path(page + 1)) if next_records else None):
+                    html_file.write(html_chunk)
+            page_records = next_records
+    except CorruptDBError:
+        print (FILE_CORRUPT_MSG)
+        return
 
+    if len(html_paths) > 1:
+        print (Fore.GREEN + "Data Records have been stored to %s pages: %s ... %s" % (len(html_paths), os.path.abspath(html_paths[0]), os.path.abspath(html_paths[-1])) + Fore.RESET)
+        return
     print (Fore.GREEN + "Data Records have been stored to: %s" % os.path.abspath(HTML_DISPLAY_PATH) + Fore.RESET)
 
 
-def convert_data():
+def convert_data(src=None, dest=None):
     '''
     Converts serialized data from one format to another.
     Eg. converts uploads.csv to uploads.xml.
     Does not interact with the main.json (main db),
-    only runs a standalone conversion.
-    '''
-    src = input("Please provide the full path to the source file i.e. the file you would like to convert: ")
-    dest = input("Please provide the destination filepath: ")
+    only runs a standalone conversion. Records are read,
+    validated and written one at a time, without any
+    temporary file in between.
+
+    Parameters
+    ----------
+        src(str): file path of the source file, requested if not given
+        dest(str): file path of the destination file, requested if not given
+    '''
+    if src is None:
+        src = input("Please provide the full path to the source file i.e. the file you would like to convert: ")
+    if dest is None:
+        dest = input("Please provide the destination filepath: ")
     src_name, src_ext = os.path.splitext(src)
     src_ext = src_ext.split(".")[-1] # remove '.' from extension
     dest_name, dest_ext = os.path.splitext(dest)
@@ -316,33 +585,42 @@ def convert_data():
         print ("[%s] " % src + FILE_OFFLINE_MSG)
         return
 
-    if src_ext not in SUPPORTED_FORMATS:
+    if src_ext not in SUPPORTED_FORMATS or dest_ext not in SUPPORTED_FORMATS:
         print (FILE_FORMAT_ERROR_MSG)
-    else:
-        print ("Converting data from: %s..." % src)
-        # clear out convert.json file
-        if os.path.exists(CONVERT_PATH):
-            with open(CONVERT_PATH, 'w+') as filehandler:
-                json.dump({"data_records": []}, filehandler, indent=4)
-
-        formathandler = FormatHandler(src_ext, src, CONVERT_PATH, SUPPORTED_RECORDS)
-        formathandler.upload()
+        return
 
-    if dest_ext not in SUPPORTED_FORMATS:
-        print (FILE_FORMAT_ERROR_MSG)
-    else:
-        formathandler = FormatHandler(dest_ext, dest, CONVERT_PATH, SUPPORTED_RECORDS)
-        if not os.path.exists(CONVERT_PATH):
-            print (Fore.RED + "Error: Source file not uploaded correctly. Exiting." + Fore.RESET)
-            return
-        formathandler.download()
+    print ("Converting data from: %s..." % src)
+    src_handler = FormatHandler(src_ext, src, None, SUPPORTED_RECORDS)
+    dest_handler = FormatHandler(dest_ext, dest, None, SUPPORTED_RECORDS)
+    src_handler.convert(dest_handler)
+    print ("Converted data to: %s" % dest)
 
 
-def upload_data():
+def upload_data(src=None, session=None, workers=None, delta=False):
     '''
     Requests for a source file to upload data to db.
-    '''
-    src = input("Please provide the full path to the source file for uploading data (eg. my_dir/path_to_file.csv): ")
+    A directory or a glob, eg. 'nightly/*.csv', uploads all the
+    files of a supported format it matches, see upload_files().
+
+    Parameters
+    ----------
+        src(str): file path of the source file, requested if not given
+        session(DBSession): session of the db, see get_session()
+        workers(int): processes reading the files, the number of cores by default
+        delta(bool): only write the entries that are new or changed, the
+                     records with the same ID are updated instead of skipped
+    '''
+    if src is None:
+        src = input("Please provide the full path to the source file for uploading data (eg. my_dir/path_to_file.csv): ")
+    if os.path.isdir(src) or any(c in src for c in "*?["):
+        src_paths = get_upload_paths(src)
+        if not src_paths:
+            print ("[%s] " % src + Fore.RED + "matches no file of a supported format." + Fore.RESET)
+            return
+        total_added = upload_files(src_paths, DB_PATH, SUPPORTED_RECORDS, session, workers, delta)
+        if not delta:
+            print (Fore.GREEN + "Uploaded %s new entries from %s files." % (total_added, len(src_paths)) + Fore.RESET)
+        return
     src_name, src_ext = os.path.splitext(src)
     src_ext = src_ext.split(".")[-1] # remove '.' from extension
 
@@ -354,15 +632,34 @@ def upload_data():
         print (FILE_FORMAT_ERROR_MSG)
     else:
         print ("Uploading data from: %s..." % src)
-        formathandler = FormatHandler(src_ext, src, DB_PATH, SUPPORTED_RECORDS)
+        formathandler = FormatHandler(src_ext, src, DB_PATH, SUPPORTED_RECORDS, session, delta)
         formathandler.upload()
 
 
-def download_data():
+def get_upload_paths(src):
+    '''
+    Returns
+    -------
+    src_paths(list): sorted paths of the files of a supported format
+                     inside the directory src or matching the glob src
+    '''
+    if os.path.isdir(src):
+        src = os.path.join(glob.escape(src), "*")
+    return sorted(path for path in glob.glob(src, recursive=True)
+        if os.path.isfile(path) and os.path.splitext(path)[1].split(".")[-1] in SUPPORTED_FORMATS)
+
+
+def download_data(dest=None, session=None):
     '''
     Requests for a destination file to download data from db.
+
+    Parameters
+    ----------
+        dest(str): file path of the destination file, requested if not given
+        session(DBSession): session of the db, see get_session()
     '''
-    dest = input("Please provide the full path to the destination file for downloading data (eg. my_dir/path_to_file.csv): ")
+    if dest is None:
+        dest = input("Please provide the full path to the destination file for downloading data (eg. my_dir/path_to_file.csv): ")
     dest_name, dest_ext = os.path.splitext(dest)
     dest_ext = dest_ext.split(".")[-1] # remove '.' from extension
 
@@ -370,7 +667,7 @@ def download_data():
         print (FILE_FORMAT_ERROR_MSG)
     else:
         print ("Downloading data to: %s..." % dest)
-        formathandler = FormatHandler(dest_ext, dest, DB_PATH, SUPPORTED_RECORDS)
+        formathandler = FormatHandler(dest_ext, dest, DB_PATH, SUPPORTED_RECORDS, session)
         formathandler.download()
 
 
@@ -378,26 +675,59 @@ def display_info():
     '''
     Displays some information about the tool.
     '''
-    print ("Once new entries are added or uploaded, they will be stored in a file called " + Fore.CYAN + "'./main.json'." + Fore.RESET)
+    print ("Once new entries are added or uploaded, they will be stored in a file called " + Fore.CYAN + "'%s'." % DB_PATH + Fore.RESET)
     print ("Currently, the following formats are supported for uploads/downloads: " + Fore.CYAN + "%s" % SUPPORTED_FORMATS + Fore.RESET)
     print ("This tool is written and maintained by: " + Fore.MAGENTA + "%s" % AUTHORS + Fore.RESET)
     print ("If you have any queries, please contact: "+ Fore.MAGENTA + "[%s]\n" % SUPPORT_EMAIL_ALIAS + Fore.RESET)
 
 
-def create_db():
+def migrate_data(dest=None):
     '''
-        Creates a .json file that acts as a storage unit
-        for all the data records. In the future, this will
-        be replaced by a database.
+    Requests for a destination db and migrates all the
+    data records of the current db into it.
+    Eg. migrates ./main.json to an sqlite3 db ./main.db.
+
+    Parameters
+    ----------
+        dest(str): file path of the new db, requested if not given
     '''
-    if not os.path.exists(DB_PATH):
-        with open(DB_PATH, 'w') as filehandler:
-            json.dump({"data_records": []}, filehandler, indent=4)
+    if dest is None:
+        dest = input("Please provide the full path to the new db (eg. ./main.db): ")
+    if os.path.abspath(dest) == os.path.abspath(DB_PATH):
+        print (Fore.RED + "ERROR: The new db needs to be different from the current db [%s]." % DB_PATH + Fore.RESET)
+        return
 
+    print ("Migrating data from: %s..." % DB_PATH)
     try:
-        with open(DB_PATH) as filehandler:
-            json.load(filehandler)
-    except json.decoder.JSONDecodeError:
+        total_entries = migrate_db(DB_PATH, dest)
+    except CorruptDBError:
+        print (FILE_CORRUPT_MSG)
+        return
+    print (Fore.GREEN + "[%s] entries are now stored in: %s" % (total_entries, dest) + Fore.RESET)
+    print ("To use it, run the tool with: --db %s" % dest)
+
+
+def create_db(session=None):
+    '''
+        Creates the storage unit for all the data records.
+        By default, this is a .json file. A .db path creates
+        an sqlite3 database instead.
+    '''
+    store = get_session(session)
+    try:
+        store.create_db()
+    except CorruptDBError:
+        pass
+    validate_db(store)
+
+
+def validate_db(session=None):
+    '''
+        Exits if the db exists but is corrupted. Used by the
+        commands that only read, a missing db reads as empty.
+    '''
+    store = get_session(session)
+    if store.exists() and not store.validate():
         print (FILE_CORRUPT_MSG)
         sys.exit()
 
@@ -407,6 +737,12 @@ def parse_args():
         Defines commands and parses them.
     '''
     parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="file path of the db: a .json file, an sqlite3 .db file, a log-structured .logdb folder or a columnar .drc file (default: %s)" % DB_PATH)
+    parser.add_argument("--no-banner", action="store_true", help="do not print the welcome banner")
+    parser.add_argument("--capacity", type=int, help="most entries the db may hold (default: no limit)")
+    parser.add_argument("--quota", type=int, help="most entries this command may add (default: no limit)")
+    parser.add_argument("--timings", action="store_true", help="print the time, records, bytes and memory of each stage of the command to stderr")
+    parser.add_argument("--profile", metavar="FILE", help="write a Chrome trace of the stages to FILE if it ends with .json, a cProfile dump otherwise")
     subparsers = parser.add_subparsers(help="commands", dest="command")
     
     add_parser = subparsers.add_parser("add", help="manually add entry/entries")
@@ -415,41 +751,151 @@ def parse_args():
     search_parser = subparsers.add_parser("search", help="search for entries by field")
     display_parser = subparsers.add_parser("display", help="display all existing entries in html or text format")
     convert_parser = subparsers.add_parser("convert", help="convert a source file into a supported destination file format")
+    migrate_parser = subparsers.add_parser("migrate", help="migrate all entries into a new db, eg. from main.json to main.db")
+    serve_parser = subparsers.add_parser("serve", help="keep the db in memory and serve it over a local HTTP/JSON API")
     info_parser = subparsers.add_parser("info", help="display info about data recorder")
 
+    # every prompt can be answered with a flag, so the tool can run from scripts
+    add_parser.add_argument("--from-stdin", action="store_true", help="read the entries from stdin, one JSON object per line")
+    add_parser.add_argument("--output", choices=OUTPUT_FORMATS, default="text", help="format of the summary of added entries")
+    upload_parser.add_argument("--src", help="file path of the source file, or a directory or glob of files, eg. 'nightly/*.csv'")
+    upload_parser.add_argument("--workers", type=int, help="processes reading the files of a directory or glob (default: number of cores)")
+    upload_parser.add_argument("--delta", action="store_true", help="only write the entries that are new or changed, records with the same ID are updated")
+    download_parser.add_argument("--dest", help="file path of the destination file")
+    search_parser.add_argument("--field", choices=SUPPORTED_RECORDS, help="field to search")
+    search_parser.add_argument("--value", help="word to search for")
+    search_parser.add_argument("--mode", choices=SEARCH_MODES, help="how the field matches the word (default: contains)")
+    search_parser.add_argument("--output", choices=OUTPUT_FORMATS, default="text", help="format of the matching entries")
+    convert_parser.add_argument("--src", help="file path of the source file")
+    convert_parser.add_argument("--dest", help="file path of the destination file")
+    migrate_parser.add_argument("--dest", help="file path of the new db")
+    serve_parser.add_argument("--host", help="address to listen on (default: 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, help="port to listen on (default: 8080)")
+    serve_parser.add_argument("--root", help="directory of the files that can be uploaded or downloaded (default: the working directory)")
+
     d_subparsers = display_parser.add_subparsers(help="subcommands", dest="d_subcmds")
     html_parser  = d_subparsers.add_parser("html", help="display the output in html format.")
     text_parser = d_subparsers.add_parser("text", help="display the output in text.")
+    html_parser.add_argument("--limit", type=int, help="records per html file, splits the output into %s, %s, ..." % (HTML_DISPLAY_PATH, get_html_page_path(2)))
+    text_parser.add_argument("--page", type=int, help="page of records to display, starting at 1 (default: all records)")
+    text_parser.add_argument("--limit", type=int, help="records per page (default: %s)" % DISPLAY_PAGE_SIZE)
 
     options = parser.parse_args()
     return options
 
 
 def main():
-    print (Fore.CYAN + "\n***Welcome to Data Recorder!***\n\n" + Fore.RESET)
-    print ("This tool will help you store records for Employees that include:" + Fore.CYAN + " %s" % SUPPORTED_RECORDS + Fore.RESET)
-    print ("Curently, Data Recorder supports the following functions: " + Fore.MAGENTA + "%s\n" % FUNCTIONS + Fore.RESET)
+    global DB_PATH, DB_CAPACITY, DB_QUOTA
     args = parse_args()
+    if not args.no_banner:
+        print (Fore.CYAN + "\n***Welcome to Data Recorder!***\n\n" + Fore.RESET)
+        print ("This tool will help you store records for Employees that include:" + Fore.CYAN + " %s" % SUPPORTED_RECORDS + Fore.RESET)
+        print ("Curently, Data Recorder supports the following functions: " + Fore.MAGENTA + "%s\n" % FUNCTIONS + Fore.RESET)
+    if args.db:
+        DB_PATH = args.db
+    if args.capacity is not None:
+        DB_CAPACITY = args.capacity
+    if args.quota is not None:
+        DB_QUOTA = args.quota
+
+    profiler, cprofiler = start_profiler(args)
+    try:
+        run_command(args)
+    finally:
+        stop_profiler(args, profiler, cprofiler)
+
 
-    create_db()
+def run_command(args):
+    '''
+    Runs the command given on the commandline.
+
+    Parameters
+    ----------
+        args(Namespace): options returned by parse_args()
+    '''
+    # one session for the whole run, uploads are written chunk by chunk
+    session = DBSession(DB_PATH, flush_size=UPLOAD_CHUNK_SIZE, capacity=DB_CAPACITY, quota=DB_QUOTA)
+    # info and convert do not use the db, the commands that only read do not create it
+    if args.command in READ_ONLY_COMMANDS:
+        validate_db(session)
+    elif args.command not in ["info", "convert"]:
+        create_db(session)
 
     if args.command == "add":
-        add_data()
+        add_data(args.from_stdin, args.output, session)
     elif args.command == "search":
-        search_data()
+        search_data(args.field, args.value, args.mode, args.output, session)
     elif args.command == "display":
         if args.d_subcmds == "html":
-            display_html()
+            display_html(session, args.limit)
         else:
-            display_text()  
+            display_text(session, getattr(args, "page", None), getattr(args, "limit", None))
     elif args.command == "upload":
-        upload_data()
+        upload_data(args.src, session, args.workers, args.delta)
     elif args.command == "download":
-        download_data()
+        download_data(args.dest, session)
     elif args.command == "convert":
-        convert_data()
+        convert_data(args.src, args.dest)
+    elif args.command == "migrate":
+        migrate_data(args.dest)
+    elif args.command == "serve":
+        from data_server import serve, DEFAULT_HOST, DEFAULT_PORT
+        serve(DB_PATH, args.host or DEFAULT_HOST, args.port or DEFAULT_PORT, args.root)
     elif args.command == "info":
         display_info()
 
-
-main()
\ No newline at end of file
+    try:
+        session.commit()
+    except CorruptDBError:
+        print (FILE_CORRUPT_MSG)
+    conflicts = session.get_conflicts()
+    if conflicts:
+        print (Fore.YELLOW + "WARNING: Another process added [%s] of the IDs first, these entries were skipped: %s"
+               % (len(conflicts), ", ".join(str(entry.get("id")) for entry in conflicts[:10])) + (" ..." if len(conflicts) > 10 else "") + Fore.RESET)
+    delta_counts = session.get_delta_counts()
+    if delta_counts:
+        print (Fore.GREEN + "Inserted [%(inserted)s], updated [%(updated)s] and skipped [%(unchanged)s] unchanged records." % delta_counts + Fore.RESET)
+
+
+def start_profiler(args):
+    '''
+    Starts timing the stages of the command with --timings or a .json --profile,
+    and cProfile with any other --profile.
+
+    Returns
+    -------
+    profiler(Profiler): times the stages, None if not asked for
+    cprofiler(cProfile.Profile): None if not asked for
+    '''
+    profiler = cprofiler = None
+    trace = bool(args.profile) and args.profile.endswith(".json")
+    if args.timings or trace:
+        from data_profiler import Profiler, instrument
+        profiler = Profiler(" ".join(filter(None, [args.command, getattr(args, "d_subcmds", None)])) or "data_recorder", trace)
+        instrument(profiler, sys.modules[__name__])
+    if args.profile and not trace:
+        import cProfile
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+    return profiler, cprofiler
+
+
+def stop_profiler(args, profiler, cprofiler):
+    '''
+    Reports what start_profiler() measured.
+    '''
+    if cprofiler is not None:
+        cprofiler.disable()
+        cprofiler.dump_stats(args.profile)
+        print ("Saved the cProfile stats to: %s (python -m pstats %s)" % (args.profile, args.profile), file=sys.stderr)
+    if profiler is not None:
+        profiler.stop()
+        if args.timings:
+            profiler.print_timings()
+        if args.profile:
+            profiler.write_chrome_trace(args.profile)
+            print ("Saved the Chrome trace to: %s (open it in chrome://tracing)" % args.profile, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
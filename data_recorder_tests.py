@@ -2,12 +2,30 @@ import unittest
 import filecmp
 import os
 import json
+import io
+import sys
+import shutil
+import contextlib
+import subprocess
 import data_recorder
+from data_store import get_store
 
 TEST_DB_PATH = "test_cases/test_db_2.json"
 TEST_DB_PATH_2 = "test_cases/test_db.json"
+# files the stores keep next to a db: ID index, search index, hashes and write lock
+SIDECAR_SUFFIXES = [".ids", ".search", ".hashes", ".lock"]
 
 class TestDataRecorder(unittest.TestCase):
+    def setUp(self):
+        # no test falls back to the default ./main.json
+        data_recorder.DB_PATH = TEST_DB_PATH
+
+    def tearDown(self):
+        for db_path in [TEST_DB_PATH, TEST_DB_PATH_2]:
+            for suffix in SIDECAR_SUFFIXES:
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
     def test_create_db(self):
         # clean slate, create a fresh db
         if os.path.exists(TEST_DB_PATH):
@@ -45,4 +63,142 @@ class TestDataRecorder(unittest.TestCase):
         test_match = [{"id": "43", "name": "John Smith", "address": "123 Highgate Grove Singapore   323244", "phone": "34323434"}]
         self.assertEqual(matched_entries, test_match)
 
+    def test_search_entries_modes(self):
+        data_entries = [{"id": "43", "name": "John Smith", "address": "123 Highgate Grove Singapore   323244", "phone": "34323434"},
+                        {"id": "23", "name": "Bugs Bunny", "address": "Rabbit Hole London   232323", "phone": "87263162363"}]
+        self.assertEqual(data_recorder.search_entries(data_entries, "bugs", "name", "starts with"), data_entries[1:])
+        self.assertEqual(data_recorder.search_entries(data_entries, "smith", "name", "starts with"), [])
+        self.assertEqual(data_recorder.search_entries(data_entries, "3", "id", "ends with"), data_entries)
+
+    def test_read_json_lines(self):
+        data_recorder.DB_PATH = TEST_DB_PATH_2
+        stream = io.StringIO('{"id": "7", "name": "Anne-^ Rice", "address": "23 Vampire Ave", "phone": "666"}\n'
+                             'not json\n'
+                             '\n'
+                             '{"id": "43", "name": "John Smith"}\n'
+                             '{"name": "No ID"}\n'
+                             '{"id": 7, "name": "Twice"}\n')
+        with contextlib.redirect_stdout(io.StringIO()):
+            data_entries, skipped_entries = data_recorder.read_json_lines(stream)
+        self.assertEqual(data_entries, [{"id": "7", "name": "Anne Rice", "address": "23 Vampire Ave", "phone": "666"}])
+        self.assertEqual(skipped_entries, 4)
+
+    def test_search_data_json(self):
+        data_recorder.DB_PATH = TEST_DB_PATH_2
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+            data_recorder.search_data("name", "bugs", "starts with", "json")
+        self.assertEqual(json.loads(output.getvalue()),
+                         [{"id": "23", "name": "Bugs Bunny", "address": "Rabbit Hole London   232323", "phone": "87263162363"}])
+
+    def test_display_pages(self):
+        data_recorder.DB_PATH = TEST_DB_PATH_2
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            data_recorder.display_text(page=2, limit=1)
+        self.assertIn("Records 2 to 2 of 2 (page 2 of 2):", output.getvalue())
+        self.assertIn("Bugs Bunny", output.getvalue())
+        self.assertNotIn("John Smith", output.getvalue())
+
+        html_display_path = data_recorder.HTML_DISPLAY_PATH
+        data_recorder.HTML_DISPLAY_PATH = "test_cases/test_display.html"
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                data_recorder.display_html(limit=1)
+            with open("test_cases/test_display.html") as filehandler:
+                first_page = filehandler.read()
+            with open("test_cases/test_display-2.html") as filehandler:
+                second_page = filehandler.read()
+            self.assertIn("John Smith", first_page)
+            self.assertIn('<a href="test_display-2.html">Next</a>', first_page)
+            self.assertIn("Bugs Bunny", second_page)
+            self.assertIn('<a href="test_display.html">Previous</a>', second_page)
+            # a db that fits one file gets no pagination
+            with contextlib.redirect_stdout(io.StringIO()):
+                data_recorder.display_html(limit=2)
+            with open("test_cases/test_display.html") as filehandler:
+                self.assertNotIn("<a href", filehandler.read())
+            # the limit is checked like display text does
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                data_recorder.display_html(limit=0)
+                data_recorder.display_html(limit=-1)
+            self.assertEqual(output.getvalue().count("The page and the limit need to be 1 or more."), 2)
+        finally:
+            data_recorder.HTML_DISPLAY_PATH = html_display_path
+            for path in ["test_cases/test_display.html", "test_cases/test_display-2.html"]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def test_parallel_uploads(self):
+        # uploaders that run at the same time neither lose nor duplicate records
+        test_dir = "test_cases/test_parallel"
+        shutil.rmtree(test_dir, ignore_errors=True)
+        os.makedirs(test_dir)
+        try:
+            src_paths = []
+            for uploader in range(4):
+                src_paths.append(os.path.join(test_dir, "upload-%s.csv" % uploader))
+                with open(src_paths[-1], "w") as filehandler:
+                    filehandler.write("id,name,address,phone\n")
+                    # each file shares 500 IDs with the next one
+                    for n_id in range(uploader * 1000 + 1, uploader * 1000 + 1501):
+                        filehandler.write("%s,Name %s,%s Data Ave,%s\n" % (n_id, n_id, n_id, n_id))
+            for db_ext in [".json", ".logdb", ".drc", ".db"]:
+                db_path = os.path.join(test_dir, "main" + db_ext)
+                uploaders = [subprocess.Popen([sys.executable, "data_recorder.py", "--no-banner", "--db", db_path, "upload", "--src", src_path],
+                                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for src_path in src_paths]
+                for uploader in uploaders:
+                    uploader.wait()
+                ids = [str(record.get("id")) for record in get_store(db_path).iter_records()]
+                self.assertEqual(len(ids), 4500, db_ext)
+                self.assertEqual(set(ids), set(str(n_id) for n_id in range(1, 4501)), db_ext)
+        finally:
+            shutil.rmtree(test_dir)
+
+    def test_repeated_id_upload(self):
+        # a file that repeats an ID gets a duplicate warning, not a conflict with another process
+        test_dir = "test_cases/test_repeated"
+        shutil.rmtree(test_dir, ignore_errors=True)
+        os.makedirs(test_dir)
+        try:
+            src_path = os.path.join(test_dir, "upload.csv")
+            with open(src_path, "w") as filehandler:
+                filehandler.write("id,name,address,phone\n1,A,x,1\n1,B,y,2\n2,C,z,3\n")
+            for db_ext in [".json", ".logdb", ".drc", ".db"]:
+                db_path = os.path.join(test_dir, "main" + db_ext)
+                result = subprocess.run([sys.executable, "data_recorder.py", "--no-banner", "--db", db_path, "upload", "--src", src_path],
+                                        capture_output=True, text=True, timeout=60)
+                self.assertNotIn("Another process", result.stdout, db_ext)
+                self.assertIn("Duplicate ID: [1]", result.stdout, db_ext)
+                records = [(str(record.get("id")), record.get("name")) for record in get_store(db_path).iter_records()]
+                self.assertEqual(records, [("1", "A"), ("2", "C")], db_ext)
+        finally:
+            shutil.rmtree(test_dir)
+
+    def test_readers_skip_lock(self):
+        # a search neither waits for a writer of another process nor creates a missing db
+        test_db = "test_cases/test_readers.json"
+        missing_db = "test_cases/test_missing.json"
+        shutil.copy(TEST_DB_PATH_2, test_db)
+        writer = subprocess.Popen([sys.executable, "-c", "import time; from data_store import get_store\n"
+                                   "with get_store(%r).write_lock():\n    print('locked', flush=True); time.sleep(30)" % test_db],
+                                  stdout=subprocess.PIPE, text=True)
+        try:
+            self.assertEqual(writer.stdout.readline().strip(), "locked")
+            found = {}
+            for db_path in [test_db, missing_db]:
+                result = subprocess.run([sys.executable, "data_recorder.py", "--no-banner", "--db", db_path, "search", "--field", "name",
+                                         "--value", "john", "--output", "json"], capture_output=True, text=True, timeout=10)
+                found[db_path] = result.stdout
+            self.assertEqual([record["id"] for record in json.loads(found[test_db])], ["43"])
+            self.assertEqual(os.path.exists(missing_db), False)
+        finally:
+            writer.kill()
+            writer.wait()
+            writer.stdout.close()
+            for path in [test_db] + [test_db + suffix for suffix in SIDECAR_SUFFIXES]:
+                if os.path.exists(path):
+                    os.remove(path)
+
 unittest.main(verbosity=2)
\ No newline at end of file
@@ -0,0 +1,470 @@
+# [2022] This is a library for Data Recorder.
+# Developer: Su Sengupta
+# Test: data_server_tests.py
+
+import os
+import io
+import json
+import asyncio
+import contextlib
+from urllib.parse import urlsplit, parse_qs
+from colorama import Fore
+
+from data_handler import FormatHandler, DataRecord
+from data_store import get_store, match_value, serialize_record, CorruptDBError, SEARCH_MODES, SUPPORTED_RECORDS
+
+SUPPORTED_FORMATS = ["json", "csv", "yaml", "xml", "drc"]
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+MAX_BODY_SIZE = 64 * 1024 * 1024
+# seconds a group commit waits for more requests to join it
+GROUP_COMMIT_DELAY = 0.002
+HTTP_STATUS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    """
+    Raised by a request handler to answer with an error status.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RecordCache:
+    """
+    Keeps the data records of a db in memory between requests, together
+    with a map of their IDs. The cache is checked against the stamp of the
+    db on every request and reloaded if another process wrote to it.
+    New entries are staged in the cache by add() and written by commit(),
+    so the entries of several requests can share one write.
+
+    Attributes
+    ----------
+        db_path (str): file path of the db.
+    """
+    def __init__(self, db_path):
+        self._db_path = db_path
+        self._store = get_store(db_path)
+        self._data_records = []
+        self._positions = {}
+        self._stamp = None
+        self._dirty_records = []
+        self._staged = 0
+        self._batches = {}
+        self._conflicts = {}
+
+    def get_stamp(self):
+        return self._store.get_stamp() if self._store.exists() else None
+
+    def get_records(self):
+        '''
+        Returns
+        -------
+        data_records(list): all data records of the db, oldest first.
+        '''
+        stamp = self.get_stamp()
+        # staged entries are only in the cache, it is reloaded once they are written
+        if stamp != self._stamp and not self._dirty_records:
+            data_records = self._store.pull_from_db().get("data_records")
+            self._positions = dict((str(record.get("id")), position) for position, record in enumerate(data_records))
+            self._data_records, self._stamp = data_records, stamp
+        return self._data_records
+
+    def get_record(self, n_id):
+        data_records = self.get_records()
+        position = self._positions.get(str(n_id))
+        return None if position is None else data_records[position]
+
+    def search(self, search_field, search_value, search_mode="contains"):
+        '''
+        Returns
+        -------
+        found_entries(list): records whose field matches the search.
+        '''
+        data_records = self.get_records()
+        # staged entries are not in the search index yet, they follow the stored ones
+        stored = len(data_records) - len(self._dirty_records)
+        positions = self._store.get_search_candidates(search_field, search_value, search_mode, data_records[:stored] if self._dirty_records else data_records)
+        if positions is not None:
+            positions += range(stored, len(data_records))
+            data_records = [data_records[position] for position in positions if position < len(data_records)]
+        return [record for record in data_records if match_value(record.get(search_field), search_value, search_mode)]
+
+    def add(self, data_entries):
+        '''
+        Stages new, already validated entries in the cache. They are seen
+        by the next requests right away and written to the db by commit().
+
+        Returns
+        -------
+        batch(int): number of the staged batch, see get_conflicts()
+        '''
+        data_records = self.get_records()
+        self._staged += 1
+        for entry in data_entries:
+            self._positions[str(entry.get("id"))] = len(data_records)
+            self._batches[str(entry.get("id"))] = self._staged
+            data_records.append(entry)
+        self._dirty_records.extend(data_entries)
+        return self._staged
+
+    def get_conflicts(self, batch):
+        '''
+        Returns
+        -------
+        conflicts(list): entries of a committed batch that were skipped,
+                         because another process added their IDs first
+        '''
+        return self._conflicts.pop(batch, [])
+
+    def get_staged(self):
+        '''
+        Returns
+        -------
+        staged(int): number of batches staged by add() so far
+        '''
+        return self._staged
+
+    def is_dirty(self):
+        return bool(self._dirty_records)
+
+    def commit(self):
+        '''
+        Writes all the staged entries to the db in one push. If the write
+        fails, the staged entries are dropped and the cache is reloaded
+        from the db by the next request. Entries whose IDs another process
+        added in the meantime are skipped.
+
+        Returns
+        -------
+        committed(int): number of entries written
+        '''
+        dirty_records, self._dirty_records = self._dirty_records, []
+        batches, self._batches = self._batches, {}
+        if not dirty_records:
+            return 0
+        try:
+            pushed, conflicts = self._store.push_new_entries(dirty_records)
+        except BaseException:
+            self._data_records, self._positions, self._stamp = [], {}, False
+            raise
+        # another process added some of the IDs first, its records are reloaded
+        self._stamp = False if conflicts else self.get_stamp()
+        for entry in conflicts:
+            self._conflicts.setdefault(batches.get(str(entry.get("id"))), []).append(entry)
+        return len(pushed)
+
+
+class DataServer:
+    """
+    Serves the records of a db over a local HTTP/JSON API:
+
+        GET  /records?offset=0&limit=100  display the records
+        GET  /records/<id>                look up a record by ID
+        GET  /search?field=name&value=jo&mode=contains
+        POST /records                     add entries, a JSON object or a list of them
+        POST /upload   {"src": path}      upload a file of any supported format
+        POST /download {"dest": path}     download the records into a file
+
+    The server has no authentication, so the files of /upload and /download
+    need to be inside its root directory.
+
+    Attributes
+    ----------
+        db_path (str): file path of the db.
+        root (str): directory of the files that can be uploaded or
+                    downloaded, the working directory by default.
+    """
+    def __init__(self, db_path, group_commit=False, root=None):
+        self._db_path = db_path
+        self._root = os.path.realpath(root or os.getcwd())
+        self._cache = RecordCache(db_path)
+        self._group_commit = group_commit
+        self._commit_task = None
+
+    def handle_request(self, method, target, body=b""):
+        '''
+        Answers a request.
+
+        Parameters
+        ----------
+            method(str): HTTP method, eg. 'GET'
+            target(str): path and query string, eg. '/search?field=name&value=jo'
+            body(bytes): body of the request
+
+        Returns
+        -------
+        status(int): HTTP status
+        payload(object): JSON serializable answer
+        '''
+        url = urlsplit(target)
+        path = url.path.rstrip("/")
+        query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        try:
+            if path == "/records" and method == "GET":
+                return 200, self.display(query)
+            if path.startswith("/records/") and method == "GET":
+                return 200, self.get_record(path[len("/records/"):])
+            if path == "/search" and method == "GET":
+                return 200, self.search(query)
+            if path == "/records" and method == "POST":
+                return 200, self.add(self.parse_body(body))
+            if path == "/upload" and method == "POST":
+                return 200, self.transfer(self.parse_body(body), "src")
+            if path == "/download" and method == "POST":
+                return 200, self.transfer(self.parse_body(body), "dest")
+            if path in ["/records", "/search", "/upload", "/download"]:
+                raise HTTPError(405, "%s is not supported on %s." % (method, path))
+            raise HTTPError(404, "[%s] does not exist." % path)
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except CorruptDBError:
+            return 500, {"error": "db might be corrupted."}
+
+    def parse_body(self, body):
+        try:
+            return json.loads(body or b"null")
+        except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+            raise HTTPError(400, "The body needs to be JSON.")
+
+    def display(self, query):
+        data_records = self._cache.get_records()
+        try:
+            offset = int(query.get("offset", 0))
+            limit = int(query.get("limit", len(data_records) or 1))
+        except ValueError:
+            raise HTTPError(400, "offset and limit need to be numbers.")
+        if offset < 0 or limit < 1:
+            raise HTTPError(400, "offset needs to be 0 or more and limit 1 or more.")
+        return {"total": len(data_records), "data_records": data_records[offset:offset + limit]}
+
+    def get_record(self, n_id):
+        record = self._cache.get_record(n_id)
+        if record is None:
+            raise HTTPError(404, "There is no entry with the id [%s]." % n_id)
+        return record
+
+    def search(self, query):
+        search_field = query.get("field", "").lower()
+        search_value = query.get("value")
+        search_mode = query.get("mode", "contains").lower()
+        if search_field not in SUPPORTED_RECORDS:
+            raise HTTPError(400, "field needs to be one of %s." % SUPPORTED_RECORDS)
+        if search_value is None:
+            raise HTTPError(400, "value is missing.")
+        if search_mode not in SEARCH_MODES:
+            raise HTTPError(400, "mode needs to be one of %s." % SEARCH_MODES)
+        return self._cache.search(search_field, search_value, search_mode)
+
+    def add(self, entries):
+        '''
+        Validates new entries like the add command does and writes them.
+        Entries without an ID or with a duplicate ID are skipped. With
+        group commit, the answer is completed by get_added() once the
+        entries are written.
+        '''
+        if isinstance(entries, dict):
+            entries = [entries]
+        if not isinstance(entries, list):
+            raise HTTPError(400, "The body needs to be an entry or a list of entries.")
+        data_entries = []
+        skipped = []
+        new_ids = set()
+        for entry in entries:
+            if not isinstance(entry, dict):
+                skipped.append({"entry": entry, "error": "not an entry"})
+                continue
+            data_record = DataRecord(entry.get("id", ""), str(entry.get("name", "")), str(entry.get("address", "")), str(entry.get("phone", "")))
+            n_id = data_record.get_id()
+            if not n_id:
+                skipped.append({"entry": entry, "error": "no numeric id"})
+            elif n_id in new_ids or self._cache.get_record(n_id) is not None:
+                skipped.append({"entry": entry, "error": "duplicate id"})
+            else:
+                new_ids.add(n_id)
+                data_entries.append(data_record.to_dict())
+        payload = {"added": len(data_entries), "skipped": skipped}
+        if data_entries:
+            batch = self._cache.add(data_entries)
+            # the server commits the staged entries of all its requests at once, see commit()
+            if not self._group_commit:
+                self._cache.commit()
+                payload = self.get_added(batch, payload)
+        return payload
+
+    def get_added(self, batch, payload):
+        '''
+        Moves the entries of a committed batch that another process added
+        first from 'added' to 'skipped' in the answer of add().
+        '''
+        conflicts = self._cache.get_conflicts(batch)
+        payload["added"] -= len(conflicts)
+        payload["skipped"] += [{"entry": entry, "error": "duplicate id, added by another process"} for entry in conflicts]
+        return payload
+
+    def transfer(self, request, key):
+        '''
+        Uploads a file into the db (key 'src') or downloads the db into
+        a file (key 'dest'). The messages of the transfer are returned.
+        '''
+        file_path = request.get(key) if isinstance(request, dict) else None
+        if not file_path:
+            raise HTTPError(400, "%s is missing." % key)
+        file_ext = os.path.splitext(file_path)[1].split(".")[-1]
+        if file_ext not in SUPPORTED_FORMATS:
+            raise HTTPError(400, "The format [%s] is not supported, please use one of %s." % (file_ext, SUPPORTED_FORMATS))
+        # symlinks are resolved, so they cannot point out of the root either
+        if os.path.commonpath([self._root, os.path.realpath(file_path)]) != self._root:
+            raise HTTPError(403, "[%s] is outside of [%s]." % (file_path, self._root))
+        if key == "src" and not os.path.exists(file_path):
+            raise HTTPError(404, "[%s] does not exist." % file_path)
+        # the transfer reads the db, and checks the uploaded IDs against it
+        self._cache.commit()
+        messages = io.StringIO()
+        with contextlib.redirect_stdout(messages):
+            formathandler = FormatHandler(file_ext, file_path, self._db_path, SUPPORTED_RECORDS)
+            if key == "src":
+                formathandler.upload()
+            else:
+                formathandler.download()
+        return {key: file_path, "messages": [strip_colors(line) for line in messages.getvalue().splitlines() if line]}
+
+    async def handle_connection(self, reader, writer):
+        '''
+        Answers the requests of a connection until the client closes it.
+        A request that fails unexpectedly is answered with a 500 error.
+        '''
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = (request_line.decode("latin-1").split() + ["", "", ""])[:3]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    content_length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    content_length = -1
+                # without a valid length the body cannot be told from the next request
+                if content_length < 0:
+                    status, payload = 400, {"error": "Content-Length needs to be a number of 0 or more."}
+                    keep_alive = False
+                elif content_length > MAX_BODY_SIZE:
+                    status, payload = 413, {"error": "The body is too large."}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(content_length) if content_length else b""
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                    try:
+                        staged = self._cache.get_staged()
+                        status, payload = self.handle_request(method.upper(), target, body)
+                        if self._cache.get_staged() != staged:
+                            status, payload = await self.commit(self._cache.get_staged(), status, payload)
+                    except Exception as e:
+                        print (Fore.RED + "ERROR: %s %s failed: %r" % (method, target, e) + Fore.RESET)
+                        status, payload = 500, {"error": "The request failed: %s" % e}
+                        keep_alive = False
+                data = json.dumps(payload, default=serialize_record).encode("utf-8")
+                writer.write(("HTTP/1.1 %s %s\r\nContent-Type: application/json\r\nContent-Length: %s\r\nConnection: %s\r\n\r\n"
+                              % (status, HTTP_STATUS.get(status, ""), len(data), "keep-alive" if keep_alive else "close")).encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # the server is shutting down while the client keeps the connection open
+            pass
+        finally:
+            writer.close()
+
+    async def commit(self, batch, status, payload):
+        '''
+        Group commit: waits until the entries staged by a request are
+        written to the db. The requests that stage entries while a write
+        is pending join it, so a burst of requests costs one durable write
+        of the db instead of one per request.
+
+        Parameters
+        ----------
+            batch(int): batch staged by the request
+            status(int), payload(object): answer of the request
+
+        Returns
+        -------
+        status(int), payload(object): the answer with the entries that
+                                      were written, or an error if the
+                                      write failed
+        '''
+        if self._commit_task is None:
+            self._commit_task = asyncio.ensure_future(self.run_commits())
+        try:
+            await asyncio.shield(self._commit_task)
+        except CorruptDBError:
+            return 500, {"error": "db might be corrupted."}
+        except OSError as e:
+            return 500, {"error": "The entries could not be written: %s" % e}
+        return status, self.get_added(batch, payload)
+
+    async def run_commits(self):
+        '''
+        Commits the staged entries until none are left.
+        '''
+        try:
+            while self._cache.is_dirty():
+                # let the requests that already arrived stage their entries first
+                await asyncio.sleep(GROUP_COMMIT_DELAY)
+                self._cache.commit()
+        finally:
+            self._commit_task = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        '''
+        Starts listening, the records are loaded before the first request.
+        New entries are group committed from then on, see commit().
+
+        Returns
+        -------
+        server(asyncio.Server): the running server
+        '''
+        self._group_commit = True
+        self._cache.get_records()
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+def strip_colors(line):
+    for color in [Fore.RED, Fore.YELLOW, Fore.GREEN, Fore.CYAN, Fore.MAGENTA, Fore.RESET]:
+        line = line.replace(color, "")
+    return line
+
+
+def serve(db_path, host=DEFAULT_HOST, port=DEFAULT_PORT, root=None):
+    '''
+    Serves the records of a db until the process is interrupted.
+
+    Parameters
+    ----------
+        db_path(str): file path of the db
+        host(str): address to listen on, local only by default
+        port(int): port to listen on
+        root(str): directory of the files that can be uploaded or
+                   downloaded, the working directory by default
+    '''
+    async def run():
+        server = await DataServer(db_path, root=root).start(host, port)
+        print (Fore.GREEN + "Serving [%s] on http://%s:%s/" % (db_path, host, port) + Fore.RESET)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print ("Stopped serving [%s]." % db_path)
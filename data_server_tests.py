@@ -0,0 +1,231 @@
+import unittest
+import os
+import io
+import json
+import shutil
+import asyncio
+import contextlib
+from data_server import DataServer
+from data_store import STORES, get_store
+
+TEST_DB_PATH = "test_cases/test_db.json"
+TEST_SERVER_PATH = "test_cases/test_server.json"
+TEST_DOWNLOAD_PATH = "test_cases/test_server_download.csv"
+# files the stores keep next to a db: ID index, search index, hashes and write lock
+SIDECAR_SUFFIXES = [".ids", ".search", ".hashes", ".lock"]
+
+class TestDataServer(unittest.TestCase):
+    def setUp(self):
+        for path in [TEST_SERVER_PATH, TEST_DOWNLOAD_PATH] + [TEST_SERVER_PATH + suffix for suffix in SIDECAR_SUFFIXES]:
+            if os.path.exists(path):
+                os.remove(path)
+        STORES.clear()
+        shutil.copy(TEST_DB_PATH, TEST_SERVER_PATH)
+
+    def tearDown(self):
+        self.setUp()
+        os.remove(TEST_SERVER_PATH)
+
+    def test_display(self):
+        server = DataServer(TEST_SERVER_PATH)
+        status, payload = server.handle_request("GET", "/records?offset=1&limit=5")
+        self.assertEqual(status, 200)
+        self.assertEqual(payload.get("total"), 2)
+        self.assertEqual(payload.get("data_records"), [{"id": "23", "name": "Bugs Bunny", "address": "Rabbit Hole London   232323", "phone": "87263162363"}])
+        for target in ["/records?offset=-1", "/records?limit=-1", "/records?limit=0", "/records?offset=x"]:
+            self.assertEqual(server.handle_request("GET", target)[0], 400, target)
+
+    def test_get_record(self):
+        server = DataServer(TEST_SERVER_PATH)
+        self.assertEqual(server.handle_request("GET", "/records/43")[1].get("name"), "John Smith")
+        self.assertEqual(server.handle_request("GET", "/records/7")[0], 404)
+
+    def test_search(self):
+        server = DataServer(TEST_SERVER_PATH)
+        status, payload = server.handle_request("GET", "/search?field=name&value=bugs&mode=starts%20with")
+        self.assertEqual(status, 200)
+        self.assertEqual([record.get("id") for record in payload], ["23"])
+        self.assertEqual(server.handle_request("GET", "/search?field=age&value=1")[0], 400)
+
+    def test_add(self):
+        server = DataServer(TEST_SERVER_PATH)
+        entries = [{"id": "7", "name": "Anne-^ Rice", "address": "23 Vampire Ave", "phone": "666"},
+                   {"id": "43", "name": "Duplicate"},
+                   {"name": "No ID"}]
+        status, payload = server.handle_request("POST", "/records", json.dumps(entries).encode("utf-8"))
+        self.assertEqual(status, 200)
+        self.assertEqual(payload.get("added"), 1)
+        self.assertEqual(len(payload.get("skipped")), 2)
+        self.assertEqual(server.handle_request("GET", "/records/7")[1].get("name"), "Anne Rice")
+        # the entry was written to the db before the answer
+        with open(TEST_SERVER_PATH) as filehandler:
+            self.assertEqual(len(json.load(filehandler).get("data_records")), 3)
+        self.assertEqual(server.handle_request("POST", "/records", b"not json")[0], 400)
+
+    def test_add_conflict(self):
+        store = STORES.setdefault(TEST_SERVER_PATH, get_store(TEST_SERVER_PATH))
+        push_new_entries = store.push_new_entries
+
+        races = [True, True]
+
+        def push_after_other_process(data_entries):
+            # another process adds the first ID after the request checked it, once per part of the test
+            if races and races.pop():
+                store.push_to_db([{"id": data_entries[0].get("id"), "name": "Other Process", "address": "", "phone": ""}])
+            return push_new_entries(data_entries)
+        store.push_new_entries = push_after_other_process
+
+        async def post(server, n_ids):
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            body = json.dumps([{"id": str(n_id), "name": "Name %s" % n_id} for n_id in n_ids]).encode("utf-8")
+            writer.write(b"POST /records HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+            answer = await reader.read()
+            writer.close()
+            return json.loads(answer.split(b"\r\n\r\n", 1)[1])
+
+        async def request():
+            server = await DataServer(TEST_SERVER_PATH).start("127.0.0.1", 0)
+            answers = await asyncio.gather(post(server, [9, 10]), post(server, [11]))
+            server.close()
+            await server.wait_closed()
+            return answers
+
+        # the answer is built from the commit, without and with group commit
+        server = DataServer(TEST_SERVER_PATH)
+        payload = server.handle_request("POST", "/records", json.dumps([{"id": "7", "name": "Anne Rice"}, {"id": "8"}]).encode("utf-8"))[1]
+        self.assertEqual(payload.get("added"), 1)
+        self.assertEqual(payload.get("skipped"), [{"entry": {"id": "7", "name": "Anne Rice", "address": "", "phone": ""}, "error": "duplicate id, added by another process"}])
+        self.assertEqual(server.handle_request("GET", "/records/7")[1].get("name"), "Other Process")
+        answers = asyncio.run(request())
+        self.assertEqual(sum(answer.get("added") for answer in answers), 2)
+        self.assertEqual(sum(len(answer.get("skipped")) for answer in answers), 1)
+        with open(TEST_SERVER_PATH) as filehandler:
+            self.assertEqual(len(json.load(filehandler).get("data_records")), 7)
+
+    def test_upload_download(self):
+        server = DataServer(TEST_SERVER_PATH)
+        status, payload = server.handle_request("POST", "/upload", json.dumps({"src": "uploads/upload.csv"}).encode("utf-8"))
+        self.assertEqual(status, 200)
+        total = server.handle_request("GET", "/records")[1].get("total")
+        self.assertGreater(total, 2)
+        server.handle_request("POST", "/download", json.dumps({"dest": TEST_DOWNLOAD_PATH}).encode("utf-8"))
+        with open(TEST_DOWNLOAD_PATH) as filehandler:
+            self.assertEqual(len(filehandler.readlines()), total + 1)
+
+    def test_transfer_root(self):
+        server = DataServer(TEST_SERVER_PATH, root="uploads")
+        self.assertEqual(server.handle_request("POST", "/upload", json.dumps({"src": "uploads/upload.csv"}).encode("utf-8"))[0], 200)
+        # files outside of the root are refused, before they are read or written
+        for key, file_path in [("src", TEST_DB_PATH.replace(".json", ".csv")), ("src", "uploads/../test_cases/test_data.csv"), ("dest", TEST_DOWNLOAD_PATH)]:
+            status, payload = server.handle_request("POST", "/upload" if key == "src" else "/download", json.dumps({key: file_path}).encode("utf-8"))
+            self.assertEqual(status, 403)
+            self.assertIn("outside", payload.get("error"))
+        self.assertFalse(os.path.exists(TEST_DOWNLOAD_PATH))
+
+    def test_http(self):
+        async def request():
+            server = await DataServer(TEST_SERVER_PATH).start("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            answers = []
+            for target in ["/records/23", "/records/7"]:
+                writer.write(("GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % target).encode("latin-1"))
+                await writer.drain()
+                status_line = await reader.readline()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length")))
+                answers.append((status_line.split()[1], json.loads(body)))
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return answers
+
+        answers = asyncio.run(request())
+        self.assertEqual(answers[0][0], b"200")
+        self.assertEqual(answers[0][1].get("name"), "Bugs Bunny")
+        self.assertEqual(answers[1][0], b"404")
+
+    def test_http_content_length(self):
+        async def request(content_length):
+            server = await DataServer(TEST_SERVER_PATH).start("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(("POST /records HTTP/1.1\r\nHost: localhost\r\nContent-Length: %s\r\n\r\n{}" % content_length).encode("latin-1"))
+            await writer.drain()
+            answer = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return answer
+
+        # a length the body cannot be read with is answered, and the connection closed after it
+        for content_length in ["-2", "two", "\xb2"]:
+            answer = asyncio.run(request(content_length))
+            self.assertTrue(answer.startswith(b"HTTP/1.1 400 "), content_length)
+            self.assertIn(b"Connection: close", answer)
+            self.assertIn("Content-Length", json.loads(answer.split(b"\r\n\r\n", 1)[1]).get("error"))
+
+    def test_http_error(self):
+        async def request():
+            data_server = DataServer(TEST_SERVER_PATH)
+            data_server.display = lambda query: 1 / 0
+            server = await data_server.start("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /records HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            await writer.drain()
+            answer = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return answer
+
+        messages = io.StringIO()
+        with contextlib.redirect_stdout(messages):
+            answer = asyncio.run(request())
+        # the unexpected error is answered, and the connection closed after it
+        self.assertTrue(answer.startswith(b"HTTP/1.1 500 "))
+        self.assertIn(b"Connection: close", answer)
+        self.assertIn("division by zero", json.loads(answer.split(b"\r\n\r\n", 1)[1]).get("error"))
+        self.assertIn("GET /records failed", messages.getvalue())
+
+    def test_group_commit(self):
+        store = STORES.setdefault(TEST_SERVER_PATH, get_store(TEST_SERVER_PATH))
+        writes = []
+        push_to_db = store.push_to_db
+        store.push_to_db = lambda data_entries: writes.append(len(data_entries)) or push_to_db(data_entries)
+
+        async def post(port, n_id):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            body = json.dumps({"id": str(n_id), "name": "Name %s" % n_id, "address": "", "phone": ""}).encode("utf-8")
+            writer.write(b"POST /records HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+            answer = await reader.read()
+            writer.close()
+            return answer.split()[1]
+
+        async def request():
+            server = await DataServer(TEST_SERVER_PATH).start("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            answers = await asyncio.gather(*[post(port, n_id) for n_id in range(100, 110)])
+            server.close()
+            await server.wait_closed()
+            return answers
+
+        answers = asyncio.run(request())
+        self.assertEqual(answers, [b"200"] * 10)
+        # every request was answered after its entry was written, in fewer writes than requests
+        self.assertEqual(sum(writes), 10)
+        self.assertLess(len(writes), 10)
+        with open(TEST_SERVER_PATH) as filehandler:
+            self.assertEqual(len(json.load(filehandler).get("data_records")), 12)
+
+unittest.main(verbosity=2)
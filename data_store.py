@@ -0,0 +1,2286 @@
+# [2022] This is a library for Data Recorder.
+# Developer: Su Sengupta
+# Test: data_store_tests.py
+
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+import hashlib
+import itertools
+import textwrap
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError: # windows
+    fcntl = None
+    import msvcrt
+
+SUPPORTED_RECORDS = ["id", "name", "address", "phone"]
+SQLITE_EXTENSIONS = [".db", ".sqlite", ".sqlite3"]
+LOG_EXTENSIONS = [".logdb"]
+COLUMNAR_EXTENSIONS = [".drc"]
+READ_SIZE = 64 * 1024
+# most dirty records a group commit waits for, see DBSession.get_flush_size()
+GROUP_COMMIT_SIZE = 10000
+# the string encoder of json.dumps(), in C where available
+encode_json_string = json.encoder.encode_basestring_ascii
+# end of a main.json written by JSONStore.write_db(), with and without records
+JSON_TAIL = b"\n    ]\n}"
+JSON_EMPTY_TAIL = b"[]\n}"
+# IDs bound to one sqlite3 query, older sqlite3 builds allow at most 999 variables
+SQLITE_BATCH_SIZE = 500
+
+SEARCH_MODES = ["contains", "starts with", "ends with"]
+# mark the start and the end of a field, so trigrams can anchor a search
+START_MARK = "\x02"
+END_MARK = "\x03"
+
+# storage backends already opened by this process, by db path
+STORES = {}
+
+
+class CorruptDBError(Exception):
+    """
+    Raised by a storage backend when the db cannot be read.
+    """
+
+
+class Record:
+    """
+    Compact, read-only form of a data record pulled from the db.
+    Uses __slots__ instead of a dict per record, but answers the
+    same get/values/items calls and compares equal to its dict.
+
+    Attributes
+    ----------
+        id (str): ID of the employee
+        name (str): Name of the employee
+        address (str): Address of the employee
+        phone (str): Phone number of the employee
+    """
+    __slots__ = ("id", "name", "address", "phone")
+
+    def __init__(self, n_id, name, address, phone):
+        self.id = n_id
+        self.name = name
+        self.address = address
+        self.phone = phone
+
+    def get(self, key, default=None):
+        if key in SUPPORTED_RECORDS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key not in SUPPORTED_RECORDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def keys(self):
+        return list(SUPPORTED_RECORDS)
+
+    def values(self):
+        return [self.id, self.name, self.address, self.phone]
+
+    def items(self):
+        return list(zip(SUPPORTED_RECORDS, self.values()))
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "address": self.address, "phone": self.phone}
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self.values() == other.values()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "Record(%r)" % self.to_dict()
+
+
+def compact_record(entry):
+    '''
+    Turns a data record dict into a Record. Dicts that do not have
+    exactly the supported fields, in order, are returned as they are.
+    Used as the object_hook of json.load.
+    '''
+    if isinstance(entry, dict) and tuple(entry) == Record.__slots__:
+        return Record(*entry.values())
+    return entry
+
+
+def serialize_record(value):
+    '''
+    Turns a Record back into a dict. Used as the default of json.dump.
+    '''
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError("Object of type %s is not JSON serializable" % type(value).__name__)
+
+
+@contextlib.contextmanager
+def open_atomic(file_path, mode="w"):
+    '''
+    Opens a temporary file next to file_path for writing, eg.
+    main.json.<pid>-<thread>.tmp. Once the block
+    is done, the file is synced to disk and renamed over file_path, so a
+    crash or a Ctrl-C in the middle of a write leaves either the old file
+    or the new one, never a truncated one. If the block fails, file_path
+    is left untouched.
+
+    Parameters
+    ----------
+        file_path(str): file to replace, eg. ./main.json
+        mode(str): 'w' or 'wb'
+    '''
+    tmp_path = "%s.%s-%s.tmp" % (file_path, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_path, mode) as filehandler:
+            yield filehandler
+            filehandler.flush()
+            os.fsync(filehandler.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    sync_directory(os.path.dirname(file_path))
+
+
+def format_json_record(entry):
+    '''
+    Returns
+    -------
+    text(str): the entry as write_db() lays out a record of main.json. Flat
+               records skip the pure python encoder json.dumps() uses with an indent
+    '''
+    record = entry if isinstance(entry, dict) else serialize_record(entry)
+    fields = []
+    for key, value in record.items():
+        if not isinstance(key, str) or isinstance(value, (dict, list, tuple)):
+            fields = None
+            break
+        fields.append("            %s: %s" % (encode_json_string(key),
+                      encode_json_string(value) if isinstance(value, str) else json.dumps(value)))
+    if not fields:
+        return textwrap.indent(json.dumps(record, indent=4, default=serialize_record), " " * 8)
+    return "        {\n%s\n        }" % ",\n".join(fields)
+
+
+def copy_bytes(src_handler, dest_handler, total_bytes):
+    '''
+    Copies the first total_bytes of a file opened in binary mode to
+    another one. The kernel copies them where it can (copy_file_range
+    on linux), so they are not read into python.
+    '''
+    copy_file_range = getattr(os, "copy_file_range", None)
+    offset = 0
+    if copy_file_range is not None:
+        dest_handler.flush()
+        try:
+            while offset < total_bytes:
+                copied = copy_file_range(src_handler.fileno(), dest_handler.fileno(), total_bytes - offset, offset)
+                if not copied:
+                    break
+                offset += copied
+        except OSError:
+            # eg. files on two different file systems before linux 5.19
+            pass
+        dest_handler.seek(offset)
+        src_handler.seek(offset)
+    while offset < total_bytes:
+        data = src_handler.read(min(total_bytes - offset, READ_SIZE * 16))
+        if not data:
+            raise CorruptDBError("%s was truncated while it was copied" % src_handler.name)
+        dest_handler.write(data)
+        offset += len(data)
+
+
+def sync_directory(dir_path):
+    '''
+    Syncs a directory to disk, so a file renamed into it survives a crash.
+    Not every platform can open a directory, eg. windows, it is skipped there.
+    '''
+    try:
+        dir_fd = os.open(dir_path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+class FileLock:
+    """
+    Lock shared by all the processes writing to a db, held on a sidecar
+    file, eg. main.json.lock. It is reentrant, so a method holding it can
+    call others that take it too, and the threads of a process take turns
+    on it. Readers never take it: the writes replace the db atomically
+    (see open_atomic()) or append whole lines, so a reader sees either
+    the old records or the new ones.
+
+    Attributes
+    ----------
+        lock_path (str): file path of the sidecar file.
+    """
+    def __init__(self, lock_path):
+        self._lock_path = lock_path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._filehandler = None
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._filehandler = open(self._lock_path, 'a+b')
+                if fcntl is not None:
+                    fcntl.flock(self._filehandler.fileno(), fcntl.LOCK_EX)
+                else:
+                    self.lock_windows()
+            except BaseException:
+                if self._filehandler:
+                    self._filehandler.close()
+                    self._filehandler = None
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def lock_windows(self):
+        self._filehandler.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._filehandler.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after 10 seconds, keep waiting
+                continue
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._filehandler.fileno(), fcntl.LOCK_UN)
+            else:
+                self._filehandler.seek(0)
+                msvcrt.locking(self._filehandler.fileno(), msvcrt.LK_UNLCK, 1)
+            self._filehandler.close()
+            self._filehandler = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class JSONStreamReader:
+    """
+    Incremental parser for .json files of the form {"data_records": [...]}.
+    The file is read in blocks and the entries of the array are decoded
+    one at a time, so the whole document is never held in memory.
+
+    Attributes
+    ----------
+        filehandler (file): the open .json file
+    """
+    def __init__(self, filehandler):
+        self._filehandler = filehandler
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+        self._values = {}
+
+    def read_more(self):
+        '''
+        Reads the next block of the file into the buffer.
+        Returns False once the end of the file is reached.
+        '''
+        if self._eof:
+            return False
+        # drop everything that has already been decoded
+        self._buffer = self._buffer[self._position:]
+        self._position = 0
+        data = self._filehandler.read(max(READ_SIZE, len(self._buffer)))
+        if not data:
+            self._eof = True
+            return False
+        self._buffer += data
+        return True
+
+    def next_char(self):
+        '''
+        Skips whitespace and returns the next character without
+        consuming it, or an empty string at the end of the file.
+        '''
+        while True:
+            while self._position < len(self._buffer) and self._buffer[self._position] in " \t\r\n":
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self.read_more():
+                return ""
+
+    def expect(self, chars):
+        char = self.next_char()
+        if not char or char not in chars:
+            raise json.decoder.JSONDecodeError("Expecting one of %s" % list(chars), self._buffer, self._position)
+        self._position += 1
+        return char
+
+    def decode_value(self):
+        self.next_char()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+                # a value that ends with the buffer might continue in the next block
+                if end < len(self._buffer) or self._eof:
+                    self._position = end
+                    return value
+            except json.decoder.JSONDecodeError:
+                if self._eof:
+                    raise
+            self.read_more()
+
+    def get_value(self, key):
+        '''
+        Returns the value of another key of the top level object,
+        once iter_array() has read past it.
+        '''
+        return self._values.get(key)
+
+    def iter_array(self, key):
+        '''
+        Yields the items of the array stored under a key of the top level object.
+
+        Parameters
+        ----------
+            key(str): the key of the array, eg. "data_records"
+        '''
+        if self.next_char() != "{":
+            return
+        self._position += 1
+        if self.next_char() == "}":
+            return
+        while True:
+            name = self.decode_value()
+            self.expect(":")
+            if name == key and self.next_char() == "[":
+                self._position += 1
+                if self.next_char() == "]":
+                    self._position += 1
+                else:
+                    while True:
+                        yield self.decode_value()
+                        if self.expect(",]") == "]":
+                            break
+            else:
+                self._values[name] = self.decode_value()
+            if self.expect(",}") == "}":
+                return
+
+
+class IDIndex:
+    """
+    Persisted index of the IDs stored in a db, kept in a sidecar file.
+    The index is saved together with a stamp (modification time and size)
+    of the db files and is only trusted while the stamp still matches,
+    so edits made to the db behind our back are picked up.
+
+    The file starts with a fixed size header holding the stamp and the
+    number of records, followed by one ID per line, so the IDs of a new
+    batch can be appended without rewriting the whole index.
+
+    Attributes
+    ----------
+        index_path (str): file path of the sidecar file.
+    """
+    HEADER_SIZE = 128
+
+    def __init__(self, index_path):
+        self._index_path = index_path
+
+    def format_header(self, db_size, stamp):
+        digest = hashlib.sha1(json.dumps(stamp).encode('utf-8')).hexdigest()
+        header = json.dumps({"stamp": digest, "size": db_size})
+        return (header.ljust(self.HEADER_SIZE - 1) + "\n").encode('utf-8')
+
+    def load(self, stamp):
+        '''
+        Returns
+        -------
+        ids(set): IDs stored in the db, None if the index is stale or missing
+        db_size(int): Number of total entries in the db.
+        '''
+        try:
+            with open(self._index_path, 'rb') as filehandler:
+                header = filehandler.read(self.HEADER_SIZE)
+                db_size = json.loads(header).get("size")
+                if header != self.format_header(db_size, stamp):
+                    return None, 0
+                ids = self.parse_body(filehandler.read().decode('utf-8'))
+        except (OSError, ValueError, AttributeError):
+            return None, 0
+        return ids, db_size
+
+    def parse_body(self, body):
+        return set(body.split("\n")[:-1])
+
+    def format_body(self, ids):
+        '''
+        Returns
+        -------
+        body(str): one ID per line, None if an ID cannot be stored that way
+        '''
+        if any("\n" in n_id for n_id in ids):
+            return None
+        return "".join(n_id + "\n" for n_id in ids)
+
+    def save(self, ids, db_size, stamp):
+        body = self.format_body(ids)
+        if body is None:
+            return
+        tmp_path = "%s.%s-%s.tmp" % (self._index_path, os.getpid(), threading.get_ident())
+        try:
+            with open(tmp_path, 'wb') as filehandler:
+                filehandler.write(self.format_header(db_size, stamp))
+                filehandler.write(body.encode('utf-8'))
+            os.replace(tmp_path, self._index_path)
+        except OSError:
+            # the index is only a cache, the db stays the source of truth
+            pass
+
+    def append(self, new_ids, old_size, old_stamp, db_size, stamp):
+        '''
+        Appends the IDs of a new batch to the index. Only works if the
+        index on disk is the one saved with the old stamp and size.
+
+        Returns
+        -------
+        bool: True if the index was updated
+        '''
+        body = self.format_body(new_ids)
+        if body is None:
+            return False
+        try:
+            with open(self._index_path, 'r+b') as filehandler:
+                if filehandler.read(self.HEADER_SIZE) != self.format_header(old_size, old_stamp):
+                    return False
+                filehandler.seek(0, os.SEEK_END)
+                filehandler.write(body.encode('utf-8'))
+                filehandler.seek(0)
+                filehandler.write(self.format_header(db_size, stamp))
+        except OSError:
+            return False
+        return True
+
+    def is_fresh(self, stamp):
+        '''
+        Only reads the header of the index.
+
+        Returns
+        -------
+        bool: True if the index was saved with this stamp of the db
+        '''
+        return self.get_size(stamp) is not None
+
+    def get_size(self, stamp):
+        '''
+        Only reads the header of the index.
+
+        Returns
+        -------
+        db_size(int): Number of total entries in the db, None if the index is stale or missing
+        '''
+        try:
+            with open(self._index_path, 'rb') as filehandler:
+                header = filehandler.read(self.HEADER_SIZE)
+            db_size = json.loads(header).get("size")
+            return db_size if header == self.format_header(db_size, stamp) else None
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def restamp(self, old_stamp, stamp):
+        '''
+        Moves the index over to a new stamp of the db, for when the files
+        of the db changed without changing the records.
+
+        Returns
+        -------
+        bool: True if the index was saved with the old stamp and was updated
+        '''
+        try:
+            with open(self._index_path, 'r+b') as filehandler:
+                header = filehandler.read(self.HEADER_SIZE)
+                db_size = json.loads(header).get("size")
+                if header != self.format_header(db_size, old_stamp):
+                    return False
+                filehandler.seek(0)
+                filehandler.write(self.format_header(db_size, stamp))
+        except (OSError, ValueError, AttributeError):
+            return False
+        return True
+
+
+class SearchIndex(IDIndex):
+    """
+    Persisted trigram index of the fields of the records in a db, kept
+    in a sidecar file next to the ID index and trusted the same way.
+
+    For every field, each trigram of the lower cased value maps to the
+    positions (in pull_from_db order) of the records that contain it.
+    Every line of the file holds the postings of one batch of records,
+    so a new batch is appended without rewriting the whole index.
+    """
+    def parse_body(self, body):
+        postings = dict((field, {}) for field in SUPPORTED_RECORDS)
+        for line in body.split("\n")[:-1]:
+            merge_postings(postings, json.loads(line))
+        return postings
+
+    def format_body(self, postings):
+        return json.dumps(postings, separators=(",", ":")) + "\n"
+
+
+class HashIndex(IDIndex):
+    """
+    Persisted hash of the content of every record in a db, by ID, kept
+    in a sidecar file next to the ID index and trusted the same way.
+    Used by upsert_entries() to tell changed records from unchanged ones
+    without reading the db.
+    """
+    def parse_body(self, body):
+        return dict(line.split("\t") for line in body.split("\n")[:-1])
+
+    def format_body(self, hashes):
+        if any("\n" in n_id or "\t" in n_id for n_id in hashes):
+            return None
+        return "".join("%s\t%s\n" % (n_id, record_hash) for n_id, record_hash in hashes.items())
+
+
+def hash_record(record):
+    '''
+    Returns
+    -------
+    record_hash(str): hash of the fields of a record other than its ID,
+                      the same for records that only differ by type, eg. 7 and "7"
+    '''
+    content = "\x1f".join("" if record.get(field) is None else str(record.get(field)) for field in SUPPORTED_RECORDS[1:])
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+def get_trigrams(text):
+    '''
+    Returns
+    -------
+    trigrams(set): every 3 character slice of the text
+    '''
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def get_search_key(search_value, search_mode="contains"):
+    '''
+    Returns the text that every field matching a search contains,
+    anchored to the start or the end of the field if the mode asks.
+    '''
+    search_value = search_value.lower()
+    if search_mode == "starts with":
+        return START_MARK + search_value
+    if search_mode == "ends with":
+        return search_value + END_MARK
+    return search_value
+
+
+def match_value(value, search_value, search_mode="contains"):
+    '''
+    Returns
+    -------
+    bool: True if the field value matches the search, ignoring case.
+    '''
+    value = str(value).lower()
+    search_value = search_value.lower()
+    if search_mode == "starts with":
+        return value.startswith(search_value)
+    if search_mode == "ends with":
+        return value.endswith(search_value)
+    return search_value in value
+
+
+def build_postings(data_records, start=0):
+    '''
+    Indexes the trigrams of the fields of data records.
+
+    Parameters
+    ----------
+        data_records(list): records to index
+        start(int): position of the first record in the db
+
+    Returns
+    -------
+    postings(dict): {field: {trigram: [positions]}}
+    '''
+    postings = dict((field, {}) for field in SUPPORTED_RECORDS)
+    for position, record in enumerate(data_records, start):
+        for field in SUPPORTED_RECORDS:
+            field_postings = postings[field]
+            for trigram in get_trigrams(START_MARK + str(record.get(field)).lower() + END_MARK):
+                if trigram in field_postings:
+                    field_postings[trigram].append(position)
+                else:
+                    field_postings[trigram] = [position]
+    return postings
+
+
+def merge_postings(postings, new_postings):
+    '''
+    Adds the postings of a later batch of records to postings.
+    '''
+    for field, field_postings in new_postings.items():
+        field_postings_so_far = postings.setdefault(field, {})
+        for trigram, positions in field_postings.items():
+            if trigram in field_postings_so_far:
+                field_postings_so_far[trigram].extend(positions)
+            else:
+                field_postings_so_far[trigram] = positions
+
+
+class DataStore:
+    """
+    Base class for the storage backends of Data Recorder.
+    A backend owns the db file and is responsible for reading
+    and writing the data records to it.
+
+    Attributes
+    ----------
+        db_path (str): file path of the db.
+    """
+    # True if every write rewrites the whole db, see DBSession.get_flush_size()
+    rewrites_db = False
+
+    def __init__(self, db_path):
+        self._db_path = db_path
+        self._id_index = IDIndex(self.get_id_index_path())
+        self._ids = None
+        self._size = 0
+        self._stamp = None
+        self._search_index = SearchIndex(self.get_search_index_path())
+        self._postings = None
+        self._postings_stamp = None
+        self._hash_index = HashIndex(self.get_hash_index_path())
+        self._hashes = None
+        self._hashes_stamp = None
+        self._write_lock = FileLock(self.get_lock_path())
+
+    def get_db_path(self):
+        return self._db_path
+
+    def get_lock_path(self):
+        return self._db_path + ".lock"
+
+    def write_lock(self):
+        '''
+        Returns
+        -------
+        lock(FileLock): lock held by the process writing to the db, the
+                        writes of the stores take it themselves
+        '''
+        return self._write_lock
+
+    def push_new_entries(self, data_entries):
+        '''
+        Pushes the entries whose IDs are not in the db yet. The IDs are
+        checked under the write lock, so entries that another process
+        added since they were checked for duplicates are not added twice.
+        The callers drop the entries that repeat an ID beforehand, see
+        FormatHandler.remove_duplicates(), any left are only pushed once.
+
+        Returns
+        -------
+        pushed(list): entries pushed, conflicts(list): entries skipped
+                      because their IDs were already in the db
+        '''
+        with self.write_lock():
+            ids = self.get_existing_ids(str(entry.get("id")) for entry in data_entries)
+            pushed, conflicts, new_ids = [], [], set()
+            for entry in data_entries:
+                n_id = str(entry.get("id"))
+                if n_id in ids:
+                    conflicts.append(entry)
+                elif n_id not in new_ids:
+                    new_ids.add(n_id)
+                    pushed.append(entry)
+            if pushed:
+                self.create_db()
+                self.push_to_db(pushed)
+        return pushed, conflicts
+
+    def get_id_index_path(self):
+        return self._db_path + ".ids"
+
+    def get_search_index_path(self):
+        return self._db_path + ".search"
+
+    def get_hash_index_path(self):
+        return self._db_path + ".hashes"
+
+    def get_stamp(self):
+        '''
+        Returns
+        -------
+        stamp(list): modification time and size of the db files,
+                     used to tell whether the ID index is up to date.
+        '''
+        db_stat = os.stat(self._db_path)
+        return [db_stat.st_mtime_ns, db_stat.st_size]
+
+    def load_ids(self):
+        '''
+        Loads the IDs of the db from the ID index. The db is only parsed
+        when the index is stale, and the index is rebuilt from it.
+        '''
+        if not self.exists():
+            self._ids, self._size, self._stamp = set(), 0, None
+            return
+        stamp = self.get_stamp()
+        if self._ids is not None and self._stamp == stamp:
+            return
+        ids, db_size = self._id_index.load(stamp)
+        if ids is None:
+            data_records = self.pull_from_db().get("data_records")
+            ids = set(str(record.get("id")) for record in data_records)
+            db_size = len(data_records)
+            self._id_index.save(ids, db_size, stamp)
+        self._ids, self._size, self._stamp = ids, db_size, stamp
+
+    def index_entries(self, data_entries):
+        '''
+        Adds entries that were just written to the db to the ID index.
+        load_ids() needs to be called before the write.
+
+        Parameters
+        ----------
+            data_entries(list): list of new data records
+        '''
+        new_ids = [str(entry.get("id")) for entry in data_entries]
+        old_size, old_stamp = self._size, self._stamp
+        self._ids.update(new_ids)
+        self._size += len(data_entries)
+        self._stamp = self.get_stamp()
+        if not self._id_index.append(new_ids, old_size, old_stamp, self._size, self._stamp):
+            self._id_index.save(self._ids, self._size, self._stamp)
+        self.index_search(data_entries, old_size, old_stamp, self._size, self._stamp)
+        self.index_hashes(data_entries, old_size, old_stamp, self._size, self._stamp)
+
+    def index_hashes(self, data_entries, old_size, old_stamp, db_size, stamp):
+        '''
+        Appends the hashes of entries that were just written to the db to
+        the hash index. Nothing is done if there is no index yet, it will
+        be built by the first upload --delta.
+        '''
+        if not os.path.exists(self.get_hash_index_path()):
+            return
+        new_hashes = dict((str(entry.get("id")), hash_record(entry)) for entry in data_entries)
+        if not self._hash_index.append(new_hashes, old_size, old_stamp, db_size, stamp):
+            return
+        if self._hashes is not None and self._hashes_stamp == old_stamp:
+            self._hashes.update(new_hashes)
+            self._hashes_stamp = stamp
+
+    def get_hashes(self):
+        '''
+        Loads the hash index of the db, it is built from the records
+        and saved when it is missing or stale.
+
+        Returns
+        -------
+        hashes(dict): {id: hash of the record, see hash_record()}
+        '''
+        if not self.exists():
+            return {}
+        stamp = self.get_stamp()
+        if self._hashes is not None and self._hashes_stamp == stamp:
+            return self._hashes
+        hashes, db_size = self._hash_index.load(stamp)
+        if hashes is None:
+            hashes, db_size = {}, 0
+            for record in self.iter_records():
+                hashes[str(record.get("id"))] = hash_record(record)
+                db_size += 1
+            self._hash_index.save(hashes, db_size, stamp)
+        self._hashes, self._hashes_stamp = hashes, stamp
+        return hashes
+
+    def upsert_entries(self, data_entries):
+        '''
+        Adds the entries whose IDs are new, replaces the records whose
+        content changed and leaves the others alone, under the write lock.
+        Of entries with the same ID, the last one is kept.
+
+        Returns
+        -------
+        inserted(int), updated(int), unchanged(int): entries of each kind
+        '''
+        with self.write_lock():
+            self.create_db()
+            hashes = self.get_hashes()
+            inserted, updated, unchanged = [], [], 0
+            new_hashes = {}
+            for n_id, entry in dict((str(entry.get("id")), entry) for entry in data_entries).items():
+                record_hash = hash_record(entry)
+                old_hash = hashes.get(n_id)
+                if old_hash == record_hash:
+                    unchanged += 1
+                    continue
+                (inserted if old_hash is None else updated).append(entry)
+                new_hashes[n_id] = record_hash
+            if updated:
+                self.update_records(updated)
+            if inserted:
+                self.push_to_db(inserted)
+            if new_hashes:
+                hashes = dict(hashes, **new_hashes)
+                self._hashes, self._hashes_stamp = hashes, self.get_stamp()
+                self._hash_index.save(hashes, self.get_DB_size(), self._hashes_stamp)
+        return len(inserted), len(updated), unchanged
+
+    def update_records(self, data_entries):
+        '''
+        Replaces the stored records that have the IDs of the entries, the
+        records keep their positions. The caller holds the write lock.
+
+        Parameters
+        ----------
+            data_entries(list): new content of records already in the db
+        '''
+        raise NotImplementedError
+
+    def replace_records(self, data_records, data_entries):
+        '''
+        Yields the data records with the ones that have the IDs of the
+        entries replaced by them.
+        '''
+        new_records = dict((str(entry.get("id")), entry) for entry in data_entries)
+        for record in data_records:
+            yield new_records.get(str(record.get("id")), record)
+
+    def restamp_index(self):
+        '''
+        Saves the ID index again after the files of the db changed
+        without changing the IDs, eg. after a compaction.
+        '''
+        self._stamp = self.get_stamp()
+        self._id_index.save(self._ids, self._size, self._stamp)
+
+    def load_search_index(self, data_records=None):
+        '''
+        Loads the trigram index of the db. The index is built from the
+        records and saved when it is missing or stale.
+
+        Parameters
+        ----------
+            data_records(list): records of the db if they were already pulled
+
+        Returns
+        -------
+        postings(dict): {field: {trigram: [positions]}}
+        '''
+        if not self.exists():
+            return build_postings([])
+        stamp = self.get_stamp()
+        if self._postings is not None and self._postings_stamp == stamp:
+            return self._postings
+        postings, db_size = self._search_index.load(stamp)
+        if postings is None:
+            if data_records is None:
+                data_records = self.pull_from_db().get("data_records")
+            postings = build_postings(data_records)
+            self._search_index.save(postings, len(data_records), stamp)
+        self._postings, self._postings_stamp = postings, stamp
+        return postings
+
+    def index_search(self, data_entries, old_size, old_stamp, db_size, stamp):
+        '''
+        Appends entries that were just written to the db to the trigram
+        index. Nothing is done if there is no index yet, it will be built
+        by the first search.
+        '''
+        if not os.path.exists(self.get_search_index_path()):
+            return
+        new_postings = build_postings(data_entries, old_size)
+        if not self._search_index.append(new_postings, old_size, old_stamp, db_size, stamp):
+            return
+        if self._postings is not None and self._postings_stamp == old_stamp:
+            merge_postings(self._postings, new_postings)
+            self._postings_stamp = stamp
+
+    def restamp_search_index(self, old_stamp):
+        '''
+        Keeps the trigram and hash indexes fresh after the files of
+        the db changed without changing the records, eg. after a compaction.
+        '''
+        stamp = self.get_stamp()
+        self._search_index.restamp(old_stamp, stamp)
+        if self._postings_stamp == old_stamp:
+            self._postings_stamp = stamp
+        self._hash_index.restamp(old_stamp, stamp)
+        if self._hashes_stamp == old_stamp:
+            self._hashes_stamp = stamp
+
+    def get_search_candidates(self, search_field, search_value, search_mode="contains", data_records=None):
+        '''
+        Looks up the records that may match a search in the trigram index.
+        The candidates still need to be checked with match_value().
+
+        Parameters
+        ----------
+            search_field(str): the field being searched eg. 'name', 'id' etc.
+            search_value(str): the searched word
+            search_mode(str): one of SEARCH_MODES
+            data_records(list): records of the db if they were already pulled
+
+        Returns
+        -------
+        positions(list): positions of the candidates in pull_from_db order,
+                         None if the search is too short to use the index
+        '''
+        trigrams = get_trigrams(get_search_key(search_value, search_mode))
+        if not trigrams:
+            return None
+        field_postings = self.load_search_index(data_records).get(search_field, {})
+        postings = sorted((field_postings.get(trigram, []) for trigram in trigrams), key=len)
+        positions = set(postings[0])
+        for positions_with_trigram in postings[1:]:
+            if not positions:
+                break
+            positions.intersection_update(positions_with_trigram)
+        return sorted(positions)
+
+    def exists(self):
+        return os.path.exists(self._db_path)
+
+    def create_db(self):
+        '''
+        Creates an empty db if one does not exist yet.
+        '''
+        raise NotImplementedError
+
+    def validate(self):
+        '''
+        The db is only parsed if it changed since the ID index was saved:
+        a fresh index means the db was read without errors in that state.
+
+        Returns
+        -------
+        bool: True if the db can be read.
+        '''
+        try:
+            if self.exists() and self._id_index.is_fresh(self.get_stamp()):
+                return True
+            self.get_DB_size()
+        except CorruptDBError:
+            return False
+        return True
+
+    def pull_from_db(self):
+        '''
+        Returns
+        -------
+        existing_data(dict): all data records stored in db,
+                             eg. {"data_records": [...]}
+        '''
+        raise NotImplementedError
+
+    def iter_records(self):
+        '''
+        Yields the data records stored in db one at a time, oldest first.
+        '''
+        yield from self.pull_from_db().get("data_records")
+
+    def push_to_db(self, data_entries):
+        '''
+        Appends new data entries to the db.
+
+        Parameters
+        ----------
+            data_entries(list): list of new data records
+        '''
+        raise NotImplementedError
+
+    def get_records(self, start=0, stop=None):
+        '''
+        Returns a page of the data records, eg. for display.
+
+        Parameters
+        ----------
+            start(int): position of the first record, 0 for the oldest
+            stop(int): position after the last record, None for the end of the db
+
+        Returns
+        -------
+        data_records(list): the records from start up to stop
+        '''
+        return list(itertools.islice(self.iter_records(), start, stop))
+
+    def get_records_at(self, positions):
+        '''
+        Returns the records at some positions, eg. the candidates of a
+        search. The records are streamed up to the last position and
+        only the ones asked for are kept.
+
+        Parameters
+        ----------
+            positions(list): positions of the records in pull_from_db order
+
+        Returns
+        -------
+        data_records(list): the records, in the order of their positions
+        '''
+        positions = set(positions)
+        if not positions:
+            return []
+        data_records = itertools.islice(self.iter_records(), max(positions) + 1)
+        return [record for position, record in enumerate(data_records) if position in positions]
+
+    def get_record(self, n_id):
+        '''
+        Returns
+        -------
+        record(dict): the entry with that ID, None if there is none
+        '''
+        if not self.is_duplicate(n_id):
+            return None
+        for record in self.iter_records():
+            if str(record.get("id")) == str(n_id):
+                return record
+
+    def is_duplicate(self, n_id):
+        '''
+        Returns
+        -------
+        bool: True if the ID matches an existing entry
+        '''
+        return str(n_id) in self.get_ids()
+
+    def get_ids(self):
+        '''
+        Returns
+        -------
+        ids(set): IDs of all the entries stored in db.
+        '''
+        self.load_ids()
+        return self._ids
+
+    def get_existing_ids(self, ids):
+        '''
+        Looks up only the given IDs, so checking a batch for duplicates
+        costs as much as the batch and not the whole db.
+
+        Parameters
+        ----------
+            ids(iterable): IDs of new entries
+
+        Returns
+        -------
+        existing_ids(set): the ones that match an existing entry
+        '''
+        if not self.exists():
+            return set()
+        return set(str(n_id) for n_id in ids) & self.get_ids()
+
+    def get_DB_size(self):
+        '''
+        The count is read from the header of a fresh ID index, the IDs
+        are only loaded if the index is stale.
+
+        Returns
+        -------
+        db_size(int): Number of total entries in the db.
+        '''
+        if self.exists():
+            stamp = self.get_stamp()
+            if self._ids is not None and self._stamp == stamp:
+                return self._size
+            db_size = self._id_index.get_size(stamp)
+            if db_size is not None:
+                return db_size
+        self.load_ids()
+        return self._size
+
+    def get_free_slots(self):
+        '''
+        Returns
+        -------
+        free_slots(int): entries that can still be added, None if there is no limit.
+                         A store has no limit of its own, see DBSession.
+        '''
+        return None
+
+
+class JSONStore(DataStore):
+    """
+    Stores all data records in a single .json file, eg. main.json.
+    Every write rewrites the whole file, new records are appended
+    to a copy of the bytes of the stored ones, see append_db().
+    """
+    rewrites_db = True
+
+    def create_db(self):
+        # readers only get here for a db that exists, they never wait for the lock
+        if self.exists():
+            return
+        with self.write_lock():
+            if not self.exists():
+                self.write_db({"data_records": []})
+
+    def pull_from_db(self):
+        if not self.exists():
+            return {"data_records": []}
+        try:
+            with open(self._db_path) as filehandler:
+                existing_data = json.load(filehandler, object_hook=compact_record)
+        except json.decoder.JSONDecodeError as e:
+            raise CorruptDBError(str(e))
+        return existing_data or {"data_records": []}
+
+    def iter_records(self):
+        if not self.exists():
+            return
+        try:
+            with open(self._db_path) as filehandler:
+                yield from map(compact_record, JSONStreamReader(filehandler).iter_array("data_records"))
+        except json.decoder.JSONDecodeError as e:
+            raise CorruptDBError(str(e))
+
+    def push_to_db(self, data_entries):
+        with self.write_lock():
+            self.load_ids()
+            if not self.append_db(data_entries):
+                existing_data = self.pull_from_db()
+                existing_data.get("data_records").extend(data_entries)
+                self.write_db(existing_data)
+            self.index_entries(data_entries)
+
+    def append_db(self, data_entries):
+        '''
+        Writes the db again with the entries added at the end. The stored
+        records are copied byte for byte instead of being parsed and dumped
+        again, the new file is written and renamed like write_db() does.
+        Only works on a file that ends the way write_db() writes it.
+
+        The copy still writes as many bytes as the db holds on every call,
+        so a commit costs O(size of the db); the group commit of DBSession
+        keeps the number of calls down. The file is not changed in place,
+        because readers do not take the write lock and a crash has to leave
+        a complete db behind, see open_atomic(). A .logdb or .db store only
+        writes the new records.
+
+        Returns
+        -------
+        bool: True if the entries were added, False if the db needs a full rewrite
+        '''
+        if not os.path.exists(self._db_path):
+            return False
+        if not data_entries:
+            return True
+        with open(self._db_path, 'rb') as src_handler:
+            db_size = src_handler.seek(0, os.SEEK_END)
+            src_handler.seek(max(db_size - len(JSON_TAIL), 0))
+            tail = src_handler.read()
+            if tail.endswith(JSON_EMPTY_TAIL):
+                # keep the opening [ of the empty list
+                copy_size, separator = db_size - len(JSON_EMPTY_TAIL) + 1, b"\n"
+            elif tail == JSON_TAIL and db_size > len(JSON_TAIL):
+                copy_size, separator = db_size - len(JSON_TAIL), b",\n"
+            else:
+                return False
+            new_records = ",\n".join(format_json_record(entry) for entry in data_entries)
+            src_handler.seek(0)
+            with open_atomic(self._db_path, 'wb') as filehandler:
+                copy_bytes(src_handler, filehandler, copy_size)
+                filehandler.write(separator + new_records.encode('utf-8') + JSON_TAIL)
+        return True
+
+    def update_records(self, data_entries):
+        with self.write_lock():
+            self.load_ids()
+            existing_data = self.pull_from_db()
+            existing_data["data_records"] = list(self.replace_records(existing_data.get("data_records"), data_entries))
+            self.write_db(existing_data)
+            self.restamp_index()
+
+    def write_db(self, existing_data):
+        with open_atomic(self._db_path) as filehandler:
+            json.dump(existing_data, filehandler, indent=4, default=serialize_record)
+
+
+class SQLiteStore(DataStore):
+    """
+    Stores data records in an sqlite3 database, eg. main.db.
+    sqlite3 is only imported once a .db file is used.
+    The table has a primary key index on the ID and secondary
+    indexes on name, address and phone, so inserts and ID lookups
+    do not depend on the size of the db.
+    """
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS data_records (id TEXT PRIMARY KEY, name TEXT, address TEXT, phone TEXT)",
+        "CREATE INDEX IF NOT EXISTS data_records_name ON data_records (name)",
+        "CREATE INDEX IF NOT EXISTS data_records_address ON data_records (address)",
+        "CREATE INDEX IF NOT EXISTS data_records_phone ON data_records (phone)",
+    ]
+
+    def connect(self):
+        '''
+        Opens a connection to the db and makes sure the schema exists.
+        '''
+        import sqlite3
+        try:
+            connection = sqlite3.connect(self._db_path)
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+        except sqlite3.DatabaseError as e:
+            raise CorruptDBError(str(e))
+        return connection
+
+    def create_db(self):
+        self.connect().close()
+
+    def pull_from_db(self):
+        import sqlite3
+        if not self.exists():
+            return {"data_records": []}
+        connection = self.connect()
+        try:
+            rows = connection.execute("SELECT id, name, address, phone FROM data_records ORDER BY rowid").fetchall()
+        except sqlite3.DatabaseError as e:
+            raise CorruptDBError(str(e))
+        finally:
+            connection.close()
+        return {"data_records": [Record(*row) for row in rows]}
+
+    def iter_records(self):
+        import sqlite3
+        if not self.exists():
+            return
+        connection = self.connect()
+        try:
+            for row in connection.execute("SELECT id, name, address, phone FROM data_records ORDER BY rowid"):
+                yield Record(*row)
+        except sqlite3.DatabaseError as e:
+            raise CorruptDBError(str(e))
+        finally:
+            connection.close()
+
+    def push_to_db(self, data_entries):
+        with self.write_lock():
+            import sqlite3
+            rows = [(str(entry.get("id")), entry.get("name"), entry.get("address"), entry.get("phone")) for entry in data_entries]
+            is_search_indexed = os.path.exists(self.get_search_index_path())
+            if is_search_indexed:
+                old_size, old_stamp = self.get_DB_size(), self.get_stamp()
+            connection = self.connect()
+            try:
+                with connection:
+                    # the ID is unique, entries that conflict are skipped
+                    connection.executemany("INSERT OR IGNORE INTO data_records (id, name, address, phone) VALUES (?, ?, ?, ?)", rows)
+            except sqlite3.DatabaseError as e:
+                raise CorruptDBError(str(e))
+            finally:
+                connection.close()
+            # positions in the search index only line up if no entry was skipped
+            if is_search_indexed and self.get_DB_size() == old_size + len(rows):
+                self.index_search(data_entries, old_size, old_stamp, old_size + len(rows), self.get_stamp())
+
+    def update_records(self, data_entries):
+        import sqlite3
+        rows = [(entry.get("name"), entry.get("address"), entry.get("phone"), str(entry.get("id"))) for entry in data_entries]
+        with self.write_lock():
+            connection = self.connect()
+            try:
+                with connection:
+                    connection.executemany("UPDATE data_records SET name = ?, address = ?, phone = ? WHERE id = ?", rows)
+            except sqlite3.DatabaseError as e:
+                raise CorruptDBError(str(e))
+            finally:
+                connection.close()
+
+    def query(self, statement, parameters=()):
+        import sqlite3
+        if not self.exists():
+            return []
+        connection = self.connect()
+        try:
+            return connection.execute(statement, parameters).fetchall()
+        except sqlite3.DatabaseError as e:
+            raise CorruptDBError(str(e))
+        finally:
+            connection.close()
+
+    def is_duplicate(self, n_id):
+        return bool(self.query("SELECT 1 FROM data_records WHERE id = ?", (str(n_id),)))
+
+    def get_records(self, start=0, stop=None):
+        limit = -1 if stop is None else max(stop - start, 0)
+        rows = self.query("SELECT id, name, address, phone FROM data_records ORDER BY rowid LIMIT ? OFFSET ?", (limit, start))
+        return [Record(*row) for row in rows]
+
+    def get_records_at(self, positions):
+        positions = sorted(set(positions))
+        if not positions:
+            return []
+        # the rowids are 1, 2, ... in pull_from_db order unless records were deleted by hand
+        rows = self.query("SELECT MAX(rowid), COUNT(*) FROM data_records")
+        if not rows or rows[0][0] != rows[0][1]:
+            return super().get_records_at(positions)
+        data_records = []
+        for start in range(0, len(positions), SQLITE_BATCH_SIZE):
+            rowids = [position + 1 for position in positions[start:start + SQLITE_BATCH_SIZE]]
+            rows = self.query("SELECT id, name, address, phone FROM data_records WHERE rowid IN (%s) ORDER BY rowid" % ",".join("?" * len(rowids)), rowids)
+            data_records.extend(Record(*row) for row in rows)
+        return data_records
+
+    def get_record(self, n_id):
+        rows = self.query("SELECT id, name, address, phone FROM data_records WHERE id = ?", (str(n_id),))
+        return Record(*rows[0]) if rows else None
+
+    def get_ids(self):
+        return set(row[0] for row in self.query("SELECT id FROM data_records"))
+
+    def get_existing_ids(self, ids):
+        # looked up through the primary key, SQLITE_BATCH_SIZE IDs per query
+        ids = list(set(str(n_id) for n_id in ids))
+        existing_ids = set()
+        for start in range(0, len(ids), SQLITE_BATCH_SIZE):
+            batch = ids[start:start + SQLITE_BATCH_SIZE]
+            rows = self.query("SELECT id FROM data_records WHERE id IN (%s)" % ",".join("?" * len(batch)), batch)
+            existing_ids.update(row[0] for row in rows)
+        return existing_ids
+
+    def validate(self):
+        try:
+            self.query("SELECT 1 FROM data_records LIMIT 1")
+        except CorruptDBError:
+            return False
+        return True
+
+    def get_DB_size(self):
+        rows = self.query("SELECT COUNT(*) FROM data_records")
+        return rows[0][0] if rows else 0
+
+
+class LogStore(DataStore):
+    """
+    Log-structured store, eg. main.logdb. The db is a folder holding a
+    snapshot (same layout as main.json) and a series of append-only
+    segment files with one json record per line.
+
+    New records are appended to the newest segment and fsynced once per
+    batch, so adding records does not depend on the size of the db.
+    Once a segment grows past SEGMENT_SIZE it is sealed and a background
+    thread folds the sealed segments into the snapshot.
+    """
+    SNAPSHOT_NAME = "snapshot.json"
+    SEGMENT_NAME = "segment-%06d.jsonl"
+    SEGMENT_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self._lock = threading.RLock()
+        self._compaction = None
+
+    def create_db(self):
+        # readers only get here for a db that exists, they never wait for the lock
+        if self.exists():
+            return
+        with self.write_lock():
+            if not self.exists():
+                os.makedirs(self._db_path)
+                self.write_snapshot({"data_records": []}, 0)
+
+    def get_id_index_path(self):
+        return os.path.join(self._db_path, "ids.json")
+
+    def get_search_index_path(self):
+        return os.path.join(self._db_path, "search.json")
+
+    def get_hash_index_path(self):
+        return os.path.join(self._db_path, "hashes.json")
+
+    def get_stamp(self):
+        stamp = []
+        for path in [self.get_snapshot_path()] + [self.get_segment_path(segment) for segment in self.get_segments()]:
+            try:
+                file_stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stamp.append([os.path.basename(path), file_stat.st_mtime_ns, file_stat.st_size])
+        return stamp
+
+    def get_snapshot_path(self):
+        return os.path.join(self._db_path, self.SNAPSHOT_NAME)
+
+    def get_segment_path(self, segment):
+        return os.path.join(self._db_path, self.SEGMENT_NAME % segment)
+
+    def get_segments(self):
+        '''
+        Returns
+        -------
+        segments(list): numbers of all segment files, oldest first.
+        '''
+        segments = []
+        for file_name in os.listdir(self._db_path):
+            if file_name.startswith("segment-") and file_name.endswith(".jsonl"):
+                segments.append(int(file_name[len("segment-"):-len(".jsonl")]))
+        return sorted(segments)
+
+    def read_snapshot(self):
+        '''
+        Returns
+        -------
+        existing_data(dict): data records folded into the snapshot
+        compacted(int): number of the last segment folded into the snapshot
+        '''
+        if not os.path.exists(self.get_snapshot_path()):
+            return {"data_records": []}, 0
+        try:
+            with open(self.get_snapshot_path()) as filehandler:
+                existing_data = json.load(filehandler, object_hook=compact_record) or {"data_records": []}
+        except json.decoder.JSONDecodeError as e:
+            raise CorruptDBError(str(e))
+        compacted = existing_data.pop("compacted_segment", 0)
+        return existing_data, compacted
+
+    def write_snapshot(self, existing_data, compacted):
+        snapshot = {"data_records": existing_data.get("data_records"), "compacted_segment": compacted}
+        with open_atomic(self.get_snapshot_path()) as filehandler:
+            json.dump(snapshot, filehandler, default=serialize_record)
+
+    def read_segment(self, segment):
+        '''
+        Reads all the records of a segment. A last line without a
+        newline is a write that never finished and is ignored.
+        '''
+        with open(self.get_segment_path(segment)) as filehandler:
+            return [compact_record(entry) for entry in self.iter_segment(filehandler)]
+
+    def iter_segment(self, filehandler):
+        for line in filehandler:
+            if not line.endswith("\n"):
+                break
+            try:
+                yield json.loads(line)
+            except json.decoder.JSONDecodeError as e:
+                raise CorruptDBError(str(e))
+
+    def pull_from_db(self):
+        if not self.exists():
+            return {"data_records": []}
+        with self._lock:
+            while True:
+                snapshot_stamp = self.get_snapshot_stamp()
+                existing_data, compacted = self.read_snapshot()
+                try:
+                    for segment in self.get_segments():
+                        if segment > compacted:
+                            existing_data.get("data_records").extend(self.read_segment(segment))
+                except FileNotFoundError:
+                    continue
+                # a compaction replaced the snapshot while we were reading, read again
+                if snapshot_stamp == self.get_snapshot_stamp():
+                    return existing_data
+
+    def iter_records(self):
+        if not self.exists():
+            return
+        # open files stay readable even if a compaction replaces or removes them
+        with self._lock:
+            snapshot_file = open(self.get_snapshot_path()) if os.path.exists(self.get_snapshot_path()) else None
+            segment_files = [(segment, open(self.get_segment_path(segment))) for segment in self.get_segments()]
+        try:
+            compacted = 0
+            if snapshot_file:
+                reader = JSONStreamReader(snapshot_file)
+                yield from map(compact_record, reader.iter_array("data_records"))
+                compacted = reader.get_value("compacted_segment") or 0
+            for segment, filehandler in segment_files:
+                if segment > compacted:
+                    yield from map(compact_record, self.iter_segment(filehandler))
+        except json.decoder.JSONDecodeError as e:
+            raise CorruptDBError(str(e))
+        finally:
+            for filehandler in [snapshot_file] + [filehandler for segment, filehandler in segment_files]:
+                if filehandler:
+                    filehandler.close()
+
+    def get_snapshot_stamp(self):
+        try:
+            snapshot_stat = os.stat(self.get_snapshot_path())
+        except FileNotFoundError:
+            return None
+        return (snapshot_stat.st_ino, snapshot_stat.st_mtime_ns, snapshot_stat.st_size)
+
+    def push_to_db(self, data_entries):
+        self.create_db()
+        with self.write_lock(), self._lock:
+            self.load_ids()
+            existing_data, compacted = self.read_snapshot()
+            segments = [segment for segment in self.get_segments() if segment > compacted]
+            segment = segments[-1] if segments else compacted + 1
+            segment_path = self.get_segment_path(segment)
+            with open(segment_path, 'a+b') as filehandler:
+                self.truncate_partial_line(filehandler)
+                for entry in data_entries:
+                    filehandler.write((json.dumps(entry, default=serialize_record) + "\n").encode('utf-8'))
+                filehandler.flush()
+                os.fsync(filehandler.fileno())
+            self.index_entries(data_entries)
+            if os.path.getsize(segment_path) >= self.SEGMENT_SIZE:
+                self.seal_segment(segment)
+
+    def update_records(self, data_entries):
+        '''
+        Segments cannot be changed in place, so the records are folded
+        into a new snapshot with the updated ones, like a compaction.
+        '''
+        self.wait_for_compaction()
+        with self.write_lock(), self._lock:
+            self.load_ids()
+            compacted = self.read_snapshot()[1]
+            segments = self.get_segments()
+            existing_data = self.pull_from_db()
+            existing_data["data_records"] = list(self.replace_records(existing_data.get("data_records"), data_entries))
+            self.write_snapshot(existing_data, max(segments + [compacted]))
+            for segment in segments:
+                os.remove(self.get_segment_path(segment))
+            self.restamp_index()
+
+    def truncate_partial_line(self, filehandler):
+        '''
+        Drops the unfinished last line left behind by a crash,
+        so that new records start on a line of their own.
+        '''
+        size = filehandler.seek(0, os.SEEK_END)
+        if not size:
+            return
+        filehandler.seek(size - 1)
+        if filehandler.read(1) == b"\n":
+            return
+        filehandler.seek(0)
+        filehandler.truncate(filehandler.read().rfind(b"\n") + 1)
+        filehandler.seek(0, os.SEEK_END)
+
+    def seal_segment(self, segment):
+        '''
+        Starts a new segment for the following writes and folds
+        every segment up to this one into the snapshot in the background.
+        '''
+        self.start_segment(segment + 1)
+        if self._compaction and self._compaction.is_alive():
+            return
+        self._compaction = threading.Thread(target=self.compact, args=(segment,))
+        self._compaction.start()
+
+    def compact(self, last_segment=None):
+        '''
+        Folds the segments into the snapshot.
+
+        Parameters
+        ----------
+            last_segment(int): last segment to fold, by default all of them.
+                               Segments after it are left untouched.
+        '''
+        if not self.exists():
+            return
+        if self._compaction and self._compaction is not threading.current_thread():
+            self.wait_for_compaction()
+        if last_segment is None:
+            with self.write_lock(), self._lock:
+                segments = self.get_segments()
+                last_segment = segments[-1] if segments else 0
+                self.start_segment(last_segment + 1)
+        snapshot_stamp = self.get_snapshot_stamp()
+        existing_data, compacted = self.read_snapshot()
+        folded = [segment for segment in self.get_segments() if compacted < segment <= last_segment]
+        try:
+            for segment in folded:
+                existing_data.get("data_records").extend(self.read_segment(segment))
+        except FileNotFoundError:
+            return
+        with self.write_lock(), self._lock:
+            # another process compacted the segments in the meantime
+            if snapshot_stamp != self.get_snapshot_stamp():
+                return
+            index_is_fresh = self.is_index_fresh()
+            old_stamp = self.get_stamp()
+            self.write_snapshot(existing_data, max(folded + [compacted]))
+            for segment in folded:
+                os.remove(self.get_segment_path(segment))
+            if index_is_fresh:
+                self.restamp_index()
+            self.restamp_search_index(old_stamp)
+
+    def start_segment(self, segment):
+        '''
+        Creates an empty segment that the following writes go to.
+        '''
+        with self.write_lock(), self._lock:
+            index_is_fresh = self.is_index_fresh()
+            old_stamp = self.get_stamp()
+            open(self.get_segment_path(segment), 'a').close()
+            if index_is_fresh:
+                self.restamp_index()
+            self.restamp_search_index(old_stamp)
+
+    def is_index_fresh(self):
+        return self._ids is not None and self._stamp == self.get_stamp()
+
+    def wait_for_compaction(self):
+        if self._compaction:
+            self._compaction.join()
+
+
+COLUMNAR_MAGIC = b"DRC1"
+# 4 byte size of the footer followed by the magic
+COLUMNAR_TRAILER = struct.Struct("<I4s")
+
+
+def write_columns(file_path, data_records, fields=SUPPORTED_RECORDS):
+    '''
+    Writes data records to a columnar .drc file. Each field is stored as
+    its own column: a dictionary of the distinct values of the field and
+    one code per record pointing into that dictionary. Values are stored
+    as text, None as an empty string. The file is laid out as
+
+        magic, then for each column:
+            utf-8 bytes of the dictionary values
+            offsets of the values in those bytes (n_values + 1 integers)
+            codes of the records (1, 2 or 4 bytes each)
+        for the first field only: positions of the records sorted by value
+        footer: json with the count and the position of every section
+        size of the footer (uint32) and magic
+
+    Integers are little endian and every section starts on 8 bytes, so a
+    reader can map the file and only touch the columns it needs, and look
+    up a record by ID with a binary search over the sorted positions. The file
+    is written next to file_path and moved over it once complete.
+
+    Parameters
+    ----------
+        file_path(str): file path of the .drc file
+        data_records(iterable): records to write, read one at a time
+        fields(list): fields stored for each record
+
+    Returns
+    -------
+    count(int): number of records written.
+    '''
+    dictionaries = [{} for field in fields]
+    codes = [array.array("I") for field in fields]
+    count = 0
+    for record in data_records:
+        for field, dictionary, column in zip(fields, dictionaries, codes):
+            value = record.get(field)
+            value = "" if value is None else str(value)
+            code = dictionary.get(value)
+            if code is None:
+                code = dictionary[value] = len(dictionary)
+            column.append(code)
+        count += 1
+
+    with open_atomic(file_path, 'wb') as filehandler:
+        filehandler.write(COLUMNAR_MAGIC)
+
+        def write_section(data):
+            filehandler.write(b"\0" * (-filehandler.tell() % 8))
+            offset = filehandler.tell()
+            filehandler.write(data)
+            return offset
+
+        def to_bytes(values):
+            if sys.byteorder == "big":
+                values = array.array(values.typecode, values)
+                values.byteswap()
+            return values.tobytes()
+
+        columns = []
+        for field, dictionary, column in zip(fields, dictionaries, codes):
+            encoded = [value.encode("utf-8") for value in dictionary]
+            offsets = array.array("I", [0])
+            offsets.extend(itertools.accumulate(map(len, encoded)))
+            width = "B" if len(dictionary) <= 0x100 else "H" if len(dictionary) <= 0x10000 else "I"
+            columns.append({
+                "name": field,
+                "values": len(dictionary),
+                "strings": [write_section(b"".join(encoded)), offsets[-1]],
+                "offsets": write_section(to_bytes(offsets)),
+                "codes": [write_section(to_bytes(array.array(width, column))), width],
+            })
+            if field == fields[0]:
+                values = list(dictionary)
+                keys = [values[code] for code in column]
+                columns[-1]["sorted"] = write_section(to_bytes(array.array("I", sorted(range(count), key=keys.__getitem__))))
+        footer = json.dumps({"count": count, "columns": columns}).encode("utf-8")
+        filehandler.write(footer)
+        filehandler.write(COLUMNAR_TRAILER.pack(len(footer), COLUMNAR_MAGIC))
+    return count
+
+
+class ColumnarFile:
+    """
+    Read-only view of a .drc file written by write_columns(). The file is
+    memory mapped, so only the pages of the columns that are read are
+    loaded. Raises CorruptDBError if the file cannot be read.
+
+    Attributes
+    ----------
+        file_path (str): file path of the .drc file.
+    """
+    def __init__(self, file_path):
+        try:
+            with open(file_path, 'rb') as filehandler:
+                self._data = mmap.mmap(filehandler.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise CorruptDBError("[%s] is empty." % file_path)
+        try:
+            footer_size, magic = COLUMNAR_TRAILER.unpack_from(self._data, len(self._data) - COLUMNAR_TRAILER.size)
+            footer_end = len(self._data) - COLUMNAR_TRAILER.size
+            if magic != COLUMNAR_MAGIC or self._data[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC or footer_size > footer_end:
+                raise ValueError("not a .drc file")
+            footer = json.loads(self._data[footer_end - footer_size:footer_end])
+            self._count = footer["count"]
+            self._columns = dict((column["name"], column) for column in footer["columns"])
+            for column in self._columns.values():
+                strings_offset, strings_size = column["strings"]
+                codes_offset, width = column["codes"]
+                if max(strings_offset + strings_size, column["offsets"] + 4 * (column["values"] + 1),
+                       codes_offset + array.array(width).itemsize * self._count,
+                       column["sorted"] + 4 * self._count if "sorted" in column else 0) > footer_end:
+                    raise ValueError("column [%s] is truncated" % column["name"])
+                column["struct"] = struct.Struct("<" + width)
+        except (ValueError, KeyError, TypeError, struct.error) as e:
+            raise CorruptDBError("[%s] is not a valid .drc file: %s" % (file_path, e))
+
+    def get_count(self):
+        return self._count
+
+    def get_fields(self):
+        return list(self._columns)
+
+    def read_array(self, typecode, offset, length):
+        values = array.array(typecode)
+        values.frombytes(self._data[offset:offset + values.itemsize * length])
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    def get_values(self, field):
+        '''
+        Returns
+        -------
+        values(list): the dictionary of a column, its distinct values
+        '''
+        column = self._columns.get(field)
+        if column is None:
+            raise CorruptDBError("The .drc file has no column [%s]." % field)
+        strings_offset, strings_size = column["strings"]
+        strings = self._data[strings_offset:strings_offset + strings_size]
+        offsets = self.read_array("I", column["offsets"], column["values"] + 1)
+        try:
+            text = strings.decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise CorruptDBError(str(e))
+        if len(text) != len(strings):
+            # byte offsets only line up with the text if it is ascii
+            return [strings[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+        return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def get_value(self, field, position):
+        '''
+        Reads the value of a single record straight from the file, without
+        decoding the rest of the column.
+
+        Parameters
+        ----------
+            field(str): the column, eg. 'name'
+            position(int): position of the record, 0 for the oldest
+        '''
+        column = self._columns.get(field)
+        if column is None:
+            raise CorruptDBError("The .drc file has no column [%s]." % field)
+        codes_offset, width = column["codes"]
+        code_struct = column["struct"]
+        code = code_struct.unpack_from(self._data, codes_offset + code_struct.size * position)[0]
+        if code >= column["values"]:
+            raise CorruptDBError("The column [%s] has a code out of range." % field)
+        start, end = struct.unpack_from("<II", self._data, column["offsets"] + 4 * code)
+        strings_offset = column["strings"][0]
+        try:
+            return self._data[strings_offset + start:strings_offset + end].decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise CorruptDBError(str(e))
+
+    def get_rows(self, start=0, stop=None, fields=SUPPORTED_RECORDS):
+        '''
+        Returns
+        -------
+        rows(list): the (id, name, address, phone) fields of the records
+                    from position start up to stop, read one value at a time
+        '''
+        positions = range(self._count)[start:stop]
+        return [tuple(self.get_value(field, position) for field in fields) for position in positions]
+
+    def find_position(self, value, field=SUPPORTED_RECORDS[0]):
+        '''
+        Looks up a record by the value of the first field, usually the ID,
+        with a binary search over the positions sorted by value.
+
+        Returns
+        -------
+        position(int): position of the first record with that value, None if there is none
+        '''
+        column = self._columns.get(field)
+        if column is None or "sorted" not in column:
+            positions = self.find(field, lambda column_value: column_value == value)
+            return positions[0] if positions else None
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            position = struct.unpack_from("<I", self._data, column["sorted"] + 4 * middle)[0]
+            if self.get_value(field, position) < value:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count:
+            return None
+        position = struct.unpack_from("<I", self._data, column["sorted"] + 4 * low)[0]
+        return position if self.get_value(field, position) == value else None
+
+    def get_codes(self, field):
+        '''
+        Returns
+        -------
+        codes(array): position of the value of each record in the dictionary of a column
+        '''
+        codes_offset, width = self._columns[field]["codes"]
+        return self.read_array(width, codes_offset, self._count)
+
+    def get_column(self, field):
+        values = self.get_values(field)
+        try:
+            return list(map(values.__getitem__, self.get_codes(field)))
+        except IndexError:
+            raise CorruptDBError("The column [%s] has a code out of range." % field)
+
+    def iter_rows(self, fields=SUPPORTED_RECORDS):
+        '''
+        Yields the (id, name, address, phone) fields of every record in
+        order. Only the dictionaries and the codes are kept in memory.
+        '''
+        columns = [map(self.get_values(field).__getitem__, self.get_codes(field)) for field in fields]
+        try:
+            yield from zip(*columns)
+        except IndexError:
+            raise CorruptDBError("A column has a code out of range.")
+
+    def find(self, field, matches):
+        '''
+        Scans a single column. Each distinct value is checked once and the
+        records are then picked by their code.
+
+        Parameters
+        ----------
+            field(str): the column, eg. 'phone'
+            matches(function): called with a value, returns True if it matches
+
+        Returns
+        -------
+        positions(list): positions of the records whose value matches
+        '''
+        mask = bytearray(matches(value) for value in self.get_values(field))
+        if not any(mask):
+            return []
+        try:
+            return list(itertools.compress(range(self._count), map(mask.__getitem__, self.get_codes(field))))
+        except IndexError:
+            raise CorruptDBError("The column [%s] has a code out of range." % field)
+
+
+class ColumnarStore(DataStore):
+    """
+    Stores data records in a columnar binary file, eg. main.drc, see
+    write_columns(). Every write rewrites the whole file like JSONStore
+    does, but a search reads only the column of the searched field
+    instead of a trigram index.
+    """
+    rewrites_db = True
+
+    def create_db(self):
+        # readers only get here for a db that exists, they never wait for the lock
+        if self.exists():
+            return
+        with self.write_lock():
+            if not self.exists():
+                write_columns(self._db_path, [])
+
+    def pull_from_db(self):
+        if not self.exists():
+            return {"data_records": []}
+        return {"data_records": [Record(*row) for row in ColumnarFile(self._db_path).iter_rows()]}
+
+    def iter_records(self):
+        if not self.exists():
+            return
+        for row in ColumnarFile(self._db_path).iter_rows():
+            yield Record(*row)
+
+    def push_to_db(self, data_entries):
+        with self.write_lock():
+            self.load_ids()
+            write_columns(self._db_path, itertools.chain(self.iter_records(), data_entries))
+            self.index_entries(data_entries)
+
+    def update_records(self, data_entries):
+        with self.write_lock():
+            self.load_ids()
+            write_columns(self._db_path, self.replace_records(self.iter_records(), data_entries))
+            self.restamp_index()
+
+    def get_search_candidates(self, search_field, search_value, search_mode="contains", data_records=None):
+        if not self.exists():
+            return []
+        return ColumnarFile(self._db_path).find(search_field, lambda value: match_value(value, search_value, search_mode))
+
+    def get_records(self, start=0, stop=None):
+        if not self.exists():
+            return []
+        return [Record(*row) for row in ColumnarFile(self._db_path).get_rows(start, stop)]
+
+    def get_records_at(self, positions):
+        if not self.exists():
+            return []
+        # the matches of find() are decoded one value at a time, the other records are not read
+        columns_file = ColumnarFile(self._db_path)
+        return [Record(*(columns_file.get_value(field, position) for field in SUPPORTED_RECORDS))
+                for position in sorted(set(positions)) if position < columns_file.get_count()]
+
+    def get_record(self, n_id):
+        if not self.exists():
+            return None
+        columns_file = ColumnarFile(self._db_path)
+        position = columns_file.find_position(str(n_id))
+        return None if position is None else Record(*columns_file.get_rows(position, position + 1)[0])
+
+    def is_duplicate(self, n_id):
+        return self.get_record(n_id) is not None
+
+    def get_DB_size(self):
+        # the count is kept in the footer, the records are not read
+        return ColumnarFile(self._db_path).get_count() if self.exists() else 0
+
+
+def get_store(db_path):
+    '''
+    Returns the storage backend for a db file based on its extension.
+    .db, .sqlite and .sqlite3 files use sqlite3, .logdb folders use
+    the log-structured store, .drc files the columnar store and
+    everything else is stored as json.
+
+    Parameters
+    ----------
+        db_path(str): file path of the db
+    '''
+    if not db_path:
+        return None
+    store_key = os.path.abspath(db_path)
+    if store_key not in STORES:
+        db_name, db_ext = os.path.splitext(db_path)
+        if db_ext.lower() in SQLITE_EXTENSIONS:
+            STORES[store_key] = SQLiteStore(db_path)
+        elif db_ext.lower() in LOG_EXTENSIONS:
+            STORES[store_key] = LogStore(db_path)
+        elif db_ext.lower() in COLUMNAR_EXTENSIONS:
+            STORES[store_key] = ColumnarStore(db_path)
+        else:
+            STORES[store_key] = JSONStore(db_path)
+    return STORES[store_key]
+
+
+class DBSession:
+    """
+    Unit of work over the db of one process. main() creates a single
+    session and passes it to the helpers and to FormatHandler, which use
+    it in place of the store: it answers the same calls.
+
+    The records are pulled from the store at most once. New records are
+    kept in memory as dirty records and written by a single commit().
+    With a flush_size, dirty records are written early once that many
+    pile up, so streamed uploads keep a bounded amount of memory.
+    For a store that rewrites the whole db on every write, the batches
+    are grouped into larger commits, see get_flush_size().
+    Entries of a delta upload are staged apart, see upsert_entries().
+
+    Attributes
+    ----------
+        db_path (str): file path of the db.
+        flush_size (int): dirty records kept before they are written early,
+                          None to only write them on commit()
+        capacity (int): most records the db may hold, None for no limit
+        quota (int): most records this session may add, None for no limit
+    """
+    def __init__(self, db_path, flush_size=None, capacity=None, quota=None):
+        self._store = get_store(db_path)
+        self._flush_size = flush_size
+        self._capacity = capacity
+        self._quota = quota
+        self._added = 0
+        self._data_records = None
+        self._dirty_records = []
+        self._dirty_ids = set()
+        self._conflicts = []
+        self._upserts = {}
+        self._upsert_inserts = 0
+        self._delta_counts = None
+
+    def get_store(self):
+        return self._store
+
+    def get_db_path(self):
+        return self._store.get_db_path()
+
+    def exists(self):
+        return self._store.exists()
+
+    def create_db(self):
+        self._store.create_db()
+
+    def validate(self):
+        return self._store.validate()
+
+    def is_dirty(self):
+        return bool(self._dirty_records or self._upserts)
+
+    def pull_from_db(self):
+        if self._data_records is None:
+            self._data_records = self._store.pull_from_db().get("data_records")
+        return {"data_records": self._data_records + self._dirty_records}
+
+    def iter_records(self):
+        if self._data_records is not None:
+            yield from self._data_records
+        else:
+            yield from self._store.iter_records()
+        yield from list(self._dirty_records)
+
+    def push_to_db(self, data_entries):
+        '''
+        Adds new data entries to the dirty records, they are
+        written to the db by commit().
+        '''
+        self._dirty_records.extend(data_entries)
+        self._dirty_ids.update(str(entry.get("id")) for entry in data_entries)
+        self._added += len(data_entries)
+        if self._flush_size and len(self._dirty_records) >= self.get_flush_size():
+            self.commit()
+
+    def get_flush_size(self):
+        '''
+        Group commit: a store that rewrites the whole db on every write
+        waits for as many dirty records as the db already holds, up to
+        GROUP_COMMIT_SIZE, so an upload costs fewer rewrites of the db
+        while the records kept in memory stay bounded.
+
+        Returns
+        -------
+        flush_size(int): dirty records that trigger an early commit
+        '''
+        if not self._store.rewrites_db:
+            return self._flush_size
+        return max(self._flush_size, min(self._store.get_DB_size(), GROUP_COMMIT_SIZE))
+
+    def commit(self):
+        '''
+        Writes the dirty records to the db in one push. Records whose IDs
+        another process added since they were staged are skipped, see
+        get_conflicts().
+
+        Returns
+        -------
+        committed(int): number of records written.
+        '''
+        committed = self.commit_upserts()
+        dirty_records = self._dirty_records
+        if not dirty_records:
+            return committed
+        pushed, conflicts = self._store.push_new_entries(dirty_records)
+        if self._data_records is not None:
+            if conflicts:
+                # the records of the other process come first, pull them again
+                self._data_records = None
+            else:
+                self._data_records.extend(pushed)
+        self._conflicts.extend(conflicts)
+        self._dirty_records, self._dirty_ids = [], set()
+        return committed + len(pushed)
+
+    def upsert_entries(self, data_entries):
+        '''
+        Stages the entries of a delta upload: the ones whose IDs are new
+        or whose content differs from the stored record, see hash_record().
+        The others are only counted. Of entries with the same ID, the
+        last one is kept. They are written by commit().
+        '''
+        hashes = self._store.get_hashes()
+        counts = self._delta_counts = self._delta_counts or {"inserted": 0, "updated": 0, "unchanged": 0}
+        for entry in data_entries:
+            n_id = str(entry.get("id"))
+            if n_id not in self._upserts:
+                if hashes.get(n_id) == hash_record(entry):
+                    counts["unchanged"] += 1
+                    continue
+                if n_id not in hashes:
+                    self._upsert_inserts += 1
+                    self._added += 1
+            self._upserts[n_id] = entry
+        if self._flush_size and len(self._upserts) >= self.get_flush_size():
+            self.commit()
+
+    def commit_upserts(self):
+        '''
+        Writes the staged entries of a delta upload, see DataStore.upsert_entries().
+
+        Returns
+        -------
+        committed(int): number of records inserted or updated.
+        '''
+        if not self._upserts:
+            return 0
+        inserted, updated, unchanged = self._store.upsert_entries(list(self._upserts.values()))
+        self._delta_counts["inserted"] += inserted
+        self._delta_counts["updated"] += updated
+        self._delta_counts["unchanged"] += unchanged
+        # updated records keep their positions, pull them again
+        self._data_records = None
+        self._upserts, self._upsert_inserts = {}, 0
+        return inserted + updated
+
+    def get_delta_counts(self):
+        '''
+        Returns
+        -------
+        delta_counts(dict): records inserted, updated and left unchanged by
+                            the delta uploads of this session, None if there was none
+        '''
+        return self._delta_counts
+
+    def get_conflicts(self):
+        '''
+        Returns
+        -------
+        conflicts(list): records skipped by commit() because another
+                         process added their IDs first
+        '''
+        return self._conflicts
+
+    def write_lock(self):
+        return self._store.write_lock()
+
+    def is_duplicate(self, n_id):
+        return str(n_id) in self._dirty_ids or self._store.is_duplicate(n_id)
+
+    def get_ids(self):
+        if not self._dirty_ids and not self._upserts:
+            return self._store.get_ids()
+        return self._store.get_ids() | self._dirty_ids | set(self._upserts)
+
+    def get_existing_ids(self, ids):
+        ids = set(str(n_id) for n_id in ids)
+        return self._store.get_existing_ids(ids) | (ids & self._dirty_ids) | ids.intersection(self._upserts)
+
+    def get_DB_size(self):
+        return self._store.get_DB_size() + len(self._dirty_records) + self._upsert_inserts
+
+    def get_free_slots(self):
+        '''
+        Counts the free slots from the size kept by the store,
+        the records are not read.
+
+        Returns
+        -------
+        free_slots(int): entries that can still be added in this session,
+                         None if there is neither a capacity nor a quota
+        '''
+        free_slots = []
+        if self._capacity is not None:
+            free_slots.append(self._capacity - self.get_DB_size())
+        if self._quota is not None:
+            free_slots.append(self._quota - self._added)
+        return max(min(free_slots), 0) if free_slots else None
+
+    def get_records(self, start=0, stop=None):
+        db_size = self._store.get_DB_size()
+        data_records = self._store.get_records(start, stop) if start < db_size else []
+        # dirty records follow the stored ones
+        dirty_start = max(start - db_size, 0)
+        dirty_stop = None if stop is None else max(stop - db_size, 0)
+        return data_records + self._dirty_records[dirty_start:dirty_stop]
+
+    def get_records_at(self, positions):
+        if self._data_records is not None:
+            data_records = self._data_records + self._dirty_records
+            return [data_records[position] for position in sorted(positions) if position < len(data_records)]
+        db_size = self._store.get_DB_size()
+        # dirty records follow the stored ones
+        return self._store.get_records_at([position for position in positions if position < db_size]) + \
+            [self._dirty_records[position - db_size] for position in sorted(positions) if db_size <= position < db_size + len(self._dirty_records)]
+
+    def get_record(self, n_id):
+        if str(n_id) in self._dirty_ids:
+            return next(entry for entry in self._dirty_records if str(entry.get("id")) == str(n_id))
+        return self._store.get_record(n_id)
+
+    def get_search_candidates(self, search_field, search_value, search_mode="contains", data_records=None):
+        if data_records is not None:
+            data_records = data_records[:len(data_records) - len(self._dirty_records)]
+        positions = self._store.get_search_candidates(search_field, search_value, search_mode, data_records)
+        if positions is None or not self._dirty_records:
+            return positions
+        # dirty records are not in the search index yet, they follow the stored ones
+        db_size = self._store.get_DB_size()
+        return positions + list(range(db_size, db_size + len(self._dirty_records)))
+
+
+def migrate_db(src_path, dest_path):
+    '''
+    One-shot migration of all data records from one db to another,
+    eg. from ./main.json to ./main.db. The source db is left untouched.
+
+    Parameters
+    ----------
+        src_path(str): file path of the existing db
+        dest_path(str): file path of the new db
+
+    Returns
+    -------
+    migrated(int): number of records in the new db.
+    '''
+    src_store = get_store(src_path)
+    dest_store = get_store(dest_path)
+    data_records = src_store.pull_from_db().get("data_records")
+    dest_store.create_db()
+    existing_ids = dest_store.get_ids()
+    dest_store.push_to_db([record for record in data_records if str(record.get("id")) not in existing_ids])
+    return dest_store.get_DB_size()
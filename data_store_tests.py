@@ -0,0 +1,378 @@
+import unittest
+import filecmp
+import os
+import json
+import shutil
+import data_store
+from data_store import JSONStore, SQLiteStore, LogStore, ColumnarStore, ColumnarFile, CorruptDBError, Record, SearchIndex, STORES, build_postings, get_store, migrate_db, DBSession, open_atomic, hash_record
+
+TEST_DB_PATH = "test_cases/test_db.json"
+TEST_SQLITE_PATH = "test_cases/test_store.db"
+TEST_JSON_PATH = "test_cases/test_store.json"
+TEST_LOG_PATH = "test_cases/test_store.logdb"
+TEST_COLUMNAR_PATH = "test_cases/test_store.drc"
+# files the stores keep next to a db: ID index, search index, hashes and write lock
+SIDECAR_SUFFIXES = [".ids", ".search", ".hashes", ".lock"]
+
+class TestDataStore(unittest.TestCase):
+    def setUp(self):
+        for db_path in [TEST_SQLITE_PATH, TEST_JSON_PATH, TEST_COLUMNAR_PATH, TEST_LOG_PATH]:
+            for path in [db_path] + [db_path + suffix for suffix in SIDECAR_SUFFIXES]:
+                if os.path.isfile(path):
+                    os.remove(path)
+        if os.path.exists(TEST_LOG_PATH):
+            shutil.rmtree(TEST_LOG_PATH)
+
+    def tearDown(self):
+        self.setUp()
+
+    def test_get_store(self):
+        self.assertIsInstance(get_store("main.json"), JSONStore)
+        self.assertIsInstance(get_store("main.db"), SQLiteStore)
+        self.assertIsInstance(get_store("main.sqlite3"), SQLiteStore)
+        self.assertIsInstance(get_store("main.logdb"), LogStore)
+        self.assertIsInstance(get_store("main.drc"), ColumnarStore)
+        self.assertIsNone(get_store(None))
+
+    def test_json_push_to_db(self):
+        data_entries = [{"id": "43", "name": "John Smith", "address": "123 Highgate Grove Singapore   323244", "phone": "34323434"},
+                        {"id": "23", "name": "Bugs Bunny", "address": "Rabbit Hole London   232323", "phone": "87263162363"}]
+        store = JSONStore(TEST_JSON_PATH)
+        store.create_db()
+        store.push_to_db(data_entries)
+        self.assertEqual(filecmp.cmp(TEST_DB_PATH, TEST_JSON_PATH), True)
+        self.assertEqual(store.get_DB_size(), 2)
+        self.assertEqual(store.is_duplicate("43"), True)
+        self.assertEqual(store.is_duplicate(7), False)
+
+    def test_sqlite_push_to_db(self):
+        data_entries = [{"id": "43", "name": "John Smith", "address": "123 Highgate Grove Singapore   323244", "phone": "34323434"},
+                        {"id": "23", "name": "Bugs Bunny", "address": "Rabbit Hole London   232323", "phone": "87263162363"}]
+        store = SQLiteStore(TEST_SQLITE_PATH)
+        store.create_db()
+        store.push_to_db(data_entries)
+        store.push_to_db([{"id": "43", "name": "Duplicate", "address": "", "phone": ""}])
+        self.assertEqual(store.pull_from_db().get("data_records"), data_entries)
+        self.assertEqual(store.get_DB_size(), 2)
+        self.assertEqual(store.is_duplicate(23), True)
+        self.assertEqual(store.is_duplicate("7"), False)
+        self.assertEqual(store.get_ids(), {"43", "23"})
+
+    def test_sqlite_indexes(self):
+        store = SQLiteStore(TEST_SQLITE_PATH)
+        store.create_db()
+        indexes = [row[0] for row in store.query("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        for field in ["name", "address", "phone"]:
+            self.assertIn("data_records_%s" % field, indexes)
+
+    def test_migrate_db(self):
+        with open(TEST_DB_PATH) as filehandler:
+            data_entries = json.load(filehandler).get("data_records")
+        self.assertEqual(migrate_db(TEST_DB_PATH, TEST_SQLITE_PATH), 2)
+        # migrating twice does not duplicate the entries
+        self.assertEqual(migrate_db(TEST_DB_PATH, TEST_SQLITE_PATH), 2)
+        self.assertEqual(SQLiteStore(TEST_SQLITE_PATH).pull_from_db().get("data_records"), data_entries)
+
+    def test_compact_records(self):
+        data_entries = [{"id": "43", "name": "John Smith", "address": "123 Highgate Grove Singapore   323244", "phone": "34323434"},
+                        {"id": "23", "name": "Bugs Bunny", "address": "Rabbit Hole London   232323", "phone": "87263162363"}]
+        shutil.copy(TEST_DB_PATH, TEST_JSON_PATH)
+        store = JSONStore(TEST_JSON_PATH)
+        data_records = store.pull_from_db().get("data_records")
+        self.assertTrue(all(isinstance(record, Record) for record in data_records))
+        self.assertEqual(data_records, data_entries)
+        self.assertEqual(data_records[0].get("name"), "John Smith")
+        self.assertEqual(list(data_records[1].values()), list(data_entries[1].values()))
+        # records are written back as plain dicts
+        store.push_to_db([])
+        self.assertEqual(filecmp.cmp(TEST_DB_PATH, TEST_JSON_PATH), True)
+
+    def test_validate(self):
+        shutil.copy(TEST_DB_PATH, TEST_JSON_PATH)
+        self.assertEqual(JSONStore(TEST_JSON_PATH).validate(), True)
+        # the ID index is fresh, so the db is not parsed again
+        store = JSONStore(TEST_JSON_PATH)
+        store.pull_from_db = None
+        self.assertEqual(store.validate(), True)
+        with open(TEST_JSON_PATH, "a") as filehandler:
+            filehandler.write("{")
+        self.assertEqual(JSONStore(TEST_JSON_PATH).validate(), False)
+        with open(TEST_SQLITE_PATH, "w") as filehandler:
+            filehandler.write("not an sqlite3 db")
+        self.assertEqual(SQLiteStore(TEST_SQLITE_PATH).validate(), False)
+
+    def test_search_index(self):
+        data_entries = [{"id": "43", "name": "John Smith", "address": "123 Highgate Grove Singapore   323244", "phone": "34323434"},
+                        {"id": "23", "name": "Bugs Bunny", "address": "Rabbit Hole London   232323", "phone": "87263162363"},
+                        {"id": "7", "name": "Johnny Bravo", "address": "Aron City", "phone": "555"}]
+        for path in [TEST_JSON_PATH, TEST_SQLITE_PATH, TEST_LOG_PATH]:
+            store = get_store(path)
+            store.create_db()
+            store.push_to_db(data_entries[:2])
+            self.assertEqual(store.get_search_candidates("name", "joh"), [0])
+            self.assertEqual(store.get_search_candidates("name", "smi", "starts with"), [])
+            self.assertEqual(store.get_search_candidates("name", "smith", "ends with"), [0])
+            self.assertEqual(store.get_search_candidates("name", "jo"), None)
+            # the index on disk is kept up to date by the next push
+            store.push_to_db(data_entries[2:])
+            self.assertEqual(SearchIndex(store.get_search_index_path()).load(store.get_stamp())[0], build_postings(data_entries))
+            self.assertEqual(store.get_search_candidates("name", "joh"), [0, 2])
+            self.assertEqual(store.get_search_candidates("address", "ron", "contains"), [2])
+            STORES.clear()
+
+    def test_iter_records(self):
+        data_entries = [{"id": str(n_id), "name": "Name %s" % n_id, "address": "Street %s" % n_id, "phone": "1234"} for n_id in range(10)]
+        for store in [JSONStore(TEST_JSON_PATH), SQLiteStore(TEST_SQLITE_PATH), LogStore(TEST_LOG_PATH)]:
+            store.create_db()
+            store.push_to_db(data_entries[:5])
+            store.push_to_db(data_entries[5:])
+            self.assertEqual(list(store.iter_records()), data_entries)
+
+    def test_search_records(self):
+        # the records read by a search or a display are compact, like the ones of pull_from_db()
+        data_entries = [{"id": str(n_id), "name": "Name %s" % n_id, "address": "Street %s" % n_id, "phone": "1234"} for n_id in range(10)]
+        for store in [JSONStore(TEST_JSON_PATH), SQLiteStore(TEST_SQLITE_PATH), LogStore(TEST_LOG_PATH), ColumnarStore(TEST_COLUMNAR_PATH)]:
+            store.create_db()
+            store.push_to_db(data_entries)
+            for search_value in ["e 7", "7"]:
+                positions = store.get_search_candidates("name", search_value)
+                data_records = store.iter_records() if positions is None else store.get_records_at(positions)
+                found_entries = [record for record in data_records if data_store.match_value(record.get("name"), search_value, "contains")]
+                self.assertEqual(found_entries, data_entries[7:8], type(store).__name__)
+                self.assertEqual([type(record) for record in found_entries], [Record], type(store).__name__)
+            self.assertEqual(set(type(record) for record in store.iter_records()), {Record}, type(store).__name__)
+
+    def test_id_index(self):
+        data_entries = [{"id": "43", "name": "John Smith", "address": "123 Highgate Grove Singapore   323244", "phone": "34323434"},
+                        {"id": "23", "name": "Bugs Bunny", "address": "Rabbit Hole London   232323", "phone": "87263162363"}]
+        store = JSONStore(TEST_JSON_PATH)
+        store.create_db()
+        store.push_to_db(data_entries)
+        self.assertEqual(os.path.exists(TEST_JSON_PATH + ".ids"), True)
+        # a new process trusts the sidecar index without parsing the db
+        store = JSONStore(TEST_JSON_PATH)
+        store.pull_from_db = None
+        self.assertEqual(store.get_ids(), {"43", "23"})
+        self.assertEqual(store.get_DB_size(), 2)
+
+    def test_stale_id_index(self):
+        store = JSONStore(TEST_JSON_PATH)
+        store.create_db()
+        store.push_to_db([{"id": "43", "name": "John Smith", "address": "", "phone": ""}])
+        self.assertEqual(store.is_duplicate("43"), True)
+        # the db is edited behind the index
+        with open(TEST_JSON_PATH, 'w') as filehandler:
+            json.dump({"data_records": [{"id": "7", "name": "Edited", "address": "", "phone": ""}]}, filehandler, indent=4)
+        self.assertEqual(store.is_duplicate("43"), False)
+        self.assertEqual(JSONStore(TEST_JSON_PATH).is_duplicate("7"), True)
+
+    def test_log_push_to_db(self):
+        data_entries = [{"id": str(n_id), "name": "Name %s" % n_id, "address": "Street %s" % n_id, "phone": "1234"} for n_id in range(10)]
+        store = LogStore(TEST_LOG_PATH)
+        store.push_to_db(data_entries[:4])
+        store.push_to_db(data_entries[4:])
+        self.assertEqual(store.get_segments(), [1])
+        self.assertEqual(store.pull_from_db().get("data_records"), data_entries)
+        self.assertEqual(store.is_duplicate("7"), True)
+
+    def test_log_compaction(self):
+        data_entries = [{"id": str(n_id), "name": "Name %s" % n_id, "address": "Street %s" % n_id, "phone": "1234"} for n_id in range(10)]
+        store = LogStore(TEST_LOG_PATH)
+        store.SEGMENT_SIZE = 200
+        for entry in data_entries:
+            store.push_to_db([entry])
+        store.wait_for_compaction()
+        self.assertEqual(store.pull_from_db().get("data_records"), data_entries)
+        store.compact()
+        self.assertEqual(list(store.iter_records()), data_entries)
+        self.assertEqual(len(store.get_segments()), 1)
+        self.assertEqual(store.read_snapshot()[0].get("data_records"), data_entries)
+        self.assertEqual(store.pull_from_db().get("data_records"), data_entries)
+
+    def test_log_partial_write(self):
+        data_entries = [{"id": "43", "name": "John Smith", "address": "123 Highgate Grove Singapore   323244", "phone": "34323434"},
+                        {"id": "23", "name": "Bugs Bunny", "address": "Rabbit Hole London   232323", "phone": "87263162363"}]
+        store = LogStore(TEST_LOG_PATH)
+        store.push_to_db(data_entries[:1])
+        # simulate a crash in the middle of writing a record
+        with open(store.get_segment_path(1), 'a') as filehandler:
+            filehandler.write('{"id": "99", "na')
+        self.assertEqual(store.pull_from_db().get("data_records"), data_entries[:1])
+        store.push_to_db(data_entries[1:])
+        self.assertEqual(store.pull_from_db().get("data_records"), data_entries)
+
+    def test_columnar_store(self):
+        data_entries = [{"id": "43", "name": "John Smith", "address": "123 Highgate Grove Singapore   323244", "phone": "34323434"},
+                        {"id": "23", "name": "Bugs Bunny", "address": "Rabbit Hole London   232323", "phone": "87263162363"}]
+        store = ColumnarStore(TEST_COLUMNAR_PATH)
+        store.create_db()
+        store.push_to_db(data_entries[:1])
+        store.push_to_db(data_entries[1:] + [{"id": "7", "name": "Anne Ric\u00e9", "address": "Rabbit Hole London   232323", "phone": None}])
+        self.assertEqual(store.pull_from_db().get("data_records")[:2], data_entries)
+        self.assertEqual(list(store.iter_records())[2], {"id": "7", "name": "Anne Ric\u00e9", "address": "Rabbit Hole London   232323", "phone": ""})
+        self.assertEqual(store.is_duplicate("23"), True)
+        # the addresses share one dictionary value, a search only reads its column
+        columns_file = ColumnarFile(TEST_COLUMNAR_PATH)
+        self.assertEqual(len(columns_file.get_values("address")), 2)
+        self.assertEqual(columns_file.get_column("name"), ["John Smith", "Bugs Bunny", "Anne Ric\u00e9"])
+        self.assertEqual(store.get_search_candidates("address", "rabbit", "starts with"), [1, 2])
+        self.assertEqual(store.get_search_candidates("name", "\u00e9", "ends with"), [2])
+        with open(TEST_COLUMNAR_PATH, "r+b") as filehandler:
+            filehandler.truncate(40)
+        self.assertRaises(CorruptDBError, store.pull_from_db)
+
+    def test_get_records(self):
+        data_entries = [{"id": str(n_id), "name": "Name %s" % n_id, "address": "", "phone": str(n_id * 7)} for n_id in [5, 3, 9, 1]]
+        for store in [JSONStore(TEST_JSON_PATH), SQLiteStore(TEST_SQLITE_PATH), ColumnarStore(TEST_COLUMNAR_PATH)]:
+            store.create_db()
+            store.push_to_db(data_entries)
+            self.assertEqual(store.get_records(1, 3), data_entries[1:3])
+            self.assertEqual(store.get_records(2), data_entries[2:])
+            self.assertEqual(store.get_record("9"), data_entries[2])
+            self.assertIsNone(store.get_record("4"))
+        # the ids are found by a binary search in a .drc file
+        self.assertEqual(ColumnarFile(TEST_COLUMNAR_PATH).find_position("1"), 3)
+        self.assertIsNone(ColumnarFile(TEST_COLUMNAR_PATH).find_position("10"))
+        session = DBSession(TEST_JSON_PATH)
+        session.push_to_db([{"id": "4", "name": "Dirty", "address": "", "phone": ""}])
+        self.assertEqual([record.get("id") for record in session.get_records(3, 5)], ["1", "4"])
+        self.assertEqual(session.get_record("4").get("name"), "Dirty")
+        # the candidates of a search are read by their positions
+        for store in [JSONStore(TEST_JSON_PATH), SQLiteStore(TEST_SQLITE_PATH), LogStore(TEST_LOG_PATH), ColumnarStore(TEST_COLUMNAR_PATH)]:
+            store.create_db()
+            if not store.get_DB_size():
+                store.push_to_db(data_entries)
+            self.assertEqual(store.get_records_at([3, 0, 2]), [data_entries[0], data_entries[2], data_entries[3]])
+            self.assertEqual(store.get_records_at([]), [])
+        self.assertEqual([record.get("id") for record in session.get_records_at([4, 1])], ["3", "4"])
+
+    def test_free_slots(self):
+        shutil.copy(TEST_DB_PATH, TEST_JSON_PATH)
+        store = JSONStore(TEST_JSON_PATH)
+        self.assertEqual(store.get_DB_size(), 2)
+        self.assertIsNone(store.get_free_slots())
+        # a fresh ID index gives the count without loading the IDs
+        self.assertEqual(JSONStore(TEST_JSON_PATH).get_DB_size(), 2)
+        session = DBSession(TEST_JSON_PATH, capacity=5, quota=2)
+        self.assertEqual(session.get_free_slots(), 2)
+        session.push_to_db([{"id": "7", "name": "Anne Rice", "address": "", "phone": ""}])
+        self.assertEqual(session.get_free_slots(), 1)
+        self.assertEqual(DBSession(TEST_JSON_PATH, capacity=2).get_free_slots(), 0)
+        self.assertIsNone(DBSession(TEST_JSON_PATH).get_free_slots())
+
+    def test_db_session(self):
+        shutil.copy(TEST_DB_PATH, TEST_JSON_PATH)
+        session = DBSession(TEST_JSON_PATH)
+        self.assertEqual(len(session.pull_from_db().get("data_records")), 2)
+        session.push_to_db([{"id": "7", "name": "Anne Rice", "address": "23 Vampire Ave", "phone": "666"}])
+        # staged records are seen by the session but not written yet
+        self.assertEqual(session.is_duplicate("7"), True)
+        self.assertEqual(session.get_DB_size(), 3)
+        self.assertEqual(session.get_search_candidates("name", "anne"), [2])
+        self.assertEqual(JSONStore(TEST_JSON_PATH).get_DB_size(), 2)
+        self.assertEqual(session.commit(), 1)
+        self.assertEqual(session.commit(), 0)
+        self.assertEqual(JSONStore(TEST_JSON_PATH).get_DB_size(), 3)
+        self.assertEqual(len(session.pull_from_db().get("data_records")), 3)
+        # with a flush size, dirty records are written once enough pile up,
+        # as many as the db holds for a store that rewrites the whole db
+        session = DBSession(TEST_JSON_PATH, flush_size=1)
+        self.assertEqual(session.get_flush_size(), 3)
+        session.push_to_db([{"id": "8", "name": "Lestat", "address": "", "phone": ""}])
+        session.push_to_db([{"id": "9", "name": "Louis", "address": "", "phone": ""}])
+        self.assertEqual(session.is_dirty(), True)
+        session.push_to_db([{"id": "10", "name": "Claudia", "address": "", "phone": ""}])
+        self.assertEqual(session.is_dirty(), False)
+        self.assertEqual(JSONStore(TEST_JSON_PATH).get_DB_size(), 6)
+        self.assertEqual(session.get_flush_size(), 6)
+        self.assertEqual(DBSession(TEST_SQLITE_PATH, flush_size=1).get_flush_size(), 1)
+        # the group never grows past GROUP_COMMIT_SIZE, however large the db
+        group_commit_size = data_store.GROUP_COMMIT_SIZE
+        data_store.GROUP_COMMIT_SIZE = 4
+        try:
+            self.assertEqual(session.get_flush_size(), 4)
+        finally:
+            data_store.GROUP_COMMIT_SIZE = group_commit_size
+
+    def test_json_append(self):
+        data_entries = [{"id": "1", "name": "Anne Rice", "address": "23 Vampire Ave", "phone": "666"},
+                        {"id": "2", "name": "Bugs Bunny", "address": "Rabbit Hole", "phone": None}]
+        store = JSONStore(TEST_JSON_PATH)
+        store.create_db()
+        store.push_to_db(data_entries[:1])
+        store.push_to_db([Record(*data_entries[1].values())])
+        # the records are appended byte for byte the way write_db() lays them out
+        with open(TEST_JSON_PATH) as filehandler:
+            self.assertEqual(filehandler.read(), json.dumps({"data_records": data_entries}, indent=4))
+        # a db laid out some other way is rewritten
+        with open(TEST_JSON_PATH, "w") as filehandler:
+            json.dump({"data_records": data_entries}, filehandler)
+        store.push_to_db([{"id": "3", "name": "John Smith", "address": "", "phone": ""}])
+        self.assertEqual([record.get("id") for record in JSONStore(TEST_JSON_PATH).pull_from_db().get("data_records")], ["1", "2", "3"])
+
+    def test_atomic_write(self):
+        shutil.copy(TEST_DB_PATH, TEST_JSON_PATH)
+        with open(TEST_JSON_PATH) as filehandler:
+            old_data = filehandler.read()
+        # a write that fails half way, eg. on Ctrl-C, leaves the old db and no temporary file
+        with self.assertRaises(KeyboardInterrupt):
+            with open_atomic(TEST_JSON_PATH) as filehandler:
+                filehandler.write('{"data_records": [')
+                raise KeyboardInterrupt()
+        with open(TEST_JSON_PATH) as filehandler:
+            self.assertEqual(filehandler.read(), old_data)
+        self.assertEqual(os.path.exists(TEST_JSON_PATH + ".tmp"), False)
+        store = JSONStore(TEST_JSON_PATH)
+        store.push_to_db([{"id": "7", "name": "Anne Rice", "address": "23 Vampire Ave", "phone": "666"}])
+        self.assertEqual(len(store.pull_from_db().get("data_records")), 3)
+        self.assertEqual(os.path.exists(TEST_JSON_PATH + ".tmp"), False)
+
+    def test_existing_ids(self):
+        for db_path in [TEST_JSON_PATH, TEST_SQLITE_PATH, TEST_LOG_PATH, TEST_COLUMNAR_PATH]:
+            session = DBSession(db_path)
+            self.assertEqual(session.get_existing_ids(["1"]), set())
+            session.create_db()
+            session.get_store().push_to_db([{"id": "1", "name": "Anne Rice", "address": "23 Vampire Ave", "phone": "666"}])
+            session.push_to_db([{"id": "2", "name": "Bugs Bunny", "address": "Rabbit Hole", "phone": "232323"}])
+            # only the IDs asked for are looked up, staged entries included
+            self.assertEqual(session.get_existing_ids(["1", 2, "3"]), set(["1", "2"]))
+            self.assertEqual(session.get_store().get_existing_ids(["1", "2"]), set(["1"]))
+
+    def test_upsert_entries(self):
+        data_entries = [{"id": "1", "name": "Anne Rice", "address": "23 Vampire Ave", "phone": "666"},
+                        {"id": "2", "name": "Bugs Bunny", "address": "Rabbit Hole", "phone": "232323"}]
+        new_entries = [{"id": "1", "name": "Anne Rice", "address": "23 Vampire Ave", "phone": 666},
+                       {"id": "2", "name": "Bugs Bunny", "address": "Carrot Field", "phone": "232323"},
+                       {"id": "3", "name": "John Smith", "address": "Highgate Grove", "phone": "34323434"}]
+        # only the type differs, the content is the same
+        self.assertEqual(hash_record(data_entries[0]), hash_record(new_entries[0]))
+        for store in [JSONStore(TEST_JSON_PATH), SQLiteStore(TEST_SQLITE_PATH), LogStore(TEST_LOG_PATH), ColumnarStore(TEST_COLUMNAR_PATH)]:
+            self.assertEqual(store.upsert_entries(data_entries), (2, 0, 0))
+            self.assertEqual(store.upsert_entries(new_entries), (1, 1, 1))
+            self.assertEqual(store.upsert_entries(new_entries), (0, 0, 3))
+            # the updated record keeps its position
+            self.assertEqual([(record.get("id"), record.get("address")) for record in store.pull_from_db().get("data_records")],
+                             [("1", "23 Vampire Ave"), ("2", "Carrot Field"), ("3", "Highgate Grove")])
+            self.assertEqual(store.get_DB_size(), 3)
+            self.assertEqual([record.get("id") for record in store.get_records()], ["1", "2", "3"])
+            # the hashes are saved next to the db and rebuilt if it changes behind our back
+            self.assertEqual(os.path.exists(store.get_hash_index_path()), True)
+            self.assertEqual(type(store)(store.get_db_path()).get_hashes(), store.get_hashes())
+            store.push_to_db([{"id": "4", "name": "Dan Brown", "address": "9 Code St", "phone": "789"}])
+            self.assertEqual(store.get_hashes()["4"], hash_record({"id": "4", "name": "Dan Brown", "address": "9 Code St", "phone": "789"}))
+
+    def test_session_upsert_entries(self):
+        session = DBSession(TEST_JSON_PATH, flush_size=2)
+        session.upsert_entries([{"id": "1", "name": "Anne Rice", "address": "23 Vampire Ave", "phone": "666"}])
+        self.assertEqual((session.is_dirty(), session.get_DB_size()), (True, 1))
+        session.upsert_entries([{"id": "2", "name": "Bugs Bunny", "address": "Rabbit Hole", "phone": "232323"},
+                                {"id": "1", "name": "Anne Rice", "address": "24 Vampire Ave", "phone": "666"}])
+        # flushed once two IDs are staged, the last entry of an ID wins
+        self.assertEqual(session.is_dirty(), False)
+        session.upsert_entries([{"id": "1", "name": "Anne Rice", "address": "24 Vampire Ave", "phone": "666"},
+                                {"id": "2", "name": "Bugs Bunny", "address": "Carrot Field", "phone": "232323"}])
+        self.assertEqual(session.commit(), 1)
+        self.assertEqual(session.get_delta_counts(), {"inserted": 2, "updated": 1, "unchanged": 1})
+        self.assertEqual([record.get("address") for record in session.pull_from_db().get("data_records")], ["24 Vampire Ave", "Carrot Field"])
+
+unittest.main(verbosity=2)
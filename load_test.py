@@ -0,0 +1,110 @@
+# [2022] This is a library for Data Recorder.
+# Developer: Su Sengupta
+# Test: load_test.py
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import time
+
+from data_store import get_store, Record
+
+BACKENDS = [".db", ".drc", ".logdb", ".json"]
+UPLOAD_RECORDS = 10000
+
+
+def create_db(db_path, total_records):
+    '''
+    Creates a db with total_records records through its storage backend,
+    and builds its ID index like the first command on it would.
+
+    Returns
+    -------
+    elapsed(float): wall time in seconds
+    '''
+    start = time.perf_counter()
+    store = get_store(db_path)
+    store.create_db()
+    store.push_to_db([Record(str(n_id), "Name %s" % n_id, "%s Data Ave" % n_id, str(n_id * 7))
+                      for n_id in range(total_records)])
+    store.get_DB_size()
+    if hasattr(store, "wait_for_compaction"):
+        store.wait_for_compaction()
+    return time.perf_counter() - start
+
+
+def create_upload(file_path, first_id, total_records):
+    with open(file_path, "w") as filehandler:
+        filehandler.write("id,name,address,phone\n")
+        for n_id in range(first_id, first_id + total_records):
+            filehandler.write("%s,Name %s,%s Data Ave,%s\n" % (n_id, n_id, n_id, n_id * 7))
+
+
+def get_commands(work_dir, total_records, run):
+    '''
+    Returns
+    -------
+    commands(dict): arguments of each command that is timed, with the stdin it is
+                    given. Every run adds and uploads records with new IDs.
+    '''
+    add_id = total_records * 2 + run
+    upload_path = os.path.join(work_dir, "upload-%s.csv" % run)
+    create_upload(upload_path, total_records * 3 + run * UPLOAD_RECORDS, UPLOAD_RECORDS)
+    return {
+        "count": (["display", "text", "--page", "1", "--limit", "10"], None),
+        "add": (["add", "--from-stdin", "--output", "json"], json.dumps({"id": str(add_id), "name": "Anne Rice", "address": "23 Vampire Ave", "phone": "666"}) + "\n"),
+        "search": (["search", "--field", "phone", "--value", str((total_records // 2) * 7), "--mode", "starts with", "--output", "json"], None),
+        "upload %sk" % (UPLOAD_RECORDS // 1000): (["upload", "--src", upload_path], None),
+    }
+
+
+def run_command(script, db_path, args, stdin):
+    '''
+    Runs data_recorder.py once.
+
+    Returns
+    -------
+    elapsed(float): wall time in seconds
+    '''
+    command = [sys.executable, script, "--no-banner", "--db", db_path] + args
+    start = time.perf_counter()
+    result = subprocess.run(command, input=stdin, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        print (result.stderr, file=sys.stderr)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times add, search and upload on a large db for every storage backend.")
+    parser.add_argument("--records", type=int, default=1000000, help="number of records in the db (default: 1000000)")
+    parser.add_argument("--runs", type=int, default=3, help="runs of each command, the first one also builds the indexes (default: 3)")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="extensions of the dbs to time (default: %s)" % ",".join(BACKENDS))
+    args = parser.parse_args()
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_recorder.py")
+    work_dir = tempfile.mkdtemp(prefix="data_recorder_load_")
+    try:
+        print ("%-8s %-12s %12s %12s" % ("db", "command", "first (ms)", "median (ms)"))
+        for backend in args.backends.split(","):
+            db_path = os.path.join(work_dir, "main" + backend)
+            print ("%-8s %-12s %12.1f" % (backend, "create", create_db(db_path, args.records) * 1000))
+            timings = {}
+            for run in range(args.runs):
+                for name, (command_args, stdin) in get_commands(work_dir, args.records, run).items():
+                    timings.setdefault(name, []).append(run_command(script, db_path, command_args, stdin))
+            for name, elapsed in timings.items():
+                median = statistics.median(elapsed[1:]) * 1000 if len(elapsed) > 1 else float("nan")
+                print ("%-8s %-12s %12.1f %12.1f" % (backend, name, elapsed[0] * 1000, median))
+            print ("%-8s %-12s %12s" % (backend, "records", get_store(db_path).get_DB_size()))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# [2022] This is a library for Data Recorder.
+# Developer: Su Sengupta
+# Test: startup_benchmark.py
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import time
+
+# modules that are expensive to import and only needed by some commands
+HEAVY_MODULES = ["yaml", "bs4", "jinja2", "tabulate", "xml.etree.ElementTree", "asyncio", "sqlite3"]
+
+
+def get_commands(work_dir):
+    '''
+    Returns
+    -------
+    commands(dict): arguments of each subcommand that is timed,
+                    with the stdin it is given
+    '''
+    upload_path = os.path.join(work_dir, "upload.csv")
+    return {
+        "info": (["info"], None),
+        "display text": (["display", "text"], None),
+        "display html": (["display", "html"], None),
+        "search": (["search", "--field", "name", "--value", "name 1", "--output", "json"], None),
+        "add": (["add", "--from-stdin"], '{"id": "1000000001", "name": "Anne Rice", "address": "23 Vampire Ave", "phone": "666"}\n'),
+        "upload": (["upload", "--src", upload_path], None),
+        "download": (["download", "--dest", os.path.join(work_dir, "download.csv")], None),
+        "convert": (["convert", "--src", upload_path, "--dest", os.path.join(work_dir, "convert.yaml")], None),
+    }
+
+
+def create_files(work_dir, total_records):
+    '''
+    Creates a db with total_records records and a small .csv file to upload.
+    '''
+    data_records = [{"id": str(n_id), "name": "Name %s" % n_id, "address": "%s Data Ave" % n_id, "phone": str(n_id * 7)}
+                    for n_id in range(total_records)]
+    with open(os.path.join(work_dir, "main.json"), "w") as filehandler:
+        json.dump({"data_records": data_records}, filehandler, indent=4)
+    with open(os.path.join(work_dir, "upload.csv"), "w") as filehandler:
+        filehandler.write("id,name,address,phone\n")
+        for n_id in range(total_records, total_records + 10):
+            filehandler.write("%s,Name %s,%s Data Ave,%s\n" % (n_id, n_id, n_id, n_id * 7))
+
+
+def run_command(script, work_dir, args, stdin, import_time=False):
+    '''
+    Runs data_recorder.py once.
+
+    Returns
+    -------
+    elapsed(float): wall time in seconds
+    stderr(str): what the command wrote to stderr
+    '''
+    command = [sys.executable] + (["-X", "importtime"] if import_time else []) + [script, "--no-banner", "--db", "main.json"] + args
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=work_dir, input=stdin, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    return elapsed, result.stderr
+
+
+def get_imported_modules(stderr):
+    '''
+    Returns
+    -------
+    modules(set): modules listed by python -X importtime
+    '''
+    modules = set()
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the startup of every data_recorder.py subcommand.")
+    parser.add_argument("--repo", default=os.path.dirname(os.path.abspath(__file__)), help="checkout of data recorder to time, eg. an older revision")
+    parser.add_argument("--records", type=int, default=1000, help="number of records in the db (default: 1000)")
+    parser.add_argument("--runs", type=int, default=5, help="runs of each subcommand (default: 5)")
+    args = parser.parse_args()
+
+    script = os.path.join(os.path.abspath(args.repo), "data_recorder.py")
+    work_dir = tempfile.mkdtemp(prefix="data_recorder_startup_")
+    try:
+        create_files(work_dir, args.records)
+        print ("%-14s %12s   %s" % ("command", "median (ms)", "heavy modules imported"))
+        for name, (command_args, stdin) in get_commands(work_dir).items():
+            timings = [run_command(script, work_dir, command_args, stdin)[0] for run in range(args.runs)]
+            modules = get_imported_modules(run_command(script, work_dir, command_args, stdin, import_time=True)[1])
+            heavy_modules = [module for module in HEAVY_MODULES if module in modules]
+            print ("%-14s %12.1f   %s" % (name, statistics.median(timings) * 1000, ", ".join(heavy_modules) or "-"))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()